@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""
+Benchmarks for simple_tools.remember.
+Run from this directory:  python remember_benchmark.py [serializers|journal] [options]
+"""
+from argparse import ArgumentParser
+from os import listdir
+from os.path import getsize, join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from simple_tools.remember import Memory, SERIALIZERS
+
+
+def dataset(megabytes: float) -> dict:
+    """
+    Make a dict of about megabytes of repr() text:  str keys to short lists of an int, a float, a str and a bool.
+    """
+    entry = len(repr({'key0000000': [0, 0.5, 'value 0000000', True]})) - 2
+    return {f'key{i:07}': [i, i * .5, f'value {i:07}', not i % 2] for i in range(int(megabytes * 1e6 / entry))}
+
+
+def bench_serializers(sizes: List[float], serializers: List[str], repr_up_to: float):
+    """
+    Time Memory.remember() and Memory.recall() per serializer on datasets of the given sizes (MB of repr text).
+    """
+    print(f'{"MB":>8}{"serializer":>12}{"remember s":>12}{"recall s":>10}{"file MB":>10}')
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            data = dataset(size)
+            for name in serializers:
+                if name == 'repr' and size > repr_up_to:
+                    print(f'{size:>8}{name:>12}{"-":>12}{"-":>10}{"-":>10}')
+                    continue
+                path = join(directory, f'{name}-{size}')
+                memory = Memory({}, None, serializer = name)
+                memory.set_memories(data)
+                memory.target(path, False)  # the document does not exist yet:  recall() writes it
+                memory.set_memories(data)
+                began = perf_counter()
+                memory.remember()
+                remembered = perf_counter() - began
+                memory.set_memories({})
+                began = perf_counter()
+                memory.recall()
+                recalled = perf_counter() - began
+                assert memory.get_memories() == data
+                memory.de_target(False)
+                print(f'{size:>8}{name:>12}{remembered:>12.3f}{recalled:>10.3f}{getsize(path) / 1e6:>10.1f}')
+
+
+def bench_journal(sizes: List[float], serializers: List[str], updates: int, journal_limit: int):
+    """
+    Time updates small updates to a dataset, each followed by Memory.remember(), rewriting the document every time or
+    journaling; then the recall() of the result.
+    """
+    print(f'{"MB":>8}{"serializer":>12}{"mode":>9}{"ms/save":>10}{"recall s":>10}{"files MB":>10}')
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            data = dataset(size)
+            for name in serializers:
+                for journal in (False, True):
+                    path = join(directory, f'{name}-{size}-{journal}')
+                    memory = Memory({}, None, serializer = name, journal = journal, journal_limit = journal_limit)
+                    memory.set_memories(data)
+                    memory.target(path, False)
+                    memory.set_memories(data)
+                    memory.remember()
+                    began = perf_counter()
+                    for i in range(updates):
+                        memory.set_item(f'update{i % 100}', [i, i * .5, f'value {i}', True])
+                        memory.remember()
+                    saving = (perf_counter() - began) / updates
+                    expected = dict(memory.get_memories())
+                    memory.de_target(True)
+                    memory = Memory({}, None, serializer = name, journal = journal)
+                    began = perf_counter()
+                    memory.target(path, False)
+                    recalled = perf_counter() - began
+                    assert memory.get_memories() == expected
+                    memory.de_target(False)
+                    files = sum(getsize(join(directory, f)) for f in listdir(directory) if f.startswith(f'{name}-{size}-{journal}'))
+                    print(f'{size:>8}{name:>12}{"journal" if journal else "rewrite":>9}{saving * 1e3:>10.3f}'
+                          f'{recalled:>10.3f}{files / 1e6:>10.1f}')
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'serializers': lambda a: bench_serializers(a.sizes, a.serializers, a.repr_up_to),
+    'journal': lambda a: bench_journal(a.sizes, [s for s in a.serializers if s != 'repr' or max(a.sizes) <= a.repr_up_to],
+                                       a.updates, a.journal_limit),
+}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description = __doc__)
+    parser.add_argument('name', nargs = '?', choices = sorted(BENCHMARKS), default = 'serializers')
+    parser.add_argument('--sizes', type = float, nargs = '+', default = [1, 100], help = 'MB of repr text')
+    parser.add_argument('--serializers', nargs = '+', choices = sorted(SERIALIZERS), default = list(SERIALIZERS))
+    parser.add_argument('--repr-up-to', type = float, default = 10., help = 'MB beyond which repr (eval) is skipped')
+    parser.add_argument('--updates', type = int, default = 200)
+    parser.add_argument('--journal-limit', type = int, default = 1 << 20, help = 'bytes of journal that start a compaction')
+    arguments = parser.parse_args()
+    BENCHMARKS[arguments.name](arguments)
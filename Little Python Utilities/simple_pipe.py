@@ -1,10 +1,21 @@
 #!/usr/bin/python3
+import asyncio
+import lzma
+import zlib
 from collections import namedtuple
-from ctypes import c_bool, c_uint
+from ctypes import c_bool, c_uint, c_ulonglong
 from io import BytesIO
 from itertools import cycle
-from multiprocessing import Event, Lock, Pipe, Process, Value
-from typing import Callable, Generator, Tuple, Union
+from multiprocessing import Event, Lock, Pipe, Process, RLock, Value
+from multiprocessing.shared_memory import SharedMemory
+from os import dup, fstat, getpid
+from socket import socket
+from stat import S_ISSOCK
+from sys import platform
+from threading import Lock as ThreadLock, Timer
+from struct import Struct, error as StructError
+from time import perf_counter
+from typing import Any, Callable, Dict, Generator, List, Sequence, Tuple, Union
 
 
 def p_value(v_type, *i_value, lock: Union[Lock, bool] = False) -> Value:
@@ -215,6 +226,8 @@ def ppc_pair() -> PPC_PAIR_T:
 S_NONE = Union[str, None]
 P_RECEIVER_TYPE = Generator[S_NONE, None, None]
 CP_SENDER_TYPE = Callable[[S_NONE], bool]
+PAYLOAD = Union[str, bytes, bytearray, memoryview, List[tuple], Any]  # Any:  an object with the buffer protocol
+PIPE_TEXT, PIPE_BYTES, PIPE_RECORDS = 'text', 'bytes', 'records'  # SimplePipe modes
 
 
 class ConnectionTicket:
@@ -224,15 +237,29 @@ class ConnectionTicket:
 
     def __init__(self):
         self._lock = Lock()
-        self._id_connection_current = p_value(c_uint, 0, lock = Lock())
+        self._id_connection_current = p_value(c_uint, 0, lock = RLock())  # next_idc() reads it under its lock
         self._id_connection_self = 0
 
     def __enter__(self):
-        self._lock.__enter__()
-        self._id_connection_current.value = self._id_connection_self
+        self.acquire()
 
     def __exit__(self, *blah):
-        self._lock.__exit__(*blah)
+        self.release()
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        """
+        Take the connection for this seat, as the with statement does, but optionally without waiting.
+        :param blocking: wait for the connection
+        :param timeout: seconds to wait at most, None for no limit
+        :return: bool taken
+        """
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._id_connection_current.value = self._id_connection_self
+        return True
+
+    def release(self):
+        self._lock.release()
 
     @property
     def seat(self) -> int:
@@ -249,6 +276,68 @@ class ConnectionTicket:
             return ni
 
 
+CHUNK_CEILING = 32_000_000  # about the largest message Pipe() takes
+
+
+class ChunkSizeTuner:
+    """
+    Pick the chunk size of a SimplePipe sender from measured throughput.
+    The size doubles while a full chunk is sent faster (bytes per second) than the best so far by tolerance,
+    then falls back to the best size.  A failed send halves the size and caps it there.
+    """
+    _size: int
+    _best_size: int
+    _best_rate: float
+    _ceiling: int
+    _tolerance: float
+    _growing: bool
+
+    def __init__(self, start: int, ceiling: int = CHUNK_CEILING, tolerance: float = .1):
+        self._ceiling = max(1, ceiling)
+        self._size = self._best_size = min(max(1, start), self._ceiling)
+        self._best_rate = 0.
+        self._tolerance = tolerance
+        self._growing = True
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def growing(self) -> bool:
+        return self._growing
+
+    def sent(self, size: int, seconds: float):
+        """
+        Account for a chunk of size bytes sent in seconds.
+        :param size: bytes
+        :param seconds: float
+        :return:
+        """
+        if not self._growing or size != self._size or seconds <= 0:
+            return  # only full chunks of the size on trial count
+        rate = size / seconds
+        if rate > self._best_rate * (1 + self._tolerance):
+            self._best_rate = rate
+            self._best_size = size
+            if size < self._ceiling:
+                self._size = min(size << 1, self._ceiling)
+                return
+        self._size = self._best_size
+        self._growing = False
+
+    def failed(self) -> bool:
+        """
+        Account for a chunk that could not be sent:  halve the size and never exceed it again.
+        :return: bool whether a smaller size is left to try
+        """
+        self._growing = False
+        if self._size <= 1:
+            return False
+        self._ceiling = self._size = self._best_size = self._size >> 1
+        return True
+
+
 sp_error_state = namedtuple('sp_error_state', ('error_memory_sender', 'error_sending_sender', 'error_memory_receiver', 'error_sending_receiver'))
 
 
@@ -270,9 +359,29 @@ class SimplePipe:
     _chunk_size_start: int
     _encoding: str
     _connection_ticket: ConnectionTicket
-
-    def __init__(self, chunk_size_start: int = 10_000, encoding: str = 'UTF-8'):
+    _window: int  # chunks in flight at most; 1 is stop-and-wait
+    _message_length: Value  # bytes in the current message (windowed mode)
+    _acknowledged: Value  # chunks of the current message the receiver has taken (windowed mode)
+    _chunk_size: Value  # the sender's current chunk size (windowed mode)
+    _mode: str
+    _record: Union[Struct, None]
+
+    def __init__(self, chunk_size_start: int = 10_000, encoding: str = 'UTF-8', window: int = 1,
+                 mode: str = PIPE_TEXT, record: Struct = None):
+        """
+        :param chunk_size_start: bytes per chunk to begin with
+        :param encoding: text encoding
+        :param window: natural number of chunks that may be in flight unacknowledged; above 1 chunks are
+            acknowledged by sequence number and their size is tuned from the measured throughput
+        :param mode: PIPE_TEXT (str), PIPE_BYTES (bytes-like in, bytearray out, never encoded) or PIPE_RECORDS
+            (a list of tuples in and out, packed back to back with record); the last two are always windowed
+        :param record: the struct.Struct of one record, for PIPE_RECORDS
+        """
         self._pipe_receive, self._pipe_send = Pipe(True)
+        if mode not in (PIPE_TEXT, PIPE_BYTES, PIPE_RECORDS):
+            raise ValueError(f'Unknown mode {mode!r}.')
+        if (mode == PIPE_RECORDS) != (record is not None):
+            raise ValueError('A record Struct goes with PIPE_RECORDS, and only with it.')
         self._initiate_exchange = ppc_pair()
         self._sent_chunk = Event()
         self._got_chunk = Event()
@@ -287,16 +396,22 @@ class SimplePipe:
         self._chunk_size_start = chunk_size_start  # ~32MillionBytes Pipe() limit
         self._encoding = encoding
         self._connection_ticket = ConnectionTicket()  # connection facilitation
+        self._window = max(1, window)
+        self._message_length = p_value(c_ulonglong, 0)
+        self._acknowledged = p_value(c_uint, 0)
+        self._chunk_size = p_value(c_uint, chunk_size_start)
+        self._mode = mode
+        self._record = record
 
     def init_sender(self):
-        def sender(i: S_NONE) -> bool:
+        def sender(i: PAYLOAD) -> bool:
             return sender_g.send(i)
 
         self._sender_c = sender
-        next(sender_g := self._send_data())  # I <3 WALRUS OPERATOR!
+        next(sender_g := (self._send_windowed() if self.windowed else self._send_data()))  # I <3 WALRUS OPERATOR!
 
     def init_receiver(self):
-        self._receiver_g = rg = self._receive_data()
+        self._receiver_g = rg = self._receive_windowed() if self.windowed else self._receive_data()
         next(rg)  # # pre-initialization
 
     def __del__(self):
@@ -319,6 +434,44 @@ class SimplePipe:
     def set_id(self) -> int:
         return self._connection_ticket.next_idc()
 
+    async def open_async_sender(self) -> 'AsyncPipeWriter':
+        """
+        Make an asyncio writer on the sending connection, for the running event loop.
+        Both ends of a pipe must be async (see open_async_receiver()); they do not mix with sender/receiver.
+        Where the connection is not a socket the loop can watch (see async_streams), every write takes a thread
+        of the loop's default executor instead.
+        :return: AsyncPipeWriter
+        """
+        if not self.async_streams:
+            return AsyncPipeWriter(self, None, self._pipe_send)
+        _, writer = await asyncio.open_connection(sock = socket(fileno = dup(self._pipe_send.fileno())))
+        return AsyncPipeWriter(self, writer)
+
+    async def open_async_receiver(self) -> 'AsyncPipeReader':
+        """
+        Make an asyncio reader on the receiving connection, for the running event loop.
+        Where the connection is not a socket the loop can watch (see async_streams), every read takes a thread
+        of the loop's default executor instead.
+        :return: AsyncPipeReader
+        """
+        if not self.async_streams:
+            return AsyncPipeReader(self, None, None, self._pipe_receive)
+        reader, writer = await asyncio.open_connection(sock = socket(fileno = dup(self._pipe_receive.fileno())))
+        return AsyncPipeReader(self, reader, writer)
+
+    @property
+    def async_streams(self) -> bool:
+        """
+        Whether the connections are sockets an event loop can watch, as Pipe() makes them on POSIX.
+        On Windows they are named pipes, which the async ends reach through run_in_executor() instead.
+        """
+        if platform == 'win32':
+            return False
+        try:
+            return all(S_ISSOCK(fstat(pipe.fileno()).st_mode) for pipe in (self._pipe_send, self._pipe_receive))
+        except (OSError, ValueError):  # closed
+            return False
+
     def _send_data(self) -> Generator[bool, S_NONE, None]:  # SENT SENDER SENDS!
         p_send = self._pipe_send
         sent_chunk = self._sent_chunk
@@ -412,8 +565,9 @@ class SimplePipe:
                         aggregator.write(p_receive.recv_bytes())
                     except (MemoryError, EOFError, IOError) as read_error:
                         switch_on_error(read_error)
+                was_last = last_chunk.value  # read before the sender may go on to the last chunk
                 got_chunk.set()
-                if last_chunk.value:
+                if was_last:
                     break
             try:
                 place = aggregator.tell()
@@ -424,10 +578,167 @@ class SimplePipe:
                 yield ''
             aggregator.seek(0)
 
+    def _to_wire(self, data: PAYLOAD) -> Union[bytes, memoryview]:
+        """ Turn a message into the bytes to send, copying only in PIPE_TEXT and PIPE_RECORDS modes. """
+        if self._mode == PIPE_BYTES:
+            return memoryview(data).cast('B')  # TypeError if it is not C-contiguous
+        if self._mode == PIPE_RECORDS:
+            record = self._record
+            packed = bytearray(record.size * len(data))
+            for place, fields in enumerate(data):
+                record.pack_into(packed, place * record.size, *fields)
+            return packed
+        return str.encode(data, self._encoding)
+
+    def _from_wire(self, b_data: Union[bytes, bytearray]) -> PAYLOAD:
+        """ Turn the bytes received back into a message. """
+        if self._mode == PIPE_BYTES:
+            return b_data
+        if self._mode == PIPE_RECORDS:
+            return list(self._record.iter_unpack(b_data))
+        return b_data.decode(self._encoding)
+
+    def _empty(self) -> PAYLOAD:
+        return bytearray() if self._mode == PIPE_BYTES else [] if self._mode == PIPE_RECORDS else ''
+
+    def _send_windowed(self) -> Generator[bool, PAYLOAD, None]:
+        """ Like _send_data(), but up to window chunks go unacknowledged; an empty chunk aborts a message. """
+        p_send = self._pipe_send
+        got_chunk = self._got_chunk
+        sent_a_none = self._sent_a_none
+        fast_error = self._fast_error
+        memory_error = self._e_memory_error_sender
+        sending_failure = self._e_sending_failure_sender
+        message_length = self._message_length
+        acknowledged = self._acknowledged
+        shared_chunk_size = self._chunk_size
+        window = self._window
+        to_wire = self._to_wire
+        tuner = ChunkSizeTuner(self._chunk_size_start)
+        initiate_exchange = GeneratePPCExchange.send_sync(*self._initiate_exchange)
+
+        def switch_on_error(trip_this: Exception):
+            (memory_error if isinstance(trip_this, MemoryError) else sending_failure).value = fast_error.value = True
+
+        while True:
+            data_to_send = (yield fast_error.value)
+            sent_a_none.value = din = data_to_send is None
+            initiate_exchange()  # Loop start
+            memory_error.value = sending_failure.value = fast_error.value = False  # clear error flags
+            if din:
+                continue
+            b_data = b''
+            try:
+                b_data = to_wire(data_to_send)
+            except (MemoryError, UnicodeEncodeError, TypeError, ValueError, StructError) as encoding_error:
+                switch_on_error(encoding_error)
+            bd_length = message_length.value = b_data.nbytes if isinstance(b_data, memoryview) else len(b_data)
+            acknowledged.value = 0
+            initiate_exchange()  # Load string
+            if fast_error.value:
+                continue
+            bd_index = sequence = 0
+            while bd_index < bd_length:
+                while sequence - acknowledged.value >= window:  # window full
+                    got_chunk.clear()
+                    if sequence - acknowledged.value >= window:
+                        got_chunk.wait(.01)
+                chunk_size = min(tuner.size, bd_length - bd_index)
+                try:
+                    began = perf_counter()
+                    p_send.send_bytes(b_data, bd_index, chunk_size)
+                    tuner.sent(chunk_size, perf_counter() - began)
+                except (ValueError, MemoryError) as send_error:
+                    switch_on_error(send_error)
+                    if tuner.failed():
+                        continue  # the same bytes again, smaller
+                    try:
+                        p_send.send_bytes(b'')  # give up on this message
+                    except (ValueError, MemoryError, OSError):
+                        pass
+                    break
+                bd_index += chunk_size
+                sequence += 1
+            shared_chunk_size.value = tuner.size
+
+    def _receive_windowed(self) -> P_RECEIVER_TYPE:
+        """
+        The receiving side of _send_windowed():  acknowledge every chunk by counting it.
+        The message length is known up front, so the chunks are read straight into one buffer.
+        """
+        p_receive = self._pipe_receive
+        got_chunk = self._got_chunk
+        sent_a_none = self._sent_a_none
+        fast_error = self._fast_error
+        memory_error = self._e_memory_error_receiver
+        sending_failure = self._e_sending_failure_receiver
+        message_length = self._message_length
+        acknowledged = self._acknowledged
+        from_wire = self._from_wire
+        initiate_exchange = GeneratePPCExchange.receive_sync(*self._initiate_exchange)
+
+        def switch_on_error(trip_this: Exception):
+            (memory_error if isinstance(trip_this, MemoryError) else sending_failure).value = fast_error.value = True
+
+        yield  # pre-initialization
+        while True:
+            initiate_exchange()  # Loop start
+            memory_error.value = sending_failure.value = False  # clear error flags
+            if sent_a_none.value:
+                yield None
+                continue
+            initiate_exchange()  # Load string
+            if fast_error.value:
+                continue
+            try:
+                b_data = bytearray(message_length.value)
+            except MemoryError as memory_failure:
+                switch_on_error(memory_failure)
+                b_data = bytearray()
+            view = memoryview(b_data)
+            place = 0
+            while place < len(b_data):
+                try:
+                    got = p_receive.recv_bytes_into(view[place:])
+                except (MemoryError, EOFError, IOError) as read_error:
+                    switch_on_error(read_error)
+                    break
+                if not got:  # the sender gave up
+                    break
+                place += got
+                acknowledged.value += 1
+                got_chunk.set()
+            view.release()
+            if place < len(b_data):
+                del b_data[place:]
+            try:
+                yield from_wire(b_data)
+            except (MemoryError, UnicodeDecodeError, StructError) as decode_error:
+                switch_on_error(decode_error)
+                yield self._empty()
+
     @property
     def text_encoding(self) -> str:
         return self._encoding
 
+    @property
+    def window(self) -> int:
+        return self._window
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def windowed(self) -> bool:
+        """ Whether messages go through _send_windowed() (length first, chunks acknowledged by number). """
+        return self._window > 1 or self._mode != PIPE_TEXT
+
+    @property
+    def chunk_size(self) -> int:
+        """ The chunk size the windowed sender tuned to, as of its last message. """
+        return self._chunk_size.value
+
     @property
     def memory_error_sender(self) -> bool:
         return self._e_memory_error_sender.value
@@ -466,6 +777,624 @@ class SimplePipe:
         return ''.join(('T' if x else 'F') for x in self.ask_error_state())
 
 
+RING_COUNTER = Struct('Q')  # head (bytes ever written) and tail (bytes ever read) of a RingPipe
+RING_HEAD, RING_TAIL, RING_SENDER_WAITS, RING_RECEIVER_WAITS, RING_DATA = 0, 8, 16, 17, 64  # header offsets
+RING_NONE = (1 << 64) - 1  # length announcing a None
+
+
+class RingPipe:
+    """
+    One-way transport through a ring buffer in shared memory, for one sending and one receiving process.
+    A message is its length then its bytes, copied straight into the ring; messages larger than the ring
+    stream through it.  The only synchronization is the head and tail counters in the ring itself:
+    an Event is only set when the other side has said it is waiting (and waits are bounded anyway).
+    Same interface as SimplePipe (init_sender()/sender, init_receiver()/receiver); bytes go through write()/read().
+    """
+    _memory: SharedMemory
+    _capacity: int
+    _encoding: str
+    _owner: int  # pid of the process that unlinks the memory
+    _data_ready: Event
+    _space_ready: Event
+    _head: int  # the sender's own copy
+    _tail: int  # the receiver's own copy
+    _receiver_g: Union[P_RECEIVER_TYPE, None]
+    _sender_c: Union[CP_SENDER_TYPE, None]
+
+    def __init__(self, capacity: int = 1 << 22, encoding: str = 'UTF-8'):
+        self._memory = SharedMemory(create = True, size = RING_DATA + capacity)
+        self._memory.buf[:RING_DATA] = bytes(RING_DATA)
+        self._capacity = capacity
+        self._encoding = encoding
+        self._owner = getpid()
+        self._data_ready = Event()
+        self._space_ready = Event()
+        self._head = self._tail = 0
+        self._receiver_g = self._sender_c = None
+
+    def __getstate__(self) -> tuple:
+        return self._memory.name, self._capacity, self._encoding, self._data_ready, self._space_ready
+
+    def __setstate__(self, state: tuple):
+        name, self._capacity, self._encoding, self._data_ready, self._space_ready = state
+        self._memory = SharedMemory(name)
+        self._owner = 0
+        self._head = RING_COUNTER.unpack_from(self._memory.buf, RING_HEAD)[0]
+        self._tail = RING_COUNTER.unpack_from(self._memory.buf, RING_TAIL)[0]
+        self._receiver_g = self._sender_c = None
+
+    def close(self):
+        if self._memory is not None:
+            self._memory.close()
+            if self._owner == getpid():  # not in a forked child
+                self._memory.unlink()
+            self._memory = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def text_encoding(self) -> str:
+        return self._encoding
+
+    def _wait(self, flag: int, ready: Event, settled: Callable[[], bool]):
+        buf = self._memory.buf
+        buf[flag] = 1
+        if not settled():  # look again now that the other side knows to signal
+            ready.wait(.01)
+        ready.clear()
+        buf[flag] = 0
+
+    def _put(self, view: memoryview):  # SENDER
+        buf = self._memory.buf
+        capacity = self._capacity
+        done, size = 0, len(view)
+        while done < size:
+            head = self._head
+            free = capacity - (head - RING_COUNTER.unpack_from(buf, RING_TAIL)[0])
+            if not free:
+                self._wait(RING_SENDER_WAITS, self._space_ready,
+                           lambda: RING_COUNTER.unpack_from(buf, RING_TAIL)[0] + capacity > head)
+                continue
+            count = min(free, size - done)
+            position = head % capacity
+            first = min(count, capacity - position)
+            buf[RING_DATA + position:RING_DATA + position + first] = view[done:done + first]
+            if count > first:
+                buf[RING_DATA:RING_DATA + count - first] = view[done + first:done + count]
+            done += count
+            self._head = head + count
+            RING_COUNTER.pack_into(buf, RING_HEAD, self._head)
+            if buf[RING_RECEIVER_WAITS]:
+                self._data_ready.set()
+
+    def _take(self, view: memoryview):  # RECEIVER
+        buf = self._memory.buf
+        capacity = self._capacity
+        done, size = 0, len(view)
+        while done < size:
+            tail = self._tail
+            available = RING_COUNTER.unpack_from(buf, RING_HEAD)[0] - tail
+            if not available:
+                self._wait(RING_RECEIVER_WAITS, self._data_ready,
+                           lambda: RING_COUNTER.unpack_from(buf, RING_HEAD)[0] > tail)
+                continue
+            count = min(available, size - done)
+            position = tail % capacity
+            first = min(count, capacity - position)
+            view[done:done + first] = buf[RING_DATA + position:RING_DATA + position + first]
+            if count > first:
+                view[done + first:done + count] = buf[RING_DATA:RING_DATA + count - first]
+            done += count
+            self._tail = tail + count
+            RING_COUNTER.pack_into(buf, RING_TAIL, self._tail)
+            if buf[RING_SENDER_WAITS]:
+                self._space_ready.set()
+
+    def write(self, data) -> None:
+        """ Send bytes or any buffer (None is delivered as None). """
+        if data is None:
+            self._put(memoryview(RING_COUNTER.pack(RING_NONE)))
+            return
+        view = memoryview(data).cast('B')
+        self._put(memoryview(RING_COUNTER.pack(view.nbytes)))
+        self._put(view)
+
+    def read(self) -> Union[bytearray, None]:
+        """ Receive the bytes of the next message, or None. """
+        length = bytearray(RING_COUNTER.size)
+        self._take(memoryview(length))
+        if (size := RING_COUNTER.unpack(length)[0]) == RING_NONE:
+            return None
+        data = bytearray(size)
+        self._take(memoryview(data))
+        return data
+
+    def init_sender(self):
+        def sender(i: S_NONE) -> bool:
+            if i is None:
+                self.write(None)
+                return False
+            try:
+                self.write(str.encode(i, self._encoding))
+            except (MemoryError, UnicodeEncodeError):
+                return True
+            return False
+
+        self._sender_c = sender
+
+    def init_receiver(self):
+        def receive_data() -> P_RECEIVER_TYPE:
+            while True:
+                data = self.read()
+                yield None if data is None else data.decode(self._encoding)
+
+        self._receiver_g = receive_data()
+
+    @property
+    def receiver(self) -> P_RECEIVER_TYPE:
+        return self._receiver_g
+
+    @property
+    def sender(self) -> CP_SENDER_TYPE:
+        return self._sender_c
+
+
+class BusProducer:
+    """
+    The sending end of a MessageBus in one producer process; see MessageBus.producer().
+    """
+    _pipes: List[SimplePipe]
+    _topics: Dict[str, List[int]]
+    _everyone: List[int]
+    _turn: int
+    _sent: int
+    _detours: int
+
+    def __init__(self, pipes: List[SimplePipe], topics: Dict[str, List[int]], seat: int):
+        self._pipes = pipes
+        self._topics = topics
+        self._everyone = list(range(len(pipes)))
+        self._turn = seat  # producers start their rounds on different consumers
+        self._sent = self._detours = 0
+        for pipe in pipes:
+            pipe.set_id()
+            pipe.init_sender()
+
+    def send(self, message: PAYLOAD, topic: str = None) -> bool:
+        """
+        Send a message to the next consumer in turn, of the topic's pool if a topic is given.
+        A consumer taken by another producer is skipped; only if all of the pool are taken is the turn awaited.
+        :param message: as the pipes' mode takes, not None
+        :param topic: a topic the bus was made with, or None for every consumer
+        :return: bool error, as SimplePipe senders return
+        """
+        pool = self._everyone if topic is None else self._topics[topic]
+        turn = self._turn
+        for step in range(len(pool)):
+            pipe = self._pipes[pool[(turn + step) % len(pool)]]
+            if pipe.connection_locker.acquire(False):
+                self._detours += step
+                self._turn = turn + step + 1
+                break
+        else:
+            pipe = self._pipes[pool[turn % len(pool)]]
+            pipe.connection_locker.acquire()
+            self._detours += len(pool)
+            self._turn = turn + 1
+        try:
+            error = pipe.sender(message)
+        finally:
+            pipe.connection_locker.release()
+        self._sent += 1
+        return error
+
+    @property
+    def sent(self) -> int:
+        return self._sent
+
+    @property
+    def detours(self) -> int:
+        """ Consumers skipped because another producer was sending to them. """
+        return self._detours
+
+
+class MessageBus:
+    """
+    Fan-in/fan-out over SimplePipes:  any number of producer processes, one pipe per consumer process.
+    Each pipe has its own ConnectionTicket, so producers only wait for each other when they pick the same
+    consumer, and they pick another one if it is taken.  Messages go round-robin to every consumer, or to the
+    pool of a topic.  Make the bus before starting the processes; call producer() in each producer process,
+    consumer(index) in each consumer process, and close() once every producer is done.
+    """
+    _pipes: List[SimplePipe]
+    _topics: Dict[str, List[int]]
+    _seats: ConnectionTicket
+
+    def __init__(self, consumers: int, topics: Dict[str, Sequence[int]] = None, **pipe_options):
+        """
+        :param consumers: natural number of consumer processes
+        :param topics: topic -> the consumer indices serving it, or None for round-robin only
+        :param pipe_options: SimplePipe() arguments (window, mode, record, ...)
+        """
+        if consumers < 1:
+            raise ValueError('A bus needs a consumer.')
+        self._topics = {topic: list(pool) for topic, pool in (topics or {}).items()}
+        for topic, pool in self._topics.items():
+            if not pool or not all(0 <= index < consumers for index in pool):
+                raise ValueError(f'Topic {topic!r} needs consumers among 0..{consumers - 1}.')
+        self._pipes = [SimplePipe(**pipe_options) for _ in range(consumers)]
+        self._seats = ConnectionTicket()
+
+    @property
+    def consumers(self) -> int:
+        return len(self._pipes)
+
+    @property
+    def topics(self) -> Dict[str, List[int]]:
+        return self._topics
+
+    def producer(self) -> BusProducer:
+        """
+        Make the sending end for the calling process.
+        :return: BusProducer
+        """
+        return BusProducer(self._pipes, self._topics, self._seats.next_idc())
+
+    def consumer(self, index: int) -> P_RECEIVER_TYPE:
+        """
+        Make the receiving end of consumer index for the calling process:  a generator of messages,
+        yielding None once the bus is closed.
+        :param index: 0..consumers - 1
+        :return: generator
+        """
+        (pipe := self._pipes[index]).init_receiver()
+        return pipe.receiver
+
+    def close(self):
+        """
+        Tell every consumer that no more messages come (each receives None).  Call it after the producers are done.
+        :return:
+        """
+        for pipe in self._pipes:
+            pipe.init_sender()
+            with pipe.connection_locker:
+                pipe.sender(None)
+
+
+FRAME_SIZE = Struct('!i')  # the length before every message of a multiprocessing Connection
+FRAME_LARGE_SIZE = Struct('!Q')  # after a length of -1, for messages of 2 GiB and more
+FRAME_MESSAGE, FRAME_NONE = b'\x00', b'\x01'  # the first byte of an async message
+
+
+class AsyncPipeWriter:
+    """
+    The asyncio sending end of a SimplePipe:  every message is one Connection message (a tag byte, then the
+    message as the pipe's mode turns it into bytes), written by the event loop with no Events involved.
+    Without a StreamWriter (see SimplePipe.async_streams), each message is sent on the connection from a thread of
+    the loop's default executor; the wire is the same.
+    """
+    _pipe: SimplePipe
+    _writer: Union[asyncio.StreamWriter, None]
+    _connection: Any  # the pipe's Connection, when there is no StreamWriter
+
+    def __init__(self, pipe: SimplePipe, writer: Union[asyncio.StreamWriter, None], connection: Any = None):
+        self._pipe = pipe
+        self._writer = writer
+        self._connection = connection
+
+    async def write(self, message: PAYLOAD) -> bool:
+        """
+        Send a message, or None to end the stream, waiting while the connection is full.
+        :param message: as the pipe's mode takes, or None
+        :return: bool error, as SimplePipe senders return
+        """
+        if message is None:
+            tag, b_data = FRAME_NONE, b''
+        else:
+            try:
+                tag, b_data = FRAME_MESSAGE, self._pipe._to_wire(message)
+            except (MemoryError, UnicodeEncodeError, TypeError, ValueError, StructError):
+                return True
+        if (writer := self._writer) is None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._connection.send_bytes, tag + b_data)
+            except (ValueError, OSError):
+                return True
+            return False
+        length = 1 + (b_data.nbytes if isinstance(b_data, memoryview) else len(b_data))
+        if length > 0x7fffffff:
+            writer.write(FRAME_SIZE.pack(-1) + FRAME_LARGE_SIZE.pack(length) + tag)
+        else:
+            writer.write(FRAME_SIZE.pack(length) + tag)
+        if len(b_data):
+            writer.write(b_data)
+        try:
+            await writer.drain()
+        except (ConnectionError, OSError):
+            return True
+        return False
+
+    async def close(self):
+        """
+        Stop writing; the pipe's own connection stays open.
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class AsyncPipeReader:
+    """
+    The asyncio receiving end of a SimplePipe.  read() returns each message (bytes in PIPE_BYTES mode), or None
+    at the end of the stream; "async for" goes through the messages until then.
+    Without a StreamReader (see SimplePipe.async_streams), each message is received from a thread of the loop's
+    default executor, which a cancelled read() leaves blocked until the next message arrives.
+    """
+    _pipe: SimplePipe
+    _reader: Union[asyncio.StreamReader, None]
+    _writer: Union[asyncio.StreamWriter, None]  # only held to close the socket
+    _connection: Any  # the pipe's Connection, when there is no StreamReader
+
+    def __init__(self, pipe: SimplePipe, reader: Union[asyncio.StreamReader, None],
+                 writer: Union[asyncio.StreamWriter, None], connection: Any = None):
+        self._pipe = pipe
+        self._reader = reader
+        self._writer = writer
+        self._connection = connection
+
+    async def read(self) -> PAYLOAD:
+        """
+        Wait for the next message.
+        :return: the message, or None once the stream ended (or the connection closed)
+        """
+        if (reader := self._reader) is None:
+            try:
+                frame = await asyncio.get_running_loop().run_in_executor(None, self._connection.recv_bytes)
+            except (EOFError, OSError):
+                return None
+            if frame[:1] == FRAME_NONE:
+                return None
+            b_data = frame[1:]
+        else:
+            try:
+                length, = FRAME_SIZE.unpack(await reader.readexactly(4))
+                if length == -1:
+                    length, = FRAME_LARGE_SIZE.unpack(await reader.readexactly(8))
+                if await reader.readexactly(1) == FRAME_NONE:
+                    return None
+                b_data = await reader.readexactly(length - 1)
+            except asyncio.IncompleteReadError:
+                return None
+        try:
+            return self._pipe._from_wire(b_data)
+        except (MemoryError, UnicodeDecodeError, StructError):
+            self._pipe._e_sending_failure_receiver.value = True
+            return self._pipe._empty()
+
+    def __aiter__(self) -> 'AsyncPipeReader':
+        return self
+
+    async def __anext__(self) -> PAYLOAD:
+        if (message := await self.read()) is None:
+            raise StopAsyncIteration
+        return message
+
+    async def close(self):
+        """
+        Stop reading; the pipe's own connection stays open.
+        :return:
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+BATCH_LENGTH = Struct('!I')  # before every message in a batch
+batch_stats = namedtuple('batch_stats', ('messages', 'transfers', 'payload_bytes', 'wire_bytes'))
+BATCH_CODECS = {  # name -> (tag, compress(data, level), decompress(data))
+    'zlib': (1, lambda data, level: zlib.compress(data, 6 if level is None else level), zlib.decompress),
+    'lzma': (2, lambda data, level: lzma.compress(data, preset = level), lzma.decompress),
+}
+BATCH_DECODERS = {tag: decompress for tag, _, decompress in BATCH_CODECS.values()}
+
+
+class BatchFrameError(ValueError):
+    """ A BatchingPipe transfer that can not be decompressed or decoded; frame is its index, from 0. """
+    frame: int
+
+    def __init__(self, frame: int, reason: Exception):
+        ValueError.__init__(self, f'Batch frame {frame}: {reason!r}')
+        self.frame = frame
+
+
+class BatchingPipe:
+    """
+    Text messages over a SimplePipe in PIPE_BYTES mode, many per transfer:  messages are held back until
+    batch_bytes of them are waiting or batch_delay seconds have passed since the first, then sent at once,
+    so the handshake is paid per batch instead of per message.  A batch of compress_above bytes or more is
+    compressed with compression ('zlib' or 'lzma').
+    Same interface as SimplePipe (init_sender()/sender, init_receiver()/receiver); flush() sends what waits.
+    A transfer is a codec byte (0 for none), then per message its length and its bytes.
+    A transfer that can not be decompressed or decoded makes the receiver raise BatchFrameError, ending it.
+    """
+    _pipe: SimplePipe
+    _encoding: str
+    _batch_bytes: int
+    _batch_delay: float
+    _compression: Union[str, None]
+    _compress_above: int
+    _level: Union[int, None]
+    _pending: List[bytes]
+    _pending_bytes: int
+    _timer: Union[Timer, None]
+    _lock: ThreadLock  # the sender and the timer flush from different threads
+    _error: bool
+    _messages: int
+    _transfers: int
+    _payload_bytes: int
+    _wire_bytes: int
+    _receiver_g: Union[P_RECEIVER_TYPE, None]
+    _sender_c: Union[CP_SENDER_TYPE, None]
+
+    def __init__(self, batch_bytes: int = 64_000, batch_delay: float = .005, compression: str = None,
+                 compress_above: int = 1024, level: int = None, encoding: str = 'UTF-8', window: int = 4):
+        """
+        :param batch_bytes: bytes of messages that trigger a transfer
+        :param batch_delay: seconds a message waits at most for others to join it, 0 to only flush on size
+        :param compression: None, 'zlib' or 'lzma'
+        :param compress_above: batches smaller than this many bytes are sent as they are
+        :param level: compression level (zlib) or preset (lzma), None for the default
+        :param encoding: text encoding
+        :param window: the underlying SimplePipe's window
+        """
+        if compression is not None and compression not in BATCH_CODECS:
+            raise ValueError(f'Unknown compression {compression!r}.')
+        self._pipe = SimplePipe(window = window, mode = PIPE_BYTES)
+        self._encoding = encoding
+        self._batch_bytes = batch_bytes
+        self._batch_delay = batch_delay
+        self._compression = compression
+        self._compress_above = compress_above
+        self._level = level
+        self._pending = []
+        self._pending_bytes = 0
+        self._timer = None
+        self._lock = ThreadLock()
+        self._error = False
+        self._messages = self._transfers = self._payload_bytes = self._wire_bytes = 0
+        self._receiver_g = self._sender_c = None
+
+    def init_sender(self):
+        self._pipe.init_sender()
+        self._sender_c = self._send
+
+    def init_receiver(self):
+        self._pipe.init_receiver()
+        self._receiver_g = rg = self._receive_batches()
+        next(rg)  # pre-initialization
+
+    @property
+    def receiver(self) -> P_RECEIVER_TYPE:
+        return self._receiver_g
+
+    @property
+    def sender(self) -> CP_SENDER_TYPE:
+        return self._sender_c
+
+    def _send(self, data: S_NONE) -> bool:
+        """ Queue a message, flushing as the budget and the delay say; None flushes and ends the stream. """
+        if data is None:
+            self.flush()
+            with self._lock:
+                self._error |= self._pipe.sender(None)
+                return self._error
+        try:
+            b_data = data.encode(self._encoding)
+        except (MemoryError, UnicodeEncodeError):
+            return True
+        with self._lock:
+            self._pending.append(BATCH_LENGTH.pack(len(b_data)))
+            self._pending.append(b_data)
+            self._pending_bytes += BATCH_LENGTH.size + len(b_data)
+            self._messages += 1
+            if self._pending_bytes >= self._batch_bytes:
+                self._flush_locked()
+            elif self._timer is None and self._batch_delay > 0:
+                self._timer = Timer(self._batch_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            return self._error
+
+    def flush(self) -> bool:
+        """
+        Send the messages waiting, if any.
+        :return: bool error, of this or an earlier transfer
+        """
+        with self._lock:
+            self._flush_locked()
+            return self._error
+
+    def _flush_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        body = b''.join(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        tag = 0
+        if self._compression is not None and len(body) >= self._compress_above:
+            tag, compress, _ = BATCH_CODECS[self._compression]
+            body = compress(body, self._level)
+        self._error |= self._pipe.sender(bytes((tag,)) + body)
+        self._transfers += 1
+        self._payload_bytes += len(body) + 1
+        self._wire_bytes += len(body) + 1 + FRAME_SIZE.size
+
+    def _receive_batches(self) -> P_RECEIVER_TYPE:
+        receive = self._pipe.receiver
+        text_encoding = self._encoding
+        length_size = BATCH_LENGTH.size
+        unpack_length = BATCH_LENGTH.unpack_from
+
+        yield  # pre-initialization
+        frame = -1
+        while (batch := next(receive)) is not None:
+            frame += 1
+            if not batch:
+                continue  # an error on the way
+            tag = batch[0]
+            try:
+                body = memoryview(batch)[1:] if not tag else BATCH_DECODERS[tag](memoryview(batch)[1:])
+                messages = []
+                place = 0
+                while place < len(body):
+                    length, = unpack_length(body, place)
+                    place += length_size
+                    if place + length > len(body):
+                        raise StructError(f'message of {length} bytes past the end of the transfer')
+                    messages.append(str(body[place:place + length], text_encoding))
+                    place += length
+            except (KeyError, zlib.error, lzma.LZMAError, MemoryError, UnicodeDecodeError, StructError) as failure:
+                self._pipe._e_sending_failure_receiver.value = True
+                raise BatchFrameError(frame, failure) from failure
+            yield from messages
+        while True:
+            yield None
+
+    @property
+    def stats(self) -> batch_stats:
+        """
+        Count what the sender sent:  messages, transfers, the bytes handed to the pipe, and the bytes on the
+        wire (adding the Connection header of every transfer).
+        :return: batch_stats
+        """
+        return batch_stats(self._messages, self._transfers, self._payload_bytes, self._wire_bytes)
+
+    @property
+    def pipe(self) -> SimplePipe:
+        return self._pipe
+
+    @property
+    def error(self) -> bool:
+        return self._error or self._pipe.error
+
+
 print_text_lock = Lock()
 
 
@@ -0,0 +1,430 @@
+#!/usr/bin/python3
+"""
+Benchmarks for simple_pipe.
+Run from this directory:  python simple_pipe_benchmark.py <name> [options]
+exchange, latency and suite also write their results as JSON with --json <file> (- for standard output).
+"""
+import asyncio
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from ctypes import c_uint
+from datetime import datetime, timezone
+from itertools import cycle
+from multiprocessing import Process, Queue
+from os import cpu_count
+from queue import Empty
+from struct import Struct
+from threading import Thread
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from simple_pipe import (BatchingPipe, GeneratePPCExchange, MessageBus, PIPE_BYTES, PIPE_RECORDS,
+                         ProcessPairController, RingPipe, SimplePipe, p_value, ppc_pair)
+
+RESULTS: List[dict] = []  # what exchange, latency and suite measured, for --json
+
+
+def transfer(pipe, messages: List[str]) -> float:
+    """
+    Send every message from this process to a receiving process through pipe and time it.
+    :return: seconds from the first send to the last message received
+    """
+    def receive():
+        pipe.init_receiver()
+        d_receive = pipe.receiver
+        while next(d_receive) is not None:
+            pass
+
+    (p_receive := Process(target = receive, name = 'P_receive')).start()
+    pipe.init_sender()
+    d_send = pipe.sender
+    start = perf_counter()
+    for message in messages:
+        d_send(message)
+    d_send(None)
+    p_receive.join()
+    return perf_counter() - start
+
+
+def bench_ring(sizes: List[int], repeat: int):
+    """
+    Compare MB/s of SimplePipe and RingPipe on messages of the given sizes (bytes).
+    """
+    print(f'{"size":>12}{"SimplePipe MB/s":>18}{"RingPipe MB/s":>18}')
+    for size in sizes:
+        messages = ['x' * size] * repeat
+        megabytes = size * repeat / 1e6
+        simple = megabytes / transfer(SimplePipe(), messages)
+        ring = megabytes / transfer(RingPipe(), messages)
+        print(f'{size:>12}{simple:>18.1f}{ring:>18.1f}')
+
+
+def bench_window(sizes: List[int], repeat: int, windows: List[int]):
+    """
+    Compare MB/s of stop-and-wait SimplePipe (window 1) and windowed SimplePipe with tuned chunks.
+    """
+    print(f'{"size":>12}' + ''.join(f'{f"window {w} MB/s":>18}' for w in windows) + f'{"tuned chunk":>14}')
+    for size in sizes:
+        messages = ['x' * size] * repeat
+        megabytes = size * repeat / 1e6
+        row = f'{size:>12}'
+        chunk = 0
+        for window in windows:
+            pipe = SimplePipe(window = window)
+            row += f'{megabytes / transfer(pipe, messages):>18.1f}'
+            chunk = pipe.chunk_size
+        print(row + f'{chunk:>14}')
+
+
+RECORD = Struct('<id')  # a small structured message:  an int and a float
+
+
+def bench_payload(sizes: List[int], window: int, records_up_to: int = 1_000_000):
+    """
+    Compare MB/s of str messages (encoded and decoded, stop-and-wait and windowed) with raw bytes and with
+    records of RECORD, of the given sizes (bytes).  Enough messages are sent to move about 100 MB per cell.
+    """
+    print(f'{"size":>12}{"count":>8}{"text w1 MB/s":>15}{f"text w{window} MB/s":>15}'
+          f'{f"bytes w{window} MB/s":>16}{f"records w{window} MB/s":>18}')
+    for size in sizes:
+        count = max(2, min(2000, 100_000_000 // size))
+        megabytes = size * count / 1e6
+        row = f'{size:>12}{count:>8}'
+        text = ['x' * size] * count
+        row += f'{megabytes / transfer(SimplePipe(), text):>15.1f}'
+        row += f'{megabytes / transfer(SimplePipe(window = window), text):>15.1f}'
+        del text
+        row += f'{megabytes / transfer(SimplePipe(window = window, mode = PIPE_BYTES), [bytes(size)] * count):>16.1f}'
+        if size <= records_up_to:
+            records = [[(i, i / 2) for i in range(size // RECORD.size)]] * count
+            pipe = SimplePipe(window = window, mode = PIPE_RECORDS, record = RECORD)
+            row += f'{megabytes / transfer(pipe, records):>18.1f}'
+        else:
+            row += f'{"-":>18}'
+        print(row)
+
+
+def bus_rate(producers: int, consumers: int, messages: int, size: int, window: int) -> float:
+    """
+    Run producers processes sending messages messages of size bytes each over a round-robin MessageBus to
+    consumers processes.
+    :return: messages per second, from the producers' start until every consumer has seen the end
+    """
+    bus = MessageBus(consumers, window = window, mode = PIPE_BYTES)
+    payload = bytes(size)
+
+    def consume(index: int):
+        receive = bus.consumer(index)
+        while next(receive) is not None:
+            pass
+
+    def produce():
+        send = bus.producer().send
+        for _ in range(messages):
+            send(payload)
+
+    receivers = [Process(target = consume, args = (i,), name = f'P_consume_{i}') for i in range(consumers)]
+    senders = [Process(target = produce, name = f'P_produce_{i}') for i in range(producers)]
+    for process in receivers:
+        process.start()
+    start = perf_counter()
+    for process in senders:
+        process.start()
+    for process in senders:
+        process.join()
+    bus.close()
+    for process in receivers:
+        process.join()
+    return producers * messages / (perf_counter() - start)
+
+
+def bench_bus(counts: List[int], messages: int, size: int, window: int):
+    """
+    Tabulate aggregate messages/s of a MessageBus for every number of producers (rows) and consumers (columns).
+    """
+    print(f'{"producers":>10}' + ''.join(f'{f"{c} consumers":>14}' for c in counts))
+    for producers in counts:
+        print(f'{producers:>10}' + ''.join(f'{bus_rate(producers, c, messages, size, window):>14.0f}' for c in counts))
+
+
+def many_pipes_rate(count: int, messages: int, size: int, use_asyncio: bool) -> float:
+    """
+    Send messages messages of size bytes over each of count pipes, from one process to another, either with one
+    event loop per process (AsyncPipeWriter/AsyncPipeReader) or with one thread per pipe on each side.
+    :return: messages per second over all pipes
+    """
+    pipes = [SimplePipe(mode = PIPE_BYTES) for _ in range(count)]
+    payload = bytes(size)
+
+    async def send_async(pipe: SimplePipe):
+        writer = await pipe.open_async_sender()
+        for _ in range(messages):
+            await writer.write(payload)
+        await writer.write(None)
+        await writer.close()
+
+    async def receive_async(pipe: SimplePipe):
+        reader = await pipe.open_async_receiver()
+        async for _ in reader:
+            pass
+        await reader.close()
+
+    def send_sync(pipe: SimplePipe):
+        pipe.init_sender()
+        for _ in range(messages):
+            pipe.sender(payload)
+        pipe.sender(None)
+
+    def receive_sync(pipe: SimplePipe):
+        pipe.init_receiver()
+        receive = pipe.receiver
+        while next(receive) is not None:
+            pass
+
+    def run_all(side_async: Callable, side_sync: Callable):
+        if use_asyncio:
+            async def everyone():
+                await asyncio.gather(*(side_async(pipe) for pipe in pipes))
+
+            asyncio.run(everyone())
+        else:
+            threads = [Thread(target = side_sync, args = (pipe,)) for pipe in pipes]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    (p_receive := Process(target = run_all, args = (receive_async, receive_sync), name = 'P_receive')).start()
+    start = perf_counter()
+    run_all(send_async, send_sync)
+    p_receive.join()
+    return count * messages / (perf_counter() - start)
+
+
+def bench_many_pipes(counts: List[int], messages: int, size: int):
+    """
+    Compare messages/s over many concurrent pipes:  one event loop per side against one thread per pipe.
+    """
+    print(f'{"pipes":>8}{"asyncio msgs/s":>16}{"threads msgs/s":>16}')
+    for count in counts:
+        print(f'{count:>8}{many_pipes_rate(count, messages, size, True):>16.0f}'
+              f'{many_pipes_rate(count, messages, size, False):>16.0f}')
+
+
+def bench_batch(messages: int, delay: float, budget: int):
+    """
+    Compare small, repetitive text messages sent one by one with SimplePipe and batched with BatchingPipe,
+    uncompressed and compressed:  messages/s and bytes on the wire.
+    """
+    texts = [f'sensor {i % 16:02} reading {i % 1000:04} status ok' for i in range(messages)]
+    plain_bytes = sum(len(text.encode()) for text in texts)
+    print(f'{"pipe":>24}{"msgs/s":>12}{"transfers":>11}{"wire bytes":>12}')
+    print(f'{"SimplePipe":>24}{messages / transfer(SimplePipe(), texts):>12.0f}{messages:>11}'
+          f'{plain_bytes + 4 * messages:>12}')  # one Connection header per message
+    for compression in (None, 'zlib', 'lzma'):
+        pipe = BatchingPipe(budget, delay, compression)
+        rate = messages / transfer(pipe, texts)
+        stats = pipe.stats
+        name = f'BatchingPipe {compression or "raw"}'
+        print(f'{name:>24}{rate:>12.0f}{stats.transfers:>11}{stats.wire_bytes:>12}')
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.
+
+
+STEP_MAKER = Callable[[ProcessPairController, ProcessPairController], Callable[[], None]]
+
+
+def choreography(method: str) -> STEP_MAKER:
+    """ Steps calling method on the two controllers in turn, as GeneratePPCExchange does. """
+    def make(a: ProcessPairController, b: ProcessPairController) -> Callable[[], None]:
+        controllers = cycle((a, b))
+        return lambda: getattr(next(controllers), method)()
+
+    return make
+
+
+def exchange_patterns() -> Dict[str, Tuple[STEP_MAKER, STEP_MAKER]]:
+    """
+    The exchanges of GeneratePPCExchange, and every ProcessPairController choreography naming both events
+    paired with its mirror (1 and 2 swapped).
+    """
+    patterns = {
+        'GeneratePPCExchange.send_sync/receive_sync': (GeneratePPCExchange.send_sync, GeneratePPCExchange.receive_sync),
+        'GeneratePPCExchange.send_oscillate/receive_oscillate': (GeneratePPCExchange.send_oscillate,
+                                                                 GeneratePPCExchange.receive_oscillate),
+    }
+    names = sorted(name for name in dir(ProcessPairController)
+                   if name[:2] in ('a_', 'b_') and '1' in name and '2' in name)
+    for name in names:
+        mirror = name.translate(str.maketrans('12', '21'))
+        if mirror in names and f'{mirror}/{name}' not in patterns:
+            patterns[f'{name}/{mirror}'] = (choreography(name), choreography(mirror))
+    return patterns
+
+
+def exchange_run(make_first: STEP_MAKER, make_second: STEP_MAKER, count: int, timeout: float) -> dict:
+    """
+    Run count exchanges between two processes, the first timing each of its steps.
+    A step that returns before the other process has begun the same step counts as a violation:  the pattern
+    does not synchronize.  If the processes are not done within timeout seconds, the pattern deadlocked.
+    :return: dict of the measurements
+    """
+    a, b = ppc_pair()
+    entered = [p_value(c_uint, 0), p_value(c_uint, 0)]
+    results = Queue()
+
+    def side(me: int, make: STEP_MAKER):
+        step = make(a, b)
+        mine, theirs = entered[me], entered[1 - me]
+        violations = 0
+        times = []
+        start = perf_counter()
+        for i in range(1, count + 1):
+            mine.value = i
+            began = perf_counter()
+            step()
+            times.append(perf_counter() - began)
+            if theirs.value < i:
+                violations += 1
+        elapsed = perf_counter() - start
+        results.put((me, elapsed, times if me == 0 else None, violations))
+
+    processes = [Process(target = side, args = (0, make_first), name = 'P_first'),
+                 Process(target = side, args = (1, make_second), name = 'P_second')]
+    for process in processes:
+        process.start()
+    reports = {}
+    try:
+        for _ in processes:
+            me, *report = results.get(timeout = timeout)
+            reports[me] = report
+    except Empty:
+        pass
+    for process in processes:
+        process.join(.1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    if len(reports) < 2:
+        return {'status': 'deadlock', 'exchanges': count}
+    elapsed, times, violations = reports[0]
+    return {'status': 'ok' if not violations + reports[1][2] else 'unsynchronized', 'exchanges': count,
+            'exchanges_per_s': count / elapsed, 'latency_us_p50': percentile(times, .5) * 1e6,
+            'latency_us_p99': percentile(times, .99) * 1e6, 'violations': violations + reports[1][2]}
+
+
+def bench_exchange(count: int, timeout: float):
+    """
+    Measure every exchange pattern:  exchanges/s and the latency of one exchange, or why it is unusable.
+    """
+    print(f'{"pattern":>56}{"status":>16}{"exchanges/s":>13}{"p50 us":>9}{"p99 us":>9}')
+    for name, (make_first, make_second) in exchange_patterns().items():
+        result = exchange_run(make_first, make_second, count, timeout)
+        RESULTS.append({'benchmark': 'exchange', 'pattern': name, **result})
+        row = f'{name:>56}{result["status"]:>16}'
+        if result['status'] != 'deadlock':
+            row += f'{result["exchanges_per_s"]:>13.0f}{result["latency_us_p50"]:>9.1f}{result["latency_us_p99"]:>9.1f}'
+        print(row)
+
+
+def round_trips(size: int, trips: int, window: int) -> List[float]:
+    """
+    Echo a message of size bytes trips times through two SimplePipes (there and back).
+    :return: seconds of every round trip
+    """
+    there, back = SimplePipe(window = window), SimplePipe(window = window)
+    message = 'x' * size
+
+    def echo():
+        there.init_receiver()
+        back.init_sender()
+        receive, send = there.receiver, back.sender
+        while (text := next(receive)) is not None:
+            send(text)
+
+    (p_echo := Process(target = echo, name = 'P_echo')).start()
+    there.init_sender()
+    back.init_receiver()
+    send, receive = there.sender, back.receiver
+    times = []
+    for _ in range(trips):
+        began = perf_counter()
+        send(message)
+        next(receive)
+        times.append(perf_counter() - began)
+    send(None)
+    p_echo.join()
+    return times
+
+
+def bench_latency(sizes: List[int], windows: List[int], count: int):
+    """
+    Measure SimplePipe round-trip latency and one-way throughput per message size and window.
+    """
+    print(f'{"size":>12}{"window":>8}{"trips":>7}{"p50 us":>11}{"p99 us":>11}{"msgs/s":>10}{"MB/s":>9}')
+    for size in sizes:
+        trips = max(3, min(count, 20_000_000 // size))
+        messages = max(3, min(count, 200_000_000 // size))
+        for window in windows:
+            times = round_trips(size, trips, window)
+            seconds = transfer(SimplePipe(window = window), ['x' * size] * messages)
+            result = {'benchmark': 'simple_pipe', 'size': size, 'window': window, 'round_trips': trips,
+                      'round_trip_us_p50': percentile(times, .5) * 1e6,
+                      'round_trip_us_p99': percentile(times, .99) * 1e6,
+                      'messages': messages, 'msgs_per_s': messages / seconds,
+                      'mb_per_s': size * messages / seconds / 1e6}
+            RESULTS.append(result)
+            print(f'{size:>12}{window:>8}{trips:>7}{result["round_trip_us_p50"]:>11.1f}'
+                  f'{result["round_trip_us_p99"]:>11.1f}{result["msgs_per_s"]:>10.0f}{result["mb_per_s"]:>9.1f}')
+
+
+def write_results(path: str, arguments: dict):
+    """
+    Write RESULTS with what reproducing them takes (interpreter, platform, CPUs, arguments) as JSON.
+    """
+    document = {
+        'meta': {'python': sys.version, 'platform': platform.platform(), 'cpus': cpu_count(),
+                 'time': datetime.now(timezone.utc).isoformat(), 'arguments': arguments},
+        'results': RESULTS,
+    }
+    if path == '-':
+        json.dump(document, sys.stdout, indent = 1)
+        print()
+    else:
+        with open(path, 'w') as file:
+            json.dump(document, file, indent = 1)
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'ring': lambda a: bench_ring(a.sizes, a.repeat),
+    'window': lambda a: bench_window(a.sizes, a.repeat, a.windows),
+    'payload': lambda a: bench_payload(a.sizes, max(a.windows)),
+    'bus': lambda a: bench_bus(a.counts, a.messages, a.sizes[0], max(a.windows)),
+    'asyncio': lambda a: bench_many_pipes(a.counts, a.messages, a.sizes[0]),
+    'batch': lambda a: bench_batch(a.messages, a.delay, a.budget),
+    'exchange': lambda a: bench_exchange(a.messages, a.timeout),
+    'latency': lambda a: bench_latency(a.sizes, a.windows, a.messages),
+    'suite': lambda a: (bench_exchange(a.messages, a.timeout), bench_latency(a.sizes, a.windows, a.messages)),
+}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description = __doc__)
+    parser.add_argument('name', choices = sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1_000, 1_000_000, 100_000_000], help = 'message sizes in bytes')
+    parser.add_argument('--repeat', type = int, default = 10)
+    parser.add_argument('--windows', type = int, nargs = '+', default = [1, 4, 16])
+    parser.add_argument('--counts', type = int, nargs = '+', default = [1, 2, 4])
+    parser.add_argument('--messages', type = int, default = 2000)
+    parser.add_argument('--delay', type = float, default = .005)
+    parser.add_argument('--budget', type = int, default = 64_000)
+    parser.add_argument('--timeout', type = float, default = 10., help = 'seconds before an exchange counts as deadlocked')
+    parser.add_argument('--json', metavar = 'FILE', help = 'also write the results as JSON (- for standard output)')
+    arguments = parser.parse_args()
+    BENCHMARKS[arguments.name](arguments)
+    if arguments.json:
+        write_results(arguments.json, vars(arguments))
@@ -1,7 +1,14 @@
 #!/usr/bin/python3
+import marshal
+import pickle
 from ast import parse as ast_parser
-from os.path import isfile
-from typing import Any, Callable, Tuple, Union
+from copy import copy
+from os import fsync, remove, replace, truncate
+from os.path import getsize, isfile
+from struct import Struct, error as StructError
+from threading import Thread
+from typing import Any, Callable, Dict, Tuple, Union
+from warnings import warn
 
 import simple_tools.a_collect as a_collect
 
@@ -29,6 +36,199 @@ class WrappingError(Error):
     pass
 
 
+class Serializer(object):
+    """A way of turning the data of a Memory into the contents of its document and back.
+    "binary" tells whether the document is bytes (True) or text (False)."""
+    name = ""
+    binary = True
+
+    def dump(self, data):
+        """Returns the document contents for "data"."""
+        raise NotImplementedError
+
+    def load(self, contents):
+        """Returns the data held in the document "contents"."""
+        raise NotImplementedError
+
+
+class ReprSerializer(Serializer):
+    """The original text format: repr() to write, eval() with no names available to read.
+    It is kept as the default so that existing documents stay readable (and editable by hand)."""
+    name = "repr"
+    binary = False
+
+    def dump(self, data):
+        return repr(data)
+
+    def load(self, contents):
+        return eval(contents, {"__builtins__": {}}, {})
+
+
+class PickleSerializer(Serializer):
+    """Pickle protocol 5: fast and takes almost anything, but only recall documents you trust."""
+    name = "pickle"
+
+    def dump(self, data):
+        return pickle.dumps(data, protocol = 5)
+
+    def load(self, contents):
+        return pickle.loads(contents)
+
+
+class MarshalSerializer(Serializer):
+    """The interpreter's own marshal format: the fastest for plain data (no instances of classes),
+    but it is only meant to be read back by the same Python version."""
+    name = "marshal"
+
+    def dump(self, data):
+        return marshal.dumps(data)
+
+    def load(self, contents):
+        return marshal.loads(contents)
+
+
+class BinarySerializer(Serializer):
+    """A compact, version-independent binary format for plain data:
+    None, bools, ints (of any size), floats, strings, bytes, lists, tuples, dicts, sets and frozensets.
+    Every value is a tag byte; ints and lengths are variable-length (7 bits per byte), floats take 8 bytes."""
+    name = "binary"
+    _float = Struct("<d")
+
+    def dump(self, data):
+        out = bytearray()
+        self._dump(data, out)
+        return bytes(out)
+
+    @staticmethod
+    def _varint(number, out):
+        while number > 0x7f:
+            out.append(number & 0x7f | 0x80)
+            number >>= 7
+        out.append(number)
+
+    def _dump(self, data, out):
+        kind = type(data)
+        if data is None:
+            out += b"N"
+        elif kind is bool:
+            out += b"T" if data else b"F"
+        elif kind is int:
+            out += b"i"
+            self._varint(data << 1 if data >= 0 else (-data << 1) - 1, out)  # zigzag: small negatives stay small
+        elif kind is float:
+            out += b"f"
+            out += self._float.pack(data)
+        elif kind is str:
+            encoded = data.encode("UTF-8")
+            out += b"s"
+            self._varint(len(encoded), out)
+            out += encoded
+        elif kind in (bytes, bytearray):
+            out += b"b"
+            self._varint(len(data), out)
+            out += data
+        elif kind is dict:
+            out += b"d"
+            self._varint(len(data), out)
+            for key, value in data.items():
+                self._dump(key, out)
+                self._dump(value, out)
+        elif kind in (list, tuple, set, frozenset):
+            out += {list: b"l", tuple: b"t", set: b"e", frozenset: b"z"}[kind]
+            self._varint(len(data), out)
+            for item in data:
+                self._dump(item, out)
+        else:
+            raise TypeError("The binary format can not hold a {}.".format(kind.__name__))
+
+    def load(self, contents):
+        data, place = self._load(memoryview(contents), 0)
+        if place != len(contents):
+            raise ValueError("Trailing bytes after the data.")
+        return data
+
+    @staticmethod
+    def _read_varint(contents, place):
+        number = shift = 0
+        while True:
+            byte = contents[place]
+            place += 1
+            number |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return number, place
+            shift += 7
+
+    def _load(self, contents, place):
+        tag = contents[place]
+        place += 1
+        if tag == 0x4e:  # N
+            return None, place
+        if tag == 0x54:  # T
+            return True, place
+        if tag == 0x46:  # F
+            return False, place
+        if tag == 0x66:  # f
+            return self._float.unpack_from(contents, place)[0], place + 8
+        number, place = self._read_varint(contents, place)
+        if tag == 0x69:  # i
+            return (number >> 1) if not number & 1 else -((number + 1) >> 1), place
+        if tag == 0x73:  # s
+            return str(contents[place:place + number], "UTF-8"), place + number
+        if tag == 0x62:  # b
+            return bytes(contents[place:place + number]), place + number
+        if tag == 0x64:  # d
+            data = {}
+            for _ in range(number):
+                key, place = self._load(contents, place)
+                data[key], place = self._load(contents, place)
+            return data, place
+        items = []
+        for _ in range(number):
+            item, place = self._load(contents, place)
+            items.append(item)
+        if tag == 0x6c:  # l
+            return items, place
+        if tag == 0x74:  # t
+            return tuple(items), place
+        if tag == 0x65:  # e
+            return set(items), place
+        if tag == 0x7a:  # z
+            return frozenset(items), place
+        raise ValueError("Unknown tag {!r} in the binary format.".format(chr(tag)))
+
+
+SERIALIZERS: Dict[str, Serializer] = {x.name: x for x in (ReprSerializer(), PickleSerializer(), MarshalSerializer(), BinarySerializer())}
+
+
+def get_serializer(serializer):
+    """Returns the Serializer named "serializer" (one of SERIALIZERS), or "serializer" itself if it is a Serializer."""
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer not in SERIALIZERS:
+        raise TargetError("\"serializer\" Must be one of {}, or a Serializer.".format(", ".join(SERIALIZERS)))
+    return SERIALIZERS[serializer]
+
+
+JOURNAL_LENGTH = Struct("<I")  # before every record of a journal kept with a binary Serializer
+
+
+def write_snapshot(target, data, serializer, encoding, journal_old = None):
+    """Writes "data" to the document "target" with "serializer" through a temporary file, so the document is either the old or the
+    new one, never a mix; then removes "journal_old", the journal the new document contains.
+    Used by the journal mode of Memory to compact in the background."""
+    contents = serializer.dump(data)
+    if not serializer.binary:
+        contents = contents.encode(encoding)
+    temporary = target + ".compacting"
+    with open(temporary, "wb") as mem:
+        mem.write(contents)
+        mem.flush()
+        fsync(mem.fileno())
+    replace(temporary, target)
+    if journal_old is not None and isfile(journal_old):
+        remove(journal_old)
+
+
 # noinspection PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences,PyIncorrectDocstring
 class Memory(object):
     """This class is a Data Storage and Retrieval API."""
@@ -39,8 +239,16 @@ class Memory(object):
     __data_type = dict
     __memories = dict()
     __target = None
-
-    def __init__(self, mem, target, data_type = dict, force_type = True, string_wrap = False, target_encoding = 'UTF-8'):
+    __serializer = SERIALIZERS["repr"]
+    __journal = False
+    __journal_limit = 1 << 20
+    __journal_file = None
+    __journal_bytes = 0
+    __compactor = None
+    __replaced = True  # whether the data changed since the last snapshot in a way the journal does not tell
+
+    def __init__(self, mem, target, data_type = dict, force_type = True, string_wrap = False, target_encoding = 'UTF-8', serializer = "repr",
+                 journal = False, journal_limit = 1 << 20):
         """Specify a piece of data (No classes or functions that can not be properly represented) that can be initialized for "mem".
         Give a file name or None for "target" (Document) to target a file (If None is specified, be sure to invoke the target method later).
         Make sure "data_type" is the data type of "mem".
@@ -50,7 +258,10 @@ class Memory(object):
         The "string_wrap" feature allows the API to read documents of text as strings.
         "string_wrap" Must be a boolean value:
             If True, the data_type of this API must be a string.
-        The "target_encoding" is the encoding of the file being targeted."""
+        The "target_encoding" is the encoding of the file being targeted.
+        The "serializer" is how the data is written to the document: "repr" (text, the default), "pickle" (protocol 5),
+        "marshal" or "binary" (compact, for plain data), or a Serializer of your own (see SERIALIZERS).
+        The "journal" option turns on the journal mode (see the "set_journaling" method), compacting past "journal_limit" bytes."""
         assert isinstance(mem, data_type), "Takes only a {}.".format(type(data_type))
         if not (target is None or isinstance(target, str)):
             raise TargetError("\"Target\" Must be either a string or None.")
@@ -60,7 +271,9 @@ class Memory(object):
         self.__data_type = data_type
         self.__force_type = force_type
         self.__encoding = target_encoding
+        self.__serializer = get_serializer(serializer)
         self.set_string_wrapping_state(string_wrap)
+        self.set_journaling(journal, journal_limit)
         self.target(target)
         self.set_memories(mem)
 
@@ -312,6 +525,177 @@ class Memory(object):
         This feature allows the API to read documents of text as strings."""
         return self.__str_wrapping
 
+    def get_serializer(self):
+        """This method returns the Serializer that turns the data into the document and back."""
+        return self.__serializer
+
+    def set_serializer(self, serializer):
+        """This method switches the format of the document: a name out of SERIALIZERS or a Serializer.
+        The document is not rewritten until the "remember" method is invoked, and a document written in the old format can not
+        be recalled in the new one."""
+        self.__serializer = get_serializer(serializer)
+        return None
+
+    def set_journaling(self, journal, journal_limit = 1 << 20):
+        """This method turns the journal mode on or off.
+        In the journal mode, the "set_item", "delete_item" and "append_item" methods append what they change to a journal next to the
+        document (its name plus ".journal"), and the "remember" method only writes that down, instead of the whole document.
+        Once the journal grows past "journal_limit" bytes, it is set aside and a new document is written in the background.
+        The "recall" method reads the document, then replays the journal on it.
+        The whole document is only written again after the data is replaced (with "set_memories" and the like).
+        Only change the data with those methods while journaling, and do not change values they were given afterwards.
+        Should the process die while compacting, the journal set aside may be replayed twice: setting and deleting keys of a dict and
+        appending are safe to replay, deleting from a list is not."""
+        assert isinstance(journal, bool), "\"journal\" Must be a boolean value."
+        if journal and self.get_string_wrapping_state():
+            raise WrappingError("A string wrapped document can not be journaled.")
+        if self.__journal and not journal:
+            self.__replaced = True  # the next "remember" writes everything and drops the journal
+            self.remember()
+            self.__close_journal()
+        self.__journal = journal
+        self.__journal_limit = journal_limit
+        return None
+
+    def is_journaling(self):
+        """This method returns whether the journal mode is on."""
+        return self.__journal
+
+    def get_journal_target(self):
+        """This method returns the file name of the journal of the current document (the document's name plus ".journal")."""
+        return self.get_target() + ".journal" if self.get_target() not in (None, "") else ""
+
+    def set_item(self, key, value):
+        """This method sets "key" (or an index) of the current data to "value", writing it to the journal in the journal mode."""
+        self.get_memories()[key] = value
+        self.__log(("s", key, value))
+        return None
+
+    def delete_item(self, key):
+        """This method deletes "key" (or an index) from the current data, writing it to the journal in the journal mode."""
+        del self.get_memories()[key]
+        self.__log(("d", key))
+        return None
+
+    def append_item(self, value):
+        """This method appends "value" to the current data (a list), writing it to the journal in the journal mode."""
+        self.get_memories().append(value)
+        self.__log(("a", len(self.get_memories()) - 1, value))  # after appending, so a compaction it starts copies the value
+        return None
+
+    def __log(self, record):
+        if not self.__journal or not self.is_active():
+            return
+        contents = self.__serializer.dump(record)
+        if self.__serializer.binary:
+            contents = JOURNAL_LENGTH.pack(len(contents)) + contents
+        else:
+            contents = (contents + "\n").encode(self.__encoding)  # one record per line
+        if self.__journal_file is None:
+            self.__journal_file = open(self.get_journal_target(), "ab")
+            self.__journal_bytes = self.__journal_file.tell()
+        self.__journal_file.write(contents)
+        self.__journal_bytes += len(contents)
+        if self.__journal_bytes > self.__journal_limit:
+            self.__compact()
+
+    def __compact(self):
+        """Set the journal aside and write a new document from a copy of the data in the background."""
+        journal_old = self.get_journal_target() + ".old"
+        if self.__compactor is not None and self.__compactor.is_alive():
+            return  # still compacting
+        self.__close_journal()
+        if isfile(journal_old):  # a compaction failed: the journal joins the one it set aside, and both are compacted
+            with open(journal_old, "ab") as old, open(self.get_journal_target(), "rb") as journal:
+                old.write(journal.read())
+            remove(self.get_journal_target())
+        else:
+            replace(self.get_journal_target(), journal_old)
+        self.__compactor = Thread(target = write_snapshot, args = (self.get_target(), copy(self.get_memories()), self.__serializer,
+                                                                 self.__encoding, journal_old), daemon = True)
+        self.__compactor.start()
+
+    def __wait_for_compaction(self):
+        if self.__compactor is not None:
+            self.__compactor.join()
+            self.__compactor = None
+
+    def __close_journal(self):
+        self.__wait_for_compaction()
+        if self.__journal_file is not None:
+            self.__journal_file.close()
+            self.__journal_file = None
+        self.__journal_bytes = 0
+
+    def __fold_journal(self):
+        """Write the current data, which the journals were replayed on, as a new document, then forget the journals."""
+        write_snapshot(self.get_target(), self.get_memories(), self.__serializer, self.__encoding, self.get_journal_target() + ".old")
+        if isfile(self.get_journal_target()):
+            remove(self.get_journal_target())
+
+    def __drop_journal(self):
+        """Forget the journals of the current document, before it is written whole."""
+        self.__close_journal()
+        for journal in (self.get_journal_target() + ".old", self.get_journal_target()):
+            if isfile(journal):
+                remove(journal)
+
+    def __read_journal(self):
+        """Returns the records of the journals of the current document, oldest first, cutting off a record only partly written."""
+        self.__close_journal()
+        records = []
+        for journal in (self.get_journal_target() + ".old", self.get_journal_target()):
+            if not isfile(journal):
+                continue
+            with open(journal, "rb") as log:
+                contents = log.read()
+            place = 0
+            while place < len(contents):
+                if self.__serializer.binary:
+                    try:
+                        length, = JOURNAL_LENGTH.unpack_from(contents, place)
+                    except StructError:
+                        break
+                    end = place + JOURNAL_LENGTH.size + length
+                    if end > len(contents):
+                        break
+                    record = contents[place + JOURNAL_LENGTH.size:end]
+                else:
+                    end = contents.find(b"\n", place) + 1
+                    if not end:
+                        break
+                    record = contents[place:end - 1]
+                # noinspection PyBroadException
+                try:
+                    records.append(self.__serializer.load(record if self.__serializer.binary else record.decode(self.__encoding)))
+                except Exception as error:  # a whole record, so not one cut short
+                    raise LoadingError("The journal {} holds an unreadable record at byte {}: {!r}".format(journal, place, error)) from error
+                place = end
+            if place < len(contents):
+                truncate(journal, place)
+        return records
+
+    def __replay(self, record):
+        """Apply a record of the journal to the current data.
+        A record replayed twice (see "set_journaling") is skipped when it appends, and warned about when it deletes a key of a dict
+        that is gone; any other record that does not apply raises a LoadingError."""
+        data = self.get_memories()
+        try:
+            if record[0] == "s":
+                data[record[1]] = record[2]
+            elif record[0] == "d":
+                if isinstance(data, dict) and record[1] not in data:
+                    warn("The journal of {} deletes {!r} again.".format(self.get_target(), record[1]), RuntimeWarning)
+                else:
+                    del data[record[1]]
+            elif record[0] == "a":
+                if len(data) <= record[1]:  # not appended yet
+                    data.append(record[2])
+            else:
+                raise LoadingError("The journal of {} holds an unknown record {!r}.".format(self.get_target(), record))
+        except (AttributeError, IndexError, KeyError, TypeError) as error:
+            raise LoadingError("The journal of {} holds a record that does not apply, {!r}: {!r}".format(self.get_target(), record, error)) from error
+
     def is_active(self):
         """This method will return weather or not the API is connected to a document."""
         self.__loaded = self.get_target() not in (None, "")
@@ -332,6 +716,7 @@ class Memory(object):
         ty = 0
         if save:
             ty = self.remember()
+        self.__close_journal()
         self.__target = None
         self.__loaded = False
         return ty
@@ -358,6 +743,7 @@ class Memory(object):
         if save:
             if self.get_target() not in (None, ""):
                 ty = 1 + self.remember()
+        self.__close_journal()
         self.__target = target
         self.__loaded = target not in (None, "")
         self.recall()
@@ -375,6 +761,7 @@ class Memory(object):
 
     def set_memories(self, memories):
         """This method sets the current piece of data that this currently being held in this API."""
+        self.__replaced = True
         if self.get_type_enforcement_state():
             self.__memories = self.get_type()(memories)
         else:
@@ -432,13 +819,26 @@ class Memory(object):
 
     def remember(self):
         """This method saves the current piece of data that this currently being held in this API to the document that 
-        this currently being targeted by this API."""
+        this currently being targeted by this API.
+        In the journal mode, only the journal is written, unless the data was replaced since the document was."""
         ty = 0
-        if self.get_target() not in (None, ""):
+        if self.__journal and self.get_target() not in (None, ""):
+            if not self.__replaced and isfile(self.get_target()):
+                if self.__journal_file is not None:
+                    self.__journal_file.flush()
+                return 15
+            self.__drop_journal()
+            self.__replaced = False
+        if self.get_target() not in (None, "") and self.__serializer.binary and not self.get_string_wrapping_state():
+            ty = 3
+            contents = self.__serializer.dump(self.get_memories())
+            with open(self.get_target(), ("wb" if isfile(self.get_target()) else "xb")) as mem:
+                mem.write(contents)
+        elif self.get_target() not in (None, ""):
             with open(self.get_target(), ("w+" if isfile(self.get_target()) else "x+"), encoding = self.__encoding) as mem:
                 if not self.get_string_wrapping_state():
                     ty = 1
-                    mem.write(str(repr(self.get_memories())))
+                    mem.write(self.__serializer.dump(self.get_memories()))
                 else:
                     ty = 2
                     # noinspection PyTypeChecker
@@ -449,11 +849,55 @@ class Memory(object):
         """This method recalls the data from the document that is currently being targeted by this API and sets it as the current data.
         If the document currently being targeted doesn't exist, then this API will generate it and put the current data into it.
         When this method is invoked, if the file already exists, this API will convert it's content into the predefined data_type.
-        Be sure to have all the API settings favourable to the target being loaded or the data might be lost."""
+        Be sure to have all the API settings favourable to the target being loaded or the data might be lost.
+        In the journal mode, the journal is then replayed on the data; should it not apply, a LoadingError is raised and the document is
+        de-targeted, left as it is with its journal."""
+        if not self.__journal or self.get_target() in (None, ""):
+            return self.__recall_document()
+        try:
+            records = self.__read_journal()
+            self.__replaced = True  # should recalling write the document, it writes all of it
+            ty = self.__recall_document()
+            for record in records:
+                self.__replay(record)
+        except LoadingError:
+            self.__target = None
+            self.__loaded = False
+            raise
+        # the data is the document and its journal, unless recalling wrote the document anew (and dropped the journal)
+        self.__replaced = bool(records) and not isfile(self.get_journal_target()) and not isfile(self.get_journal_target() + ".old")
+        if isfile(self.get_journal_target() + ".old"):
+            self.__fold_journal()  # a compaction was cut short:  finish it, so the next ones are not held back
+            self.__replaced = False
+        return ty
+
+    def __recall_document(self):
         ty = 0
         if self.get_target() not in (None, ""):
             if not isfile(self.get_target()):
                 ty = 9 + self.remember()
+            elif self.__serializer.binary and not self.get_string_wrapping_state():
+                ty = 10
+                with open(self.get_target(), 'rb') as mem:
+                    a = mem.read()
+                # noinspection PyBroadException
+                try:
+                    self.set_memories(self.__serializer.load(a) if a else self.get_type()())
+                    ty = 11
+                except Exception:
+                    self.remember()
+                if not isinstance(self.get_memories(), self.get_type()):
+                    ty = 12
+                    if self.get_type_enforcement_state():
+                        # noinspection PyBroadException
+                        try:
+                            self.set_memories(self.get_type()(self.get_memories()))
+                            ty = 13
+                        except Exception:
+                            self.set_memories(self.get_type()())
+                            ty = 14
+                    self.remember()
+                del a
             else:
                 ty = 2
                 mem = open(self.get_target(), 'r+', encoding = self.__encoding)
@@ -474,7 +918,7 @@ class Memory(object):
 
                         s = safe()
 
-                        self.set_memories(eval(s, {x: None for x in globals().keys()}, {x: None for x in locals().keys()}))
+                        self.set_memories(self.__serializer.load(s))
                     else:
                         ty = 5
                         self.set_memories(a)
@@ -0,0 +1,478 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the parallel package.
+Run from this directory:  python benchmark.py <name> [options]
+"""
+from argparse import ArgumentParser
+from array import array
+from asyncio import run, sleep as async_sleep
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client
+from os import cpu_count
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from typing import Callable, Dict, Tuple, Union
+
+from parallel import *
+
+
+def drain(generator) -> int:
+    """
+    Run a run_parallel() generator to completion and return its total.
+    :param generator: run_parallel() generator
+    :return: total number of results
+    """
+    try:
+        while True:
+            next(generator)
+    except StopIteration as conclusion:
+        return conclusion.value[2]
+
+
+def bench_pool(batches: int, slots: int, repeat: int):
+    """
+    Compare batches per second between a new thread per slot per batch and a persistent WorkerPool.
+    """
+    work: Callable[[int, int], int] = lambda b, s: b ^ s
+    for name, persistent in ('threads per batch', False), ('persistent pool', True):
+        best = 0.
+        for _ in range(repeat):
+            start = perf_counter()
+            drain(run_parallel(work, None, batches, slots, yield_to_monitor = False, persistent_workers = persistent))
+            best = max(best, batches / (perf_counter() - start))
+        print(f'{name:>20}: {best:12.1f} batches/s ({batches} batches x {slots} slots)')
+
+
+def count_primes(batch: int, slot: int, width: int = 20_000) -> int:
+    """
+    CPU-bound work: count the primes in a range of width numbers chosen by batch and slot.
+    It is defined at module level so a ProcessBackend can pickle it.
+    """
+    start = (batch * 64 + slot) * width
+    return sum(1 for n in range(max(start, 2), start + width) if all(n % d for d in range(2, int(n ** .5) + 1)))
+
+
+def numbers(batch: int, slot: int, count: int = 200_000) -> array:
+    """
+    Large numeric payload:  count consecutive integers chosen by batch and slot.
+    It is defined at module level so a ProcessBackend can pickle it.
+    """
+    start = (batch * 64 + slot) * count
+    return array('q', range(start, start + count))
+
+
+def bench_backends(batches: int, slots: int, cores: int):
+    """
+    Compare backends on CPU-bound work, scaling the processes from 1 to cores.
+    """
+    def timed(backend) -> float:
+        start = perf_counter()
+        drain(run_parallel(count_primes, None, batches, slots, yield_to_monitor = False, backend = backend))
+        return perf_counter() - start
+
+    baseline = timed('inline')
+    print(f'{"inline":>14}: {baseline:8.3f}s')
+    print(f'{"threads":>14}: {timed("threads"):8.3f}s')
+    for processes in range(1, cores + 1):
+        elapsed = timed(ProcessBackend(processes))
+        print(f'{f"processes x{processes}":>14}: {elapsed:8.3f}s  speed-up {baseline / elapsed:5.2f}')
+
+
+def polled_batches(batches: int, slots: int, wait: float = .02):
+    """
+    Drive Parallelism the way run_parallel() used to:  sleep-polling every phase transition and the monitor.
+    """
+    obj = Parallelism(True)
+    obj.set_number_of_batches(batches)
+    obj.set_number_of_slots(slots)
+    obj.generate_batches_and_slots()
+    obj.set_executor(Runner(lambda b, s: s, None))
+    obj.set_batch_execution_order(None)
+    obj.prepare_to_spawn_thread()
+    while obj.spawn_threads() == 1:
+        while obj.prepare_to_invoke_calls() == 1:
+            sleep(wait)
+        obj.begin_all_invocations()
+        sleep(wait)
+        obj.turn_monitoring_on(True)
+        obj.turn_monitoring_on(False)
+        while obj.conclude_threads() == 1:
+            sleep(wait)
+        while not obj.finalize_batch(True):
+            sleep(wait)
+
+
+def bench_latency(batches: int, slots: int):
+    """
+    Measure the overhead per batch of trivial work with sleep-polling (before) and notified transitions (after).
+    """
+    start = perf_counter()
+    polled_batches(batches, slots)
+    before = (perf_counter() - start) / batches
+    start = perf_counter()
+    drain(run_parallel(lambda b, s: s, None, batches, slots))
+    after = (perf_counter() - start) / batches
+    print(f'{"sleep-polled":>14}: {before * 1e3:9.3f} ms/batch')
+    print(f'{"notified":>14}: {after * 1e3:9.3f} ms/batch')
+
+
+def bench_contention(slots: int, writes: int, hold: float = .001):
+    """
+    Compare slot result writes into one dict behind a global lock against per-slot SlotResults cells,
+    while a monitor repeatedly takes a consistent view (holding the lock for hold seconds, or snapshotting).
+    """
+    def measure(write: Callable[[int, int], None], monitor: Callable[[], None]) -> float:
+        done = []
+
+        def writer(slot: int):
+            for i in range(writes):
+                write(slot, i)
+
+        def watcher():
+            while not done:
+                monitor()
+
+        threads = [Thread(target = writer, args = (slot,)) for slot in range(slots)]
+        observer = Thread(target = watcher)
+        observer.start()
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = perf_counter() - start
+        done.append(True)
+        observer.join()
+        return slots * writes / elapsed
+
+    lock = Lock()
+    shared: Dict[int, int] = {}
+
+    def locked_write(slot: int, value: int):
+        with lock:
+            shared[slot] = value
+
+    def locked_monitor():
+        with lock:
+            sleep(hold)
+
+    cells = SlotResults(slots)
+    print(f'{"global lock":>14}: {measure(locked_write, locked_monitor):12.0f} writes/s ({slots} slots)')
+    print(f'{"slot cells":>14}: {measure(cells.put, lambda: (cells.snapshot(), sleep(hold))):12.0f} writes/s ({slots} slots)')
+
+
+def bench_stealing(batches: int, slots: int):
+    """
+    Compare batch-by-batch execution with work stealing when one slot per batch is much slower than the rest.
+    """
+    def skewed(batch: int, slot: int) -> int:
+        sleep(.02 if slot == batch % slots else .001)
+        return slot
+
+    start = perf_counter()
+    drain(run_parallel(skewed, None, batches, slots, yield_to_monitor = False, persistent_workers = True))
+    print(f'{"batch by batch":>16}: {perf_counter() - start:8.3f}s')
+    start = perf_counter()
+    generator = run_work_stealing(skewed, None, batches, slots, workers = slots)
+    drain(generator)
+    print(f'{"work stealing":>16}: {perf_counter() - start:8.3f}s')
+
+
+def bench_async(slots: int, wait: float = .05):
+    """
+    Run one batch of I/O-bound slots (each waits for wait seconds) as coroutines, and as threads for comparison.
+    """
+    async def waiting(batch: int, slot: int) -> int:
+        await async_sleep(wait)
+        return slot
+
+    async def drain_async() -> int:
+        total = 0
+        async for _, phase, a in run_parallel_async(waiting, None, 1, slots, yield_to_monitor = False):
+            total = a
+        return total
+
+    start = perf_counter()
+    results = run(drain_async())
+    print(f'{"asyncio":>10}: {perf_counter() - start:8.3f}s for {slots} slots ({results} results)')
+    threaded = min(slots, 1_000)
+    start = perf_counter()
+    drain(run_parallel(lambda b, s: sleep(wait) or s, None, 1, threaded, yield_to_monitor = False))
+    print(f'{"threads":>10}: {perf_counter() - start:8.3f}s for {threaded} slots')
+
+
+def bench_profile(batches: int, slots: int):
+    """
+    Profile a run of trivial work, print the summary table and the cost of profiling versus not profiling.
+    """
+    def timed(profiler) -> float:
+        start = perf_counter()
+        drain(run_parallel(lambda b, s: s, None, batches, slots, persistent_workers = True, profiler = profiler))
+        return perf_counter() - start
+
+    timed(None)  # warm up
+    plain = timed(None)
+    profiler = PhaseProfiler()
+    profiled = timed(profiler)
+    print(profiler.summary(), end = '\n\n')
+    print(f'{"unprofiled":>12}: {plain * 1e3 / batches:8.3f} ms/batch')
+    print(f'{"profiled":>12}: {profiled * 1e3 / batches:8.3f} ms/batch')
+
+
+def bench_chunks(batches: int, slots: int):
+    """
+    Compare fine-grained work launched per slot, in automatically sized chunks, and vectorized.
+    """
+    def timed(fxn, **options) -> float:
+        start = perf_counter()
+        drain(run_parallel(fxn, None, batches, slots, yield_to_monitor = False, persistent_workers = True, **options))
+        return perf_counter() - start
+
+    per_slot: Callable[[int, int], int] = lambda b, s: b * s
+    per_chunk: Callable[[int, range], list] = lambda b, r: [b * s for s in r]
+    print(f'{"per slot":>12}: {timed(per_slot):8.3f}s ({batches} batches x {slots} slots)')
+    print(f'{"chunked":>12}: {timed(per_slot, chunk_size = 0):8.3f}s')
+    print(f'{"vectorized":>12}: {timed(per_chunk, vectorized = True):8.3f}s')
+
+
+def bench_distributed(batches: int, slots: int, cores: int):
+    """
+    Run CPU-bound batches on local socket workers, then again while killing one worker after the first result,
+    a client with a wrong authkey having knocked first.
+    """
+    start = perf_counter()
+    total = drain(run_distributed(count_primes, None, batches, slots, local_workers = cores))
+    print(f'{f"workers x{cores}":>14}: {perf_counter() - start:8.3f}s ({total} results)')
+    coordinator = Coordinator(count_primes, None, batches, slots, heartbeat_timeout = 1.)
+    try:
+        Client(coordinator.address, authkey = b'wrong').close()
+        raise AssertionError('the coordinator accepted a wrong authkey')
+    except AuthenticationError:
+        pass  # turned away; the workers below must still be accepted
+    workers = launch_local_workers(coordinator.address, max(cores, 2), heartbeat_interval = .25)
+    start = perf_counter()
+    for _ in coordinator.run():
+        if workers[0].is_alive():
+            workers[0].kill()
+    print(f'{"one killed":>14}: {perf_counter() - start:8.3f}s ({coordinator.get_reassigned()} batches reassigned, '
+          f'{len(coordinator.get_results())}/{batches} batches)')
+    for worker in workers:
+        worker.join()
+
+
+def bench_search(batches: int, slots: int, steps: int = 20):
+    """
+    Time-to-first-result of a search whose only hit is in batch 1:  exhaustive, stopping on the first match, and
+    stopping on the first match with functions that check their CancellationToken between steps.
+    """
+    hit = (1, slots // 2)
+
+    def probe(batch: int, slot: int, token: CancellationToken = None) -> Union[str, None]:
+        for step in range(steps):
+            if token is not None and token.is_cancelled():
+                return None
+            if (batch, slot) == hit and step == steps // 4:
+                return 'hit'
+            sleep(.001)
+        return None
+
+    def timed(**options) -> Tuple[float, float]:
+        start = perf_counter()
+        first = 0.
+        generator = run_parallel(probe, None, batches, slots, yield_to_monitor = False, persistent_workers = True,
+                                 **options)
+        try:
+            while True:
+                _, phase, _ = next(generator)
+                if phase == RPP.BATCH_RESULT and not first:
+                    first = perf_counter() - start
+        except StopIteration:
+            return first, perf_counter() - start
+
+    for name, options in (('exhaustive', {}),
+                          ('stop on match', {'stop_on_match': bool}),
+                          ('cancellable', {'stop_on_match': bool, 'cancellable': True})):
+        first, done = timed(**options)
+        print(f'{name:>14}: first result {first * 1e3:8.1f} ms, done {done * 1e3:8.1f} ms ({batches} batches)')
+
+
+def bench_locks(operations: int, threads: int):
+    """
+    Compare the cost of "with" blocks on the legacy Mutex/Locker wrappers and the lock layer, alone and contended.
+    """
+    legacy = Locker()
+    bare = make_lock()
+    counted = ContentionLock()
+    rw = RWLock()
+
+    def mutex_block():
+        with Mutex(legacy):
+            pass
+
+    def locker_block():
+        with legacy:
+            pass
+
+    def bare_block():
+        with bare:
+            pass
+
+    def counted_block():
+        with counted:
+            pass
+
+    def read_block():
+        with rw.reading:
+            pass
+
+    def write_block():
+        with rw.writing:
+            pass
+
+    def timed(block: Callable[[], None], workers: int) -> float:
+        def work():
+            for _ in range(operations):
+                block()
+
+        pool = [Thread(target = work) for _ in range(workers)]
+        start = perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return operations * workers / (perf_counter() - start)
+
+    print(f'{"":>18}{"1 thread":>14}{f"{threads} threads":>14}  (blocks/s)')
+    for name, block in (('Mutex(Locker)', mutex_block), ('Locker', locker_block), ('make_lock()', bare_block),
+                        ('ContentionLock', counted_block), ('RWLock.reading', read_block),
+                        ('RWLock.writing', write_block)):
+        print(f'{name:>18}{timed(block, 1):14.0f}{timed(block, threads):14.0f}')
+    stats = counted.stats()
+    print(f'ContentionLock: {stats.acquisitions} acquisitions, {stats.contended} contended, '
+          f'{stats.wait_ns / 1e6:.1f} ms waiting, {stats.hold_ns / 1e6:.1f} ms held')
+
+
+def _draw_ids(ids: LeasedIDs, count: int):
+    """ Draw count IDs in a process of bench_ids(). """
+    for _ in range(count):
+        ids.next_id()
+
+
+def bench_ids(count: int, threads: int, cores: int):
+    """
+    Compare ID throughput of the locking IDs and Fregu with LeasedIDs as threads are added,
+    then LeasedIDs over a SharedIDSource as processes are added.
+    """
+    def timed(draw: Callable[[], int], workers: int) -> float:
+        def work():
+            for _ in range(count):
+                draw()
+
+        pool = [Thread(target = work) for _ in range(workers)]
+        start = perf_counter()
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return count * workers / (perf_counter() - start)
+
+    counts = sorted({1, 2, 4, threads})
+    print(f'{"threads":>14}' + ''.join(f'{n:>12}' for n in counts) + '  (IDs/s)')
+    for name, make in (('IDs', lambda: IDs().next_id), ('Fregu', lambda: Fregu().run),
+                       ('LeasedIDs', lambda: LeasedIDs().next_id)):
+        print(f'{name:>14}' + ''.join(f'{timed(make(), n):12.0f}' for n in counts))
+    source = SharedIDSource()
+    ids = LeasedIDs(source = source)
+    print(f'{"processes":>14}' + ''.join(f'{n:>12}' for n in range(1, cores + 1)))
+    rates = []
+    for n in range(1, cores + 1):
+        pool = [Process(target = _draw_ids, args = (ids, count)) for _ in range(n)]
+        start = perf_counter()
+        for process in pool:
+            process.start()
+        for process in pool:
+            process.join()
+        rates.append(count * n / (perf_counter() - start))
+    print(f'{"shared leases":>14}' + ''.join(f'{rate:12.0f}' for rate in rates))
+    source.unlink()
+
+
+def bench_shared(batches: int, slots: int, cores: int):
+    """
+    Compare returning large arrays from processes by pickling with returning them through shared memory.
+    """
+    def timed(backend) -> Tuple[float, int]:
+        start = perf_counter()
+        generator = run_parallel(numbers, None, batches, slots, yield_to_monitor = False, backend = backend)
+        checksum = 0
+        try:
+            while True:
+                obj, phase, _ = next(generator)
+                if phase == RPP.BATCH_RESULT:
+                    checksum += sum(memoryview(obj.get(slot)).cast('B').cast('q')[-1] for slot in range(slots))
+        except StopIteration:
+            return perf_counter() - start, checksum
+
+    megabytes = batches * slots * 200_000 * 8 / 1e6
+    for name, backend in (('pickled', ProcessBackend(cores)), ('shared bytes', SharedMemoryBackend(2 << 20, cores)),
+                          ('shared views', SharedMemoryBackend(2 << 20, cores, views = True))):
+        elapsed, checksum = timed(backend)
+        print(f'{name:>14}: {elapsed:8.3f}s  {megabytes / elapsed:8.1f} MB/s  (checksum {checksum})')
+
+
+def bench_autotune(batches: int, best: int, limit: int):
+    """
+    Autotune the slots of a workload that thrashes beyond best concurrent slots:  each slot waits 10 ms,
+    stretched by the square of how far the slots running at once exceed best.
+    """
+    running = [0]
+    guard = Lock()
+
+    def thrashing(batch: int, slot: int) -> int:
+        with guard:
+            running[0] += 1
+            crowd = running[0]
+        sleep(.01 * max(1., crowd / best) ** 2)
+        with guard:
+            running[0] -= 1
+        return slot
+
+    for start in 1, limit:
+        began = perf_counter()
+        generator = run_parallel(thrashing, None, batches, start, yield_to_monitor = False, persistent_workers = True,
+                                 autotune_slots = limit)
+        try:
+            while True:
+                next(generator)
+        except StopIteration as conclusion:
+            tuner = conclusion.value[0].get_slot_autotuner()
+        print(f'starting at {start} slots ({perf_counter() - began:.2f}s):')
+        print(tuner.report(), end = '\n\n')
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'pool': lambda a: bench_pool(a.batches, a.slots, a.repeat),
+    'backends': lambda a: bench_backends(min(a.batches, 8), a.slots, a.cores),
+    'latency': lambda a: bench_latency(min(a.batches, 100), a.slots),
+    'contention': lambda a: bench_contention(max(a.slots, 64), a.batches),
+    'stealing': lambda a: bench_stealing(min(a.batches, 200), a.slots),
+    'async': lambda a: bench_async(max(a.slots, 10_000)),
+    'profile': lambda a: bench_profile(min(a.batches, 500), a.slots),
+    'chunks': lambda a: bench_chunks(min(a.batches, 100), max(a.slots, 1_000)),
+    'search': lambda a: bench_search(min(a.batches, 100), a.slots),
+    'locks': lambda a: bench_locks(a.batches * 100, a.slots),
+    'ids': lambda a: bench_ids(a.batches * 1_000, a.slots, a.cores),
+    'shared': lambda a: bench_shared(min(a.batches, 50), a.slots, a.cores),
+    'autotune': lambda a: bench_autotune(min(a.batches, 60), a.slots, a.slots * 16),
+    'distributed': lambda a: bench_distributed(min(a.batches, 8), a.slots, a.cores),
+}
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description = __doc__)
+    parser.add_argument('name', choices = sorted(BENCHMARKS))
+    parser.add_argument('--batches', type = int, default = 1_000)
+    parser.add_argument('--slots', type = int, default = 8)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--cores', type = int, default = cpu_count() or 1)
+    arguments = parser.parse_args()
+    BENCHMARKS[arguments.name](arguments)
@@ -7,4 +7,13 @@ It operates on similar principles to quantum computers.
 
 from .core import *
 from .ids import *
+from .pool import *
+from .backends import *
+from .results import *
+from .scheduling import *
+from .asynchronous import *
+from .instrumentation import *
+from .cancellation import *
+from .tuning import *
+from .distributed import *
 from .multithreading import *
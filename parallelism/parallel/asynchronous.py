@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+from asyncio import Semaphore, create_task, gather, iscoroutinefunction, to_thread
+from typing import Any, AsyncIterator, Callable, Dict, Tuple, Union
+
+from parallel.core import BatchExecutionOrder, RPP
+from parallel.results import SlotResults
+
+
+async def call_async(fxn: Union[Callable[[int, int], Any], None], batch: int, slot: int) -> Any:
+    """
+    Await fxn(batch, slot) if fxn is a coroutine function, else run it on a thread so the event loop is not blocked.
+    :param fxn: coroutine function, plain callable or None
+    :param batch: positive int
+    :param slot: positive int
+    :return: its result (None if there is no fxn)
+    """
+    if fxn is None:
+        return None
+    if iscoroutinefunction(fxn):
+        return await fxn(batch, slot)
+    return await to_thread(fxn, batch, slot)
+
+
+class AsyncParallelism:
+    """
+    The asyncio counterpart of Parallelism():  every slot of a batch is a task on one event loop.
+    At most concurrency slots run their function at once.
+    """
+    _fxn: Union[Callable[[int, int], Any], None]
+    _fxn_end: Union[Callable[[int, int], Any], None]
+    _batches: int
+    _slots: int
+    _semaphore: Union[Semaphore, None]
+    _concurrency: int
+    _current_batch: int
+    _current_batch_results_ref: SlotResults
+    _results: Dict[int, Dict[int, Any]]  # results[batch][slot] = <result of call>
+
+    def __init__(self, fxn: Callable[[int, int], Any], fxn_end: Callable[[int, int], Any],
+                 batches: int, slots: int, concurrency: int = None):
+        """
+        :param fxn: coroutine function or plain callable accepting two integers
+        :param fxn_end: coroutine function, plain callable or None, called for each slot after its batch
+        :param batches: natural number
+        :param slots: natural number
+        :param concurrency: natural number or None for all slots at once
+        """
+        self._fxn = fxn
+        self._fxn_end = fxn_end
+        self._batches = batches
+        self._slots = slots
+        self._concurrency = concurrency or slots
+        self._semaphore = None  # made on the loop that runs the batches
+        self._current_batch = 0
+        self._current_batch_results_ref = SlotResults(0)
+        self._results = {}
+
+    def get_batches(self) -> int:
+        return self._batches
+
+    def get_slots(self) -> int:
+        return self._slots
+
+    def get_concurrency(self) -> int:
+        return self._concurrency
+
+    def get_current_batch(self) -> int:
+        return self._current_batch
+
+    def get(self, slot: int):
+        """
+        Return the result of a slot of the current batch, or 0 if it has none (yet).
+        :param slot: positive int
+        :return: result
+        """
+        return self._current_batch_results_ref.get(slot, 0)
+
+    async def _run_slot(self, batch: int, slot: int):
+        """ Invoke the function for one slot under the concurrency limit and keep its result. """
+        async with self._semaphore:
+            result = await call_async(self._fxn, batch, slot)
+        if result is not None:
+            self._current_batch_results_ref.put(slot, result)
+
+    def start_batch(self, batch: int) -> list:
+        """
+        Create the tasks running every slot of batch.
+        :param batch: positive int
+        :return: list of tasks
+        """
+        if self._semaphore is None:
+            self._semaphore = Semaphore(self._concurrency)
+        self._current_batch = batch
+        self._current_batch_results_ref = cells = SlotResults(self._slots)
+        self._results[batch] = cells
+        return [create_task(self._run_slot(batch, slot)) for slot in range(self._slots)]
+
+    async def finish_batch(self, tasks: list) -> int:
+        """
+        Await the tasks of the current batch, end every slot and keep the results.
+        :param tasks: from start_batch()
+        :return: number of results
+        """
+        await gather(*tasks)
+        batch = self._current_batch
+        if self._fxn_end is not None:
+            await gather(*(call_async(self._fxn_end, batch, slot) for slot in range(self._slots)))
+        results = self._current_batch_results_ref.snapshot()
+        if results:
+            self._results[batch] = results
+        else:
+            del self._results[batch]
+        return len(results)
+
+
+async def run_parallel_async(
+        fxn: Callable[[int, int], Any], fxn_end: Callable[[int, int], Any],
+        batches: int = 1, slots: int = 1,
+        batch_order: BatchExecutionOrder = None,
+        yield_to_monitor: bool = True,
+        concurrency: int = None
+) -> AsyncIterator[Tuple[AsyncParallelism, RPP, int]]:
+    """
+    The asyncio counterpart of run_parallel(), for I/O-bound functions:  iterate it with "async for".
+    Coroutine functions are awaited; plain callables are run on threads.
+    It yields the same RunParallelPhases events; since an async generator can not return, the last event is
+    RPP.CONCLUSION with the total number of results.
+    """
+    if batches <= 0 or slots <= 0:
+        yield None, RPP.BATCH_SLOT_ERROR, 0
+        yield None, RPP.CONCLUSION, 0
+        return
+    obj = AsyncParallelism(fxn, fxn_end, batches, slots, concurrency)
+    if batch_order is None:
+        batch_order = BatchExecutionOrder(range(batches), batches)
+    total: int = 0
+    a: int = 0
+    while not batch_order.is_quota_meet():
+        tasks = obj.start_batch(batch_order.full_next())
+        if yield_to_monitor:
+            yield obj, RPP.MONITORING, a
+        a = await obj.finish_batch(tasks)
+        if a > 0:
+            yield obj, RPP.BATCH_RESULT, a
+            total += a
+    yield obj, RPP.CONCLUSION, total
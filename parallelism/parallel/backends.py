@@ -0,0 +1,340 @@
+#!/usr/bin/python3
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from os import cpu_count
+from pickle import dumps, PicklingError
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+from parallel.pool import WorkerPool
+from parallel.results import SharedResultChannel, shared_ref, write_shared
+
+
+def is_picklable(obj: Any) -> bool:
+    """
+    Indicate whether obj can be sent to another process.
+    Lambdas, closures and bound methods of unpicklable objects can not.
+    :param obj: anything
+    :return: bool picklable
+    """
+    try:
+        dumps(obj)
+        return True
+    except (PicklingError, AttributeError, TypeError):
+        return False
+
+
+def run_each(fxn: Callable[[int, int], Any], batch: int, slots: range) -> List[Any]:
+    """
+    Call fxn for every slot of a chunk.  It is defined at module level so a chunk can be shipped to a process.
+    :param fxn: Callable accepting two integers
+    :param batch: positive int
+    :param slots: range of slots
+    :return: the results, in the order of slots
+    """
+    return [fxn(batch, slot) for slot in slots]
+
+
+class ExecutionBackend:
+    """
+    Decide where and how the slots of a batch are executed for Parallelism().
+    The batch choreography (ready, go, invoke, stop, end) stays in Parallelism; a backend only places it.
+    """
+
+    def accepts(self, runner: 'Runner') -> bool:
+        """
+        Indicate whether this backend is able to execute runner.
+        :param runner: a Runner instance
+        :return: bool acceptable
+        """
+        return True
+
+    def prepare(self, slots: int):
+        """
+        Acquire whatever is needed to run slots slots at once.
+        This may be called again after shutdown().
+        :param slots: natural number
+        :return:
+        """
+        return
+
+    def launch(self, owner: 'Parallelism', batch: int, slot: int):
+        """
+        Start one slot of a batch.  The slot must call owner.ready_slot() before launch() returns or soon after.
+        :param owner: the Parallelism instance
+        :param batch: positive int
+        :param slot: positive int
+        :return:
+        """
+        raise NotImplementedError
+
+    def invoke(self, runner: 'Runner', batch: int, slot: int, token: 'CancellationToken' = None) -> Any:
+        """
+        Compute the result of one slot.
+        :param runner: a Runner instance
+        :param batch: positive int
+        :param slot: positive int
+        :param token: a CancellationToken instance offered to the runner, or None
+        :return: the result of runner.run(batch, slot)
+        """
+        if token is None:
+            return runner.run(batch, slot)
+        return runner.run_cancellable(batch, slot, token)
+
+    def invoke_chunk(self, runner: 'Runner', batch: int, slots: range,
+                     token: 'CancellationToken' = None) -> Sequence[Any]:
+        """
+        Compute the results of a chunk of slots.
+        :param runner: a Runner instance
+        :param batch: positive int
+        :param slots: range of slots
+        :param token: a CancellationToken instance offered to the runner, or None
+        :return: the result of runner.run_chunk(batch, slots)
+        """
+        if token is None:
+            return runner.run_chunk(batch, slots)
+        return runner.run_chunk_cancellable(batch, slots, token)
+
+    def tell_go(self):
+        """ Called right after the go signal is given. """
+        return
+
+    def tell_stop(self):
+        """ Called right after the stop signal is given. """
+        return
+
+    def shutdown(self):
+        """ Release whatever prepare() acquired. """
+        return
+
+
+class ThreadBackend(ExecutionBackend):
+    """
+    Spawn a new thread per slot per batch.
+    """
+
+    def launch(self, owner: 'Parallelism', batch: int, slot: int):
+        Thread(target = owner.run_slot, args = (batch, slot)).start()
+
+
+class PooledThreadBackend(ExecutionBackend):
+    """
+    Run the slots on a WorkerPool of long-lived threads.
+    A pool given by the caller is grown but never shut down by this backend.
+    """
+    _pool: Union[WorkerPool, None]
+    _owns_pool: bool
+
+    def __init__(self, pool: WorkerPool = None):
+        """
+        :param pool: a WorkerPool instance or None to create one when prepared
+        """
+        self._pool = pool
+        self._owns_pool = pool is None
+
+    @property
+    def pool(self) -> Union[WorkerPool, None]:
+        return self._pool
+
+    def prepare(self, slots: int):
+        if self._pool is None or not self._pool.is_running():
+            self._pool = WorkerPool(slots)
+            self._owns_pool = True
+        else:
+            self._pool.ensure_workers(slots)
+
+    def launch(self, owner: 'Parallelism', batch: int, slot: int):
+        self._pool.submit(owner.run_slot, batch, slot)
+
+    def shutdown(self):
+        if self._owns_pool and self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class ProcessBackend(PooledThreadBackend):
+    """
+    Compute every slot in a pool of processes so CPU-bound runners are not serialized by the GIL.
+    The choreography of each slot stays on a pooled thread of this process; only Runner.fxn is shipped out.
+    Runner.fxn (or ChunkRunner.fxn_chunk) and its results must therefore be picklable.
+    Runner.fxn_end is still called in this process.
+    A CancellationToken can not reach another process, so runners taking one are not accepted.
+    What a slot raises in its process is raised again by invoke() and counted as that slot's failure.  Should a
+    process die, breaking the pool, the slots it takes down fail and an owned pool is replaced for the next ones.
+    """
+    _executor: Union[Executor, None]
+    _owns_executor: bool
+    _processes: int
+    _renewal: Lock
+
+    def __init__(self, processes: int = None, executor: Executor = None, pool: WorkerPool = None):
+        """
+        :param processes: natural number of processes; None means one per CPU
+        :param executor: an Executor to submit to instead of creating a ProcessPoolExecutor
+        :param pool: a WorkerPool instance for the slot threads or None
+        """
+        PooledThreadBackend.__init__(self, pool)
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._processes = processes or cpu_count() or 1
+        self._renewal = Lock()
+
+    def get_processes(self) -> int:
+        """
+        Return the number of processes used when this backend creates its own executor.
+        :return: natural number
+        """
+        return self._processes
+
+    def accepts(self, runner: 'Runner') -> bool:
+        if runner.takes_token:
+            return False
+        return all(fxn is None or is_picklable(fxn) for fxn in (runner.fxn, runner.fxn_chunk))
+
+    def prepare(self, slots: int):
+        PooledThreadBackend.prepare(self, slots)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self._processes)
+            self._owns_executor = True
+
+    def _call(self, fxn: Callable, *args) -> Any:
+        """
+        Run fxn(*args) in the pool of processes and return its result, raising what it raised.
+        :param fxn: picklable Callable
+        :return: its result
+        """
+        executor = self._executor
+        try:
+            return executor.submit(fxn, *args).result()
+        except BrokenProcessPool:
+            self._renew(executor)
+            raise
+
+    def _renew(self, broken: Executor):
+        """ Replace a broken pool of processes this backend owns, once, whichever slot notices first. """
+        with self._renewal:
+            if self._owns_executor and self._executor is broken:
+                broken.shutdown(wait = False)
+                self._executor = ProcessPoolExecutor(self._processes)
+
+    def invoke(self, runner: 'Runner', batch: int, slot: int, token: 'CancellationToken' = None) -> Any:
+        if runner.fxn is None:
+            return self.invoke_chunk(runner, batch, range(slot, slot + 1))[0]
+        return self._call(runner.fxn, batch, slot)
+
+    def invoke_chunk(self, runner: 'Runner', batch: int, slots: range,
+                     token: 'CancellationToken' = None) -> Sequence[Any]:
+        if runner.fxn_chunk is not None:
+            return self._call(runner.fxn_chunk, batch, slots)
+        if runner.fxn is not None:
+            return self._call(run_each, runner.fxn, batch, slots)
+        return [None] * len(slots)
+
+    def shutdown(self):
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        PooledThreadBackend.shutdown(self)
+
+
+class SharedMemoryBackend(ProcessBackend):
+    """
+    A ProcessBackend whose slots return buffer-like results (array.array, bytes, numpy arrays...) through shared
+    memory:  each slot writes into a preallocated region, reused batch after batch, and the result is read back as
+    bytes, without pickling.  With views, it is read as a zero-copy memoryview instead (see SharedResultChannel).
+    Other results, results larger than slot_bytes and chunked runs go through pickling.
+    """
+    _channel: SharedResultChannel
+    _batch: Union[int, None]
+    _slots: int
+
+    def __init__(self, slot_bytes: int = 1 << 20, processes: int = None, executor: Executor = None,
+                 pool: WorkerPool = None, views: bool = False):
+        """
+        :param slot_bytes: natural number of bytes reserved per slot
+        :param processes: natural number of processes; None means one per CPU
+        :param executor: an Executor to submit to instead of creating a ProcessPoolExecutor
+        :param pool: a WorkerPool instance for the slot threads or None
+        :param views: hand results over as memoryviews of the shared memory instead of bytes
+        """
+        ProcessBackend.__init__(self, processes, executor, pool)
+        self._channel = SharedResultChannel(slot_bytes, views)
+        self._batch = None
+        self._slots = 0
+
+    def prepare(self, slots: int):
+        ProcessBackend.prepare(self, slots)
+        self._slots = slots
+
+    def launch(self, owner: 'Parallelism', batch: int, slot: int):
+        if batch != self._batch:  # the previous batch has ended, so its regions have been read
+            self._batch = batch
+            self._channel.open_batch(self._slots)
+        ProcessBackend.launch(self, owner, batch, slot)
+
+    def invoke(self, runner: 'Runner', batch: int, slot: int, token: 'CancellationToken' = None) -> Any:
+        if runner.fxn is None:
+            return ProcessBackend.invoke(self, runner, batch, slot, token)
+        name, offset, size = self._channel.region(slot)
+        result = self._call(write_shared, runner.fxn, name, offset, size, batch, slot)
+        if isinstance(result, shared_ref):
+            return self._channel.read(slot, result)
+        return result
+
+    def shutdown(self):
+        self._channel.close_batch()
+        self._batch = None
+        ProcessBackend.shutdown(self)
+
+
+class InlineBackend(ExecutionBackend):
+    """
+    Run every slot serially in the thread driving Parallelism.  Meant for debugging.
+    Slots are invoked when the go signal is given and ended when the stop signal is given.
+    """
+    _owner: Union['Parallelism', None]
+    _pending: List[Tuple[int, int]]
+
+    def __init__(self):
+        self._owner = None
+        self._pending = []
+
+    def launch(self, owner: 'Parallelism', batch: int, slot: int):
+        self._owner = owner
+        self._pending.append((batch, slot))
+        owner.ready_slot(batch, slot)
+
+    def tell_go(self):
+        for batch, slot in self._pending:
+            self._owner.invoke_slot(batch, slot)
+
+    def tell_stop(self):
+        for batch, slot in self._pending:
+            self._owner.end_slot(batch, slot)
+        self._pending.clear()
+
+    def shutdown(self):
+        self._owner = None
+        self._pending.clear()
+
+
+BACKENDS: Dict[str, Callable[[], ExecutionBackend]] = {
+    'threads': ThreadBackend,
+    'pool': PooledThreadBackend,
+    'processes': ProcessBackend,
+    'shared': SharedMemoryBackend,
+    'inline': InlineBackend,
+}
+
+
+def make_backend(backend: Union[str, ExecutionBackend, None]) -> ExecutionBackend:
+    """
+    Resolve a backend name (see BACKENDS) to a new instance.  Instances are returned as is; None gives threads.
+    :param backend: name, ExecutionBackend instance or None
+    :return: an ExecutionBackend instance
+    """
+    if backend is None:
+        return ThreadBackend()
+    if isinstance(backend, ExecutionBackend):
+        return backend
+    return BACKENDS[backend]()
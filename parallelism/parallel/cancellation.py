@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+from threading import Event
+from time import monotonic
+from typing import Union
+
+
+class CancellationToken:
+    """
+    Tell a running function whether it should give up:  cooperative cancellation with an optional deadline.
+    A token derived with child() shares the cancellation of its origin and adds its own deadline (never later than
+    the origin's), so cancelling any token of a family cancels all of them, while a deadline only concerns the
+    token that set it and those derived from it.
+    """
+    __slots__ = ('_event', '_deadline')
+    _event: Event
+    _deadline: Union[float, None]  # monotonic() time
+
+    def __init__(self, timeout: float = None, _event: Event = None, _deadline: float = None):
+        """
+        :param timeout: seconds from now after which the token counts as cancelled, or None for no deadline
+        """
+        self._event = Event() if _event is None else _event
+        if timeout is not None:
+            deadline = monotonic() + timeout
+            _deadline = deadline if _deadline is None else min(deadline, _deadline)
+        self._deadline = _deadline
+
+    def child(self, timeout: float = None) -> 'CancellationToken':
+        """
+        Derive a token cancelled with this one, or once timeout seconds have passed.
+        :param timeout: seconds or None to keep this token's deadline
+        :return: a CancellationToken instance (this one if there is nothing to add)
+        """
+        if timeout is None:
+            return self
+        return CancellationToken(timeout, self._event, self._deadline)
+
+    def cancel(self):
+        """
+        Cancel this token and every token of its family.
+        :return:
+        """
+        self._event.set()
+
+    def is_cancelled(self) -> bool:
+        """
+        Indicate whether the function should give up, for it was cancelled or its deadline passed.
+        :return: bool cancelled
+        """
+        return self._event.is_set() or (self._deadline is not None and monotonic() >= self._deadline)
+
+    def has_expired(self) -> bool:
+        """
+        Indicate whether the deadline has passed (as opposed to an explicit cancellation).
+        :return: bool expired
+        """
+        return self._deadline is not None and monotonic() >= self._deadline
+
+    def remaining(self) -> Union[float, None]:
+        """
+        Return the seconds left before the deadline (at least 0), or None if there is none.
+        :return: float or None
+        """
+        if self._deadline is None:
+            return None
+        return max(self._deadline - monotonic(), 0.)
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Block until this token is cancelled, its deadline passes or timeout seconds have passed.
+        It is a cancellable sleep for functions that wait.
+        :param timeout: seconds or None to wait indefinitely
+        :return: bool cancelled
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        self._event.wait(timeout)
+        return self.is_cancelled()
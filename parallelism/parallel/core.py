@@ -1,12 +1,20 @@
 #!/usr/bin/python3
-from typing import List, Tuple, Dict, Callable, Any, Iterable, ItemsView, Union
+from typing import List, Tuple, Dict, Callable, Any, Iterable, ItemsView, Sequence, Union
 from enum import IntEnum, unique
 
 from parallel.multithreading import *
 from parallel.ids import *
-
-from threading import Event
-from time import sleep
+from parallel.pool import *
+from parallel.backends import *
+from parallel.results import *
+from parallel.instrumentation import *
+from parallel.cancellation import *
+from parallel.tuning import *
+
+from math import ceil
+from os import cpu_count
+from threading import Condition, Event
+from time import perf_counter_ns, sleep
 
 _calculation_phase_ids: IdSmugglerBase = IdSmugglerBase()
 
@@ -82,7 +90,7 @@ class Runner:
         :param slot: positive int
         :return:
         """
-        if isinstance(self._start_this_, Callable):
+        if callable(self._start_this_):
             return self._start_this_(batch, slot)
 
     def end(self, batch: int, slot: int) -> Any:
@@ -93,17 +101,172 @@ class Runner:
         :param slot: positive int
         :return:
         """
-        if isinstance(self._ask_to_stop, Callable):
+        if callable(self._ask_to_stop):
             return self._ask_to_stop(batch, slot)
 
     @property
     def fxn(self) -> Callable[[int, int], Any]:
         return self._start_this_
 
+    def run_chunk(self, batch: int, slots: range) -> Sequence[Any]:
+        """
+        Call the fxn loaded for a contiguous range of slots.
+        This is typically only invoked by the parallelism machinery, in chunked mode.
+        :param batch: positive int
+        :param slots: range of slots
+        :return: the results, in the order of slots
+        """
+        run = self._start_this_
+        if callable(run):
+            return [run(batch, slot) for slot in slots]
+        return [None] * len(slots)
+
+    def run_cancellable(self, batch: int, slot: int, token: CancellationToken) -> Any:
+        """
+        Call the fxn loaded, offering it a CancellationToken.  A plain Runner does not pass it on.
+        This is typically only invoked by the parallelism machinery.
+        :param batch: positive int
+        :param slot: positive int
+        :param token: a CancellationToken instance
+        :return:
+        """
+        return self.run(batch, slot)
+
+    def run_chunk_cancellable(self, batch: int, slots: range, token: CancellationToken) -> Sequence[Any]:
+        """
+        Call the fxn loaded for a contiguous range of slots, offering it a CancellationToken.
+        This is typically only invoked by the parallelism machinery, in chunked mode.
+        :param batch: positive int
+        :param slots: range of slots
+        :param token: a CancellationToken instance
+        :return: the results, in the order of slots
+        """
+        return self.run_chunk(batch, slots)
+
+    @property
+    def takes_token(self) -> bool:
+        return False
+
     @property
     def fxn_end(self) -> Callable[[int, int], Any]:
         return self._ask_to_stop
 
+    @property
+    def fxn_chunk(self) -> Union[Callable[[int, range], Sequence[Any]], None]:
+        return None
+
+
+class ChunkRunner(Runner):
+    """
+    Provide a standard for executing a vectorized function:  one call computes a contiguous range of slots.
+    """
+    _run_chunk_: Callable[[int, range], Sequence[Any]]  # batch number, range of slot numbers
+
+    def __init__(self,
+                 fxn_chunk: Callable[[int, range], Sequence[Any]] = None,
+                 end: Callable[[int, int], Any] = None):
+        """
+        Load a vectorized function to be executed on parallel.
+        :param fxn_chunk: Callable accepting an integer and a range.
+        :param end: Callable accepting two integers.
+        When called, fxn_chunk receives the batch number (an int) and a range of slot numbers;
+        it returns a sequence of results, one per slot in that range, in order (None for no result).
+        """
+        Runner.__init__(self, None, end)
+        self._run_chunk_ = fxn_chunk
+
+    def run(self, batch: int, slot: int) -> Any:
+        if callable(self._run_chunk_):
+            return self._run_chunk_(batch, range(slot, slot + 1))[0]
+
+    def run_chunk(self, batch: int, slots: range) -> Sequence[Any]:
+        if callable(self._run_chunk_):
+            return self._run_chunk_(batch, slots)
+        return [None] * len(slots)
+
+    @property
+    def fxn_chunk(self) -> Callable[[int, range], Sequence[Any]]:
+        return self._run_chunk_
+
+
+class CancellableRunner(Runner):
+    """
+    Provide a standard for executing functions that cooperate with cancellation:  they receive a CancellationToken
+    and are expected to check it (or wait on it) and return early once it is cancelled.
+    """
+
+    def __init__(self,
+                 fxn: Callable[[int, int, CancellationToken], Any] = None,
+                 end: Callable[[int, int], Any] = None):
+        """
+        Load a cancellable function to be executed on parallel.
+        :param fxn: Callable accepting two integers and a CancellationToken.
+        :param end: Callable accepting two integers.
+        When called, fxn receives the batch number (an int), the slot number (int) and a CancellationToken.
+        """
+        Runner.__init__(self, fxn, end)
+
+    def run(self, batch: int, slot: int) -> Any:
+        return self.run_cancellable(batch, slot, CancellationToken())
+
+    def run_cancellable(self, batch: int, slot: int, token: CancellationToken) -> Any:
+        if callable(self._start_this_):
+            return self._start_this_(batch, slot, token)
+
+    def run_chunk(self, batch: int, slots: range) -> Sequence[Any]:
+        return self.run_chunk_cancellable(batch, slots, CancellationToken())
+
+    def run_chunk_cancellable(self, batch: int, slots: range, token: CancellationToken) -> Sequence[Any]:
+        run = self._start_this_
+        results = [None] * len(slots)
+        if callable(run):
+            for i, slot in enumerate(slots):
+                if token.is_cancelled():
+                    break
+                results[i] = run(batch, slot, token)
+        return results
+
+    @property
+    def takes_token(self) -> bool:
+        return True
+
+
+class CancellableChunkRunner(ChunkRunner):
+    """
+    Provide a standard for executing a vectorized function that cooperates with cancellation:  one call computes a
+    contiguous range of slots and receives the CancellationToken of its chunk.
+    """
+
+    def __init__(self,
+                 fxn_chunk: Callable[[int, range, CancellationToken], Sequence[Any]] = None,
+                 end: Callable[[int, int], Any] = None):
+        """
+        Load a cancellable vectorized function to be executed on parallel.
+        :param fxn_chunk: Callable accepting an integer, a range and a CancellationToken.
+        :param end: Callable accepting two integers.
+        When called, fxn_chunk receives the batch number (an int), a range of slot numbers and a CancellationToken;
+        it returns a sequence of results, one per slot in that range, in order (None for no result).
+        """
+        ChunkRunner.__init__(self, fxn_chunk, end)
+
+    def run(self, batch: int, slot: int) -> Any:
+        return self.run_chunk(batch, range(slot, slot + 1))[0]
+
+    def run_cancellable(self, batch: int, slot: int, token: CancellationToken) -> Any:
+        return self.run_chunk_cancellable(batch, range(slot, slot + 1), token)[0]
+
+    def run_chunk(self, batch: int, slots: range) -> Sequence[Any]:
+        return self.run_chunk_cancellable(batch, slots, CancellationToken())
+
+    def run_chunk_cancellable(self, batch: int, slots: range, token: CancellationToken) -> Sequence[Any]:
+        if callable(self._run_chunk_):
+            return self._run_chunk_(batch, slots, token)
+        return [None] * len(slots)
+
+    @property
+    def takes_token(self) -> bool:
+        return True
+
 
 class Cycle:
     """
@@ -261,16 +424,50 @@ class Parallelism:
         Progress the current phase one forward.
         :return:
         """
-        self._phase = self._phase.next_phase()
+        self._enter_phase(self._phase.next_phase())
+
+    def _enter_phase(self, phase: CalculationPhases):
+        """
+        Move to the given phase, recording the transition if profiling.
+        :param phase: CalculationPhases
+        :return:
+        """
+        self._phase = phase
+        if self._profiler is not None:
+            self._profiler.phase(self._current_batch, phase)
 
     def __init__(self, start_now: bool = True):
         """
         Create an instance of an executor.  Call start() if start_now.
         """
         self._phase = CalculationPhases.start()
+        self._profiler = None
+        self._current_batch = 0
         if start_now:
             self.start()
 
+    _profiler: Union[PhaseProfiler, None]
+
+    def set_profiler(self, profiler: Union[PhaseProfiler, None]) -> bool:
+        """
+        Record the timing of every phase transition and slot stage in profiler, or stop recording if None.
+        Phase: Any
+        :param profiler: a PhaseProfiler instance or None
+        :return: successfully assigned or not
+        """
+        self._profiler = profiler
+        if profiler is not None:
+            profiler.phase(self._current_batch, self._phase)
+        return True
+
+    def get_profiler(self) -> Union[PhaseProfiler, None]:
+        """
+        Return the profiler recording this executor, if any.
+        Phase: Any
+        :return: a PhaseProfiler instance or None
+        """
+        return self._profiler
+
     # CalculationPhases.INITIALISE
 
     _batches: int  # how many grouped launches to execute in succession
@@ -287,6 +484,21 @@ class Parallelism:
             self._batches = 0
             self._slots = 0
             self._results = dict()
+            self._backend = ThreadBackend()
+            self._result_sink = None
+            self._checkpoint = None
+            self._restored = 0
+            self._cancel = self._batch_token = CancellationToken()
+            self._slot_timeout = self._batch_timeout = None
+            self._match_predicate = None
+            self._match = None
+            self._timed_out = self._skipped = 0
+            self._failures = []
+            self._tuner = None
+            self._batch_began = self._batch_ended = 0
+            self._chunk_size = 1
+            self._chunk_auto = False
+            self._chunk_target_ns = 1_000_000
             self._advance_phase()
             return True
         return False
@@ -352,12 +564,7 @@ class Parallelism:
     _signal_go: Event  # tell all threads go
     _signal_stop: Event  # ask all threads to stop
 
-    _number_threads_started_lock: Locker
-    _number_threads_stopped_lock: Locker
-    _number_threads_stopped2_lock: Locker
-
-    _read_write_lock: Locker
-    _monitoring_lock: Locker
+    _progress: Condition  # guards the counters below and announces when one reaches the number of slots
 
     _number_threads_started: int
     _number_threads_stopped: int
@@ -393,6 +600,48 @@ class Parallelism:
         return True
 
     _iter_order: BatchExecutionOrder
+    _backend: ExecutionBackend
+
+    def set_execution_backend(self, backend: Union[str, ExecutionBackend, None]) -> bool:
+        """
+        Choose where the slots are executed: a name from BACKENDS ('threads', 'pool', 'processes', 'inline'),
+        an ExecutionBackend instance, or None for a new thread per slot per batch.
+        The backend is shut down when all batches have been executed.
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param backend: name, ExecutionBackend instance or None
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._backend = make_backend(backend)
+            return True
+        return False
+
+    def get_execution_backend(self) -> ExecutionBackend:
+        """
+        Return the backend executing the slots.
+        Phase: Any
+        :return: an ExecutionBackend instance
+        """
+        return self._backend
+
+    def set_worker_pool(self, pool: Union[WorkerPool, None]) -> bool:
+        """
+        Provide a pool of long-lived workers to run the slots of every batch.
+        If pool is None, a new thread is spawned per slot per batch.
+        The pool is grown to the number of slots but is not shut down by this executor.
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param pool: a WorkerPool instance or None
+        :return: successfully assigned or not
+        """
+        return self.set_execution_backend(None if pool is None else PooledThreadBackend(pool))
+
+    def has_worker_pool(self) -> bool:
+        """
+        Indicate whether the slots run on a pool of workers.
+        Phase: Any
+        :return: bool present
+        """
+        return isinstance(self._backend, PooledThreadBackend)
 
     def set_batch_execution_order(self, order: BatchExecutionOrder) -> bool:
         """
@@ -419,28 +668,270 @@ class Parallelism:
             return self._iter_order is not None
         return True
 
+    _result_sink: Union[ResultStream, ResultSpill, None]
+
+    def set_result_sink(self, sink: Union[ResultStream, ResultSpill, None]) -> bool:
+        """
+        Stream the results of every finished batch to sink instead of keeping them all in memory.
+        Anything with put(batch, results) fits, typically a ResultStream or a ResultSpill.
+        The sink is not closed by this executor.  If sink is None, results are kept for the whole run.
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param sink: a ResultStream, a ResultSpill or None
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._result_sink = sink
+            return True
+        return False
+
+    def has_result_sink(self) -> bool:
+        """
+        Indicate whether results are streamed to a sink.
+        Phase: Any
+        :return: bool present
+        """
+        return self._result_sink is not None
+
+    _checkpoint: Union[Checkpoint, None]
+    _restored: int  # results of batches restored from the checkpoint
+
+    def set_checkpoint(self, checkpoint: Union[Checkpoint, None]) -> bool:
+        """
+        Record every finished batch in checkpoint, and skip the batches it already holds.
+        A skipped batch is not run:  its results are restored from the checkpoint as if it had just finished.
+        The checkpoint is not closed by this executor.
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param checkpoint: a Checkpoint instance or None
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._checkpoint = checkpoint
+            return True
+        return False
+
+    def has_checkpoint(self) -> bool:
+        """
+        Indicate whether finished batches are checkpointed.
+        Phase: Any
+        :return: bool present
+        """
+        return self._checkpoint is not None
+
+    def get_restored_results(self) -> int:
+        """
+        Return the number of results restored from the checkpoint instead of computed.
+        Phase: Any
+        :return: whole number
+        """
+        return self._restored
+
+    _cancel: CancellationToken  # cancels the whole run
+    _batch_token: CancellationToken  # the token of the current batch, derived from _cancel
+    _slot_timeout: Union[float, None]
+    _batch_timeout: Union[float, None]
+    _match_predicate: Union[Callable[[Any], bool], None]
+    _match: Union[Tuple[int, int, Any], None]  # batch, slot, result
+    _timed_out: int  # slots (or chunks) whose result came too late
+    _skipped: int  # slots (or chunks) not invoked for the run was cancelled
+    _failures: List[Tuple[int, int, Exception]]  # batch, slot, what its function raised
+
+    def set_timeouts(self, slot_timeout: float = None, batch_timeout: float = None) -> bool:
+        """
+        Give every slot slot_timeout seconds and every batch batch_timeout seconds (None means no limit).
+        Timeouts are cooperative, since a running function can not be interrupted:  the CancellationToken offered to
+        the function (see CancellableRunner) reports being cancelled at the deadline, slots not yet invoked by then
+        are skipped and a result arriving after the deadline is dropped (see get_timed_out()).
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param slot_timeout: seconds or None
+        :param batch_timeout: seconds or None
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._slot_timeout = slot_timeout
+            self._batch_timeout = batch_timeout
+            return True
+        return False
+
+    def set_stop_on_match(self, predicate: Union[Callable[[Any], bool], None]) -> bool:
+        """
+        Cancel the run as soon as a slot returns a result for which predicate is true.
+        The other slots of that batch are cancelled (see CancellationToken) and the remaining batches are not run.
+        The winning result is get_match().
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param predicate: Callable accepting a result, or None not to stop
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._match_predicate = predicate
+            return True
+        return False
+
+    def cancel(self):
+        """
+        Cancel the run:  the current batch is cancelled (see CancellationToken) and no further batch is started.
+        A monitor may call this once it has spotted what it was looking for.
+        Phase: Any
+        :return:
+        """
+        self._cancel.cancel()
+
+    def is_cancelled(self) -> bool:
+        """
+        Indicate whether the run has been cancelled.
+        Phase: Any
+        :return: bool cancelled
+        """
+        return self._cancel.is_cancelled()
+
+    def get_match(self) -> Union[Tuple[int, int, Any], None]:
+        """
+        Return the first result that matched the predicate of set_stop_on_match(), if any.
+        Phase: Any
+        :return: (batch, slot, result) or None
+        """
+        return self._match
+
+    def get_timed_out(self) -> int:
+        """
+        Return the number of slots (chunks, in chunked mode) whose result was dropped for arriving too late.
+        Phase: Any
+        :return: whole number
+        """
+        return self._timed_out
+
+    def get_failures(self) -> List[Tuple[int, int, Exception]]:
+        """
+        Return what the function (or its end function) raised, as (batch, slot, exception), oldest first.
+        A slot whose function raised has no result; its batch goes on.  In chunked mode, slot is the chunk's index.
+        Phase: Any
+        :return: list
+        """
+        return list(self._failures)
+
+    def get_skipped(self) -> int:
+        """
+        Return the number of slots (chunks, in chunked mode) not invoked because of a cancellation or a timeout.
+        Phase: Any
+        :return: whole number
+        """
+        return self._skipped
+
+    _tuner: Union[SlotAutotuner, None]
+    _batch_began: int  # perf_counter_ns() when the slots of the current batch were told to go, if tuning
+    _batch_ended: int  # perf_counter_ns() when the last of them returned, if tuning
+
+    def set_slot_autotuning(self, maximum: int, minimum: int = 1, samples: int = 2) -> bool:
+        """
+        Adjust the number of slots between batches, hill-climbing toward the highest throughput (slots per second).
+        The number of slots set so far is where the climb starts.  See SlotAutotuner.
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param maximum: natural number, the most slots tried
+        :param minimum: natural number, the fewest slots tried
+        :param samples: natural number of batches measured per setting
+        :return: successfully assigned or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
+            self._tuner = SlotAutotuner(self._slots, maximum, minimum, samples)
+            return True
+        return False
+
+    def get_slot_autotuner(self) -> Union[SlotAutotuner, None]:
+        """
+        Return the tuner of the number of slots, if tuning:  its get_best() is the setting to pin in later runs.
+        Phase: Any
+        :return: a SlotAutotuner instance or None
+        """
+        return self._tuner
+
+    def _retune_slots(self):
+        """
+        Let the tuner pick the number of slots of the next batch from the throughput of this one:  only the time from
+        the go signal to the last slot returning counts, not monitoring or the caller's handling of the events.
+        :return:
+        """
+        slots = self._tuner.record(self._slots, (self._batch_ended - self._batch_began) / 1e9)
+        if slots != self._slots:
+            self._slots = slots
+            self._backend.prepare(slots)
+
+    _chunk_size: int  # slots per unit launched; 1 means not chunked
+    _chunk_auto: bool
+    _chunk_target_ns: int  # desired compute time of one chunk when sized automatically
+    _chunk_compute_ns: int  # compute time of the current batch, measured when sized automatically
+    _units: int  # units (slots or chunks) launched per batch
+
+    def set_chunking(self, chunk_size: int = 0, target_seconds: float = .001) -> bool:
+        """
+        Launch contiguous ranges of chunk_size slots as one unit instead of one unit per slot.
+        Each unit calls Runner.run_chunk() once:  a ChunkRunner's vectorized function gets the whole range,
+        any other Runner has its function called per slot, but without the per-slot launch and signalling.
+        If chunk_size is 0, it is picked automatically:  after every batch, the measured compute time per slot
+        sets it so that a chunk takes about target_seconds (but never fewer chunks than CPUs).
+        Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
+        :param chunk_size: natural number, or 0 for automatic
+        :param target_seconds: desired compute time of one chunk
+        :return: successfully set or not
+        """
+        if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS) and chunk_size >= 0:
+            self._chunk_auto = chunk_size == 0
+            self._chunk_size = max(chunk_size, 1)
+            self._chunk_target_ns = int(target_seconds * 1e9)
+            return True
+        return False
+
+    def get_chunk_size(self) -> int:
+        """
+        Return how many slots are launched as one unit (1 when not chunked).
+        Phase: Any
+        :return: natural number
+        """
+        return self._chunk_size
+
+    def _chunk_slots(self, unit: int) -> range:
+        """
+        Return the slots of a unit in chunked mode.
+        :param unit: positive int
+        :return: range of slots
+        """
+        size = self._chunk_size
+        return range(unit * size, min((unit + 1) * size, self._slots))
+
+    def _resize_chunks(self):
+        """
+        Pick the chunk size for the next batch from the compute time per slot measured in this one.
+        :return:
+        """
+        per_slot = self._chunk_compute_ns / self._slots
+        widest = max(1, ceil(self._slots / (cpu_count() or 1)))
+        self._chunk_size = min(max(1, round(self._chunk_target_ns / per_slot)) if per_slot else widest, widest)
+        self._chunk_compute_ns = 0
+
     def prepare_to_spawn_thread(self) -> bool:
         """
         Before batches can be executed, this function prepares the apparatus.
+        It fails if the execution backend can not run the function provided (e.g. an unpicklable one in processes).
         Phase: CalculationPhases.FINALIZE_OPERATING_PARAMETERS
         :return: successfully done or not
         """
         if self._check_phase(CalculationPhases.FINALIZE_OPERATING_PARAMETERS):
-            if self._fxn is not None:  # If no fxn is given, this is pointless.
+            if self._fxn is not None and self._backend.accepts(self._fxn):  # If no fxn is given, this is pointless.
                 if self._iter_order is None:
                     self._iter_order = BatchExecutionOrder(range(self._batches), self._batches)
+                self._backend.prepare(self._slots)
                 #
                 self._signal_go = Event()
                 self._signal_stop = Event()
-                self._number_threads_started_lock = Locker()
-                self._number_threads_stopped_lock = Locker()
-                self._number_threads_stopped2_lock = Locker()
-                self._read_write_lock = Locker()
-                self._monitoring_lock = Locker()
+                self._progress = Condition()
                 self._number_threads_started = 0
                 self._number_threads_stopped = 0
                 self._number_threads_stopped2 = 0
+                self._units = self._slots
+                self._chunk_compute_ns = 0
+                if self._chunk_auto:  # a first guess:  spread the slots over the CPUs
+                    self._chunk_size = max(1, ceil(self._slots / (cpu_count() or 1)))
                 self._current_batch = 0
+                self._monitoring = False
+                self._monitored_results = {}
                 #
                 self._advance_phase()
                 return True
@@ -448,33 +939,140 @@ class Parallelism:
 
     # CalculationPhases.SPAWN_THREADS
 
-    def __run(self, batch: int, slot: int):
-        """ Execute the given function. """
-
+    def run_slot(self, batch: int, slot: int):
+        """
+        Execute the given function for one slot, following the go and stop signals.
+        In chunked mode, slot is the index of a chunk of slots (so for ready_slot(), invoke_slot() and end_slot()).
+        This is typically only invoked by the execution backend.
+        :param batch: positive int
+        :param slot: positive int
+        :return:
+        """
         # READY: prepare for start
-        with Mutex(self._number_threads_started_lock):
-            self._number_threads_started += 1
+        self.ready_slot(batch, slot)
         # SET: wait for start signal
         self._signal_go.wait()
         # GO!: invoke function on parallel
-        tmp: env = env()
-        tmp.x = self._fxn.run(batch, slot)
-        if tmp.x is not None:
-            with Mutex(self._read_write_lock):
-                self._current_batch_results_ref[slot] = tmp.x  # conserve memory
-        del tmp
-        # SLOW: acknowledge stop
-        with Mutex(self._number_threads_stopped_lock):
-            self._number_threads_stopped += 1
+        self.invoke_slot(batch, slot)
         # STOP: wait for stop signal
         self._signal_stop.wait()
-        self._fxn.end(batch, slot)
+        self.end_slot(batch, slot)
+        return
+
+    def ready_slot(self, batch: int, slot: int):
+        """
+        Acknowledge that a slot awaits the go signal.
+        This is typically only invoked by the execution backend.
+        :param batch: positive int
+        :param slot: positive int
+        :return:
+        """
+        if self._profiler is not None:
+            self._profiler.stamp(batch, slot, 'ready')
+        with self._progress:
+            self._number_threads_started += 1
+            if self._number_threads_started == self._units:
+                self._progress.notify_all()
+
+    def invoke_slot(self, batch: int, slot: int):
+        """
+        Invoke the function for a slot, keep its result and acknowledge that it may be stopped.
+        This is typically only invoked by the execution backend.
+        :param batch: positive int
+        :param slot: positive int
+        :return:
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.stamp(batch, slot, 'run_start')
+        began = perf_counter_ns() if self._chunk_auto else 0
+        token = self._batch_token.child(self._slot_timeout)
+        skipped = late = False
+        try:
+            if token.is_cancelled():
+                skipped = True
+            elif self._chunk_size == 1:
+                result = self._backend.invoke(self._fxn, batch, slot, token)
+                if result is not None:
+                    late = token.has_expired()
+                    if not late:
+                        self._current_batch_results_ref.put(slot, result)  # this slot's own cell, no lock needed
+                        if self._match_predicate is not None and self._match_predicate(result):
+                            self._found(batch, slot, result)
+            else:
+                slots = self._chunk_slots(slot)
+                results = self._backend.invoke_chunk(self._fxn, batch, slots, token)
+                late = token.has_expired()
+                if not late:
+                    put = self._current_batch_results_ref.put
+                    predicate = self._match_predicate
+                    for slot_of_chunk, result in zip(slots, results):
+                        if result is not None:
+                            put(slot_of_chunk, result)
+                            if predicate is not None and predicate(result):
+                                self._found(batch, slot_of_chunk, result)
+        except Exception as error:  # the slot still stops, or its batch would never conclude
+            self._fail(batch, slot, error)
+        if profiler is not None:
+            profiler.stamp(batch, slot, 'run_end')
+        # SLOW: acknowledge stop
+        with self._progress:
+            if began:
+                self._chunk_compute_ns += perf_counter_ns() - began
+            if skipped:
+                self._skipped += 1
+            elif late:
+                self._timed_out += 1
+            self._number_threads_stopped += 1
+            if self._number_threads_stopped == self._units:
+                if self._tuner is not None:
+                    self._batch_ended = perf_counter_ns()
+                self._progress.notify_all()
+            elif self._number_threads_stopped == 1:
+                self._progress.notify_all()  # the first results are in (see await_first_result())
+
+    def _found(self, batch: int, slot: int, result: Any):
+        """ Keep the first match and cancel the run. """
+        with self._progress:
+            if self._match is None:
+                self._match = (batch, slot, result)
+        self._cancel.cancel()
+
+    def end_slot(self, batch: int, slot: int):
+        """
+        Ask the function of a slot to conclude and acknowledge that it has.
+        This is typically only invoked by the execution backend.
+        :param batch: positive int
+        :param slot: positive int
+        :return:
+        """
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.stamp(batch, slot, 'end_start')
+        try:
+            if self._chunk_size == 1:
+                self._fxn.end(batch, slot)
+            else:
+                end = self._fxn.end
+                for slot_of_chunk in self._chunk_slots(slot):
+                    end(batch, slot_of_chunk)
+        except Exception as error:
+            self._fail(batch, slot, error)
+        if profiler is not None:
+            profiler.stamp(batch, slot, 'end_end')
         # STOP...
-        with Mutex(self._number_threads_stopped2_lock):
+        with self._progress:
             self._number_threads_stopped2 += 1
-        return
+            if self._number_threads_stopped2 == self._units:
+                self._progress.notify_all()
+
+    def _fail(self, batch: int, slot: int, error: Exception):
+        """ Keep what the function of a slot raised. """
+        with self._progress:
+            self._failures.append((batch, slot, error))
 
-    _current_batch_results_ref: Dict[int, Any]
+    _current_batch_results_ref: SlotResults
+    _monitored_results: Dict[int, Any]  # snapshot read by a monitoring session
 
     def spawn_threads(self) -> int:
         """
@@ -487,19 +1085,51 @@ class Parallelism:
         :return: int indicator
         """
         if self._check_phase(CalculationPhases.SPAWN_THREADS):
-            if self._iter_order.is_quota_meet():
-                self._phase = CalculationPhases.FINALIZE
+            batch = self._next_batch_to_run()
+            if batch is None:
+                self._enter_phase(CalculationPhases.FINALIZE)
+                self._backend.shutdown()
                 return 2  # done already
             else:
-                self._current_batch = self._iter_order.full_next()
-                t = {}
+                self._current_batch = batch
+                self._batch_token = self._cancel.child(self._batch_timeout)
+                t = SlotResults(self._slots)
                 self._results[self._current_batch] = t
                 self._current_batch_results_ref = t
-                for slot in range(self._slots):
-                    Thread(target = self.__run, args = (self._current_batch, slot)).start()
+                # the previous batch has fully stopped, so its counters and signals can be reused
+                self._number_threads_started = self._number_threads_stopped = self._number_threads_stopped2 = 0
+                self._signal_go.clear()
+                self._signal_stop.clear()
+                self._units = units = ceil(self._slots / self._chunk_size)
+                if self._profiler is not None:
+                    self._profiler.launched(self._current_batch, units)
+                launch = self._backend.launch
+                for unit in range(units):
+                    launch(self, self._current_batch, unit)
                 return 1  # all launched
         return 0  # bad call
 
+    def _next_batch_to_run(self) -> Union[int, None]:
+        """ Take the next batch in order, restoring any the checkpoint holds.  None means no batch is left. """
+        order = self._iter_order
+        checkpoint = self._checkpoint
+        while not order.is_quota_meet() and not self._cancel.is_cancelled():
+            batch = order.full_next()
+            if checkpoint is None or not checkpoint.is_completed(batch):
+                return batch
+            results = checkpoint.get_completed()[batch]
+            if results:
+                self._restored += len(results)
+                self._keep_results(batch, results)
+        return None
+
+    def _keep_results(self, batch: int, results: Dict[int, Any]):
+        """ Hand the results of a finished batch to the sink, or keep them for the run. """
+        if self._result_sink is not None:
+            self._result_sink.put(batch, results)
+        else:
+            self._results[batch] = results
+
     def prepare_to_invoke_calls(self) -> int:
         """
         Transition from phase CalculationPhases.SPAWN_THREADS to CalculationPhases.TELL_THREADS_GO.
@@ -511,14 +1141,26 @@ class Parallelism:
         :return: int indicator
         """
         if self._check_phase(CalculationPhases.SPAWN_THREADS):
-            with Mutex(self._number_threads_started_lock):
-                if self._number_threads_started == self._slots:  # all threads now await the GO! signal
+            with self._progress:
+                if self._number_threads_started == self._units:  # all threads now await the GO! signal
                     self._advance_phase()
                     return 2  # spawning complete
                 else:
                     return 1  # still spawning
         return 0  # bad call
 
+    def await_spawn(self, timeout: float = None) -> bool:
+        """
+        Block until every slot of this batch awaits the go signal or timeout seconds have passed.
+        Phase: CalculationPhases.SPAWN_THREADS
+        :param timeout: seconds or None to wait indefinitely
+        :return: all slots spawned or not
+        """
+        if self._check_phase(CalculationPhases.SPAWN_THREADS):
+            with self._progress:
+                return self._progress.wait_for(lambda: self._number_threads_started == self._units, timeout)
+        return False
+
     # CalculationPhases.TELL_THREADS_GO
 
     def begin_all_invocations(self) -> bool:
@@ -528,9 +1170,12 @@ class Parallelism:
         :return: successfully done or not
         """
         if self._check_phase(CalculationPhases.TELL_THREADS_GO):
+            if self._tuner is not None:
+                self._batch_began = perf_counter_ns()
             self._signal_go.set()
             self._monitoring = False
             self._advance_phase()
+            self._backend.tell_go()
             return True
         return False
 
@@ -539,6 +1184,8 @@ class Parallelism:
     def turn_monitoring_on(self, on_not_off: bool = True):
         """
         Activate or deactivate a thread-progress monitoring session.
+        A session reads a snapshot of the results taken when it is activated (see refresh_monitoring());
+        the threads keep writing their results meanwhile.
         If one has already been activated, False will be returned.
         Phase: CalculationPhases.MONITOR_THREADS
         :param on_not_off: activate
@@ -548,14 +1195,32 @@ class Parallelism:
             if on_not_off:
                 if self._monitoring:
                     return False
-                self._read_write_lock.acquire()
+                self._monitored_results = self._current_batch_results_ref.snapshot()
                 self._monitoring = True
-            elif not self._monitoring:
+            elif self._monitoring:
                 self._monitoring = False
-                self._read_write_lock.release()
+                self._monitored_results = {}
+            return True
+        return False
+
+    def refresh_monitoring(self) -> bool:
+        """
+        Retake the snapshot read by the active monitoring session.
+        Phase: CalculationPhases.MONITOR_THREADS
+        :return: successfully done or not
+        """
+        if self._check_phase(CalculationPhases.MONITOR_THREADS) and self._monitoring:
+            self._monitored_results = self._current_batch_results_ref.snapshot()
             return True
         return False
 
+    def _monitored(self) -> Union[Dict[int, Any], SlotResults]:
+        """
+        Return the snapshot of an active monitoring session, else the live results of the current batch.
+        :return: slot -> result mapping
+        """
+        return self._monitored_results if self._monitoring else self._current_batch_results_ref
+
     def is_monitoring_turned_on(self) -> bool:
         """
         Tell whether a thread-progress monitoring session has been activated.
@@ -563,56 +1228,109 @@ class Parallelism:
         :return: successfully done or not
         """
         if self._check_phase(CalculationPhases.MONITOR_THREADS):
-            with Mutex(self._read_write_lock):
-                return self._monitoring
+            return self._monitoring
         return False
 
     def get(self, slot: int):  # todo doc
         """"""
-        return self._current_batch_results_ref.get(slot, 0)
+        return self._monitored().get(slot, 0)
 
     def index_slot_from_value(self, candidate) -> int:
         """"""
-        for i, v in self._current_batch_results_ref.items():
+        for i, v in self._monitored().items():
             if v == candidate:
                 return i
         return -1
 
     def find_things(self, things: set) -> [int, Any]:
         """"""
-        for i, v in self._current_batch_results_ref.items():
+        for i, v in self._monitored().items():
             if v in things:
                 yield i, v
         yield -1, 0
 
     def filter(self, candidate: Any, filtered: Callable[[ItemsView[int, Any], Any], Any]) -> Any:
         """"""
-        return filtered(self._current_batch_results_ref.items(), candidate)
+        return filtered(self._monitored().items(), candidate)
+
+    def await_first_result(self, timeout: float = None) -> bool:
+        """
+        Block until a slot of this batch has returned from the function (and stored its result, if any) or timeout
+        seconds have passed, so a monitoring session started then has something to read.
+        Phase: CalculationPhases.MONITOR_THREADS
+        :param timeout: seconds or None to wait indefinitely
+        :return: a slot returned or not
+        """
+        if self._check_phase(CalculationPhases.MONITOR_THREADS):
+            with self._progress:
+                return self._progress.wait_for(lambda: self._number_threads_stopped > 0, timeout)
+        return False
+
+    def await_conclusion(self, timeout: float = None) -> bool:
+        """
+        Block until every slot of this batch has returned from the function or timeout seconds have passed.
+        Phase: CalculationPhases.MONITOR_THREADS
+        :param timeout: seconds or None to wait indefinitely
+        :return: all slots returned or not
+        """
+        if self._check_phase(CalculationPhases.MONITOR_THREADS):
+            with self._progress:
+                return self._progress.wait_for(lambda: self._number_threads_stopped == self._units, timeout)
+        return False
 
     def conclude_threads(self) -> int:
         """"""
         if self._check_phase(CalculationPhases.MONITOR_THREADS):
-            with Mutex(self._number_threads_stopped_lock):
-                if self._number_threads_stopped == self._slots:
-                    self._signal_stop.set()
-                    self._advance_phase()
-                    return 2
-                else:
+            with self._progress:
+                if self._number_threads_stopped != self._units:
                     return 1
+                self._signal_stop.set()
+                self._advance_phase()
+            self._backend.tell_stop()
+            return 2
         else:
             return 0
 
     # CalculationPhases.SEE_THREADS_STOP
 
     def finalize_batch(self, continue_batches: bool = True) -> bool:
-        """"""
+        """
+        Conclude the current batch once all its slots have ended.
+        With a result sink, the results of the batch are handed to it (possibly blocking) and dropped from here.
+        With a checkpoint, the batch is recorded in it.  When tuning, the number of slots of the next batch is picked.
+        Phase: CalculationPhases.SEE_THREADS_STOP
+        :param continue_batches: go on to the next batch
+        :return: successfully done or not
+        """
+        if self._check_phase(CalculationPhases.SEE_THREADS_STOP):
+            with self._progress:
+                if self._number_threads_stopped2 != self._units:
+                    return False
+            batch = self._current_batch
+            results = self._current_batch_results_ref.snapshot()  # the cells compacted into a plain dict
+            del self._results[batch]
+            if results:
+                self._keep_results(batch, results)
+            if self._checkpoint is not None:
+                self._checkpoint.put(batch, results)
+            if self._chunk_auto:
+                self._resize_chunks()
+            if self._tuner is not None:
+                self._retune_slots()
+            self._enter_phase(CalculationPhases.SPAWN_THREADS if continue_batches else CalculationPhases.SEE_BATCH_END)
+            return True
+        return False
+
+    def await_batch_end(self, timeout: float = None) -> bool:
+        """
+        Block until every slot of this batch has been ended or timeout seconds have passed.
+        Phase: CalculationPhases.SEE_THREADS_STOP
+        :param timeout: seconds or None to wait indefinitely
+        :return: all slots ended or not
+        """
         if self._check_phase(CalculationPhases.SEE_THREADS_STOP):
-            with Mutex(self._number_threads_stopped2_lock):
-                if self._number_threads_stopped2 == self._slots:
-                    if len(self._current_batch_results_ref) == 0:
-                        del self._results[self._current_batch]
-                    self._phase = CalculationPhases.SPAWN_THREADS if continue_batches else CalculationPhases.SEE_BATCH_END
-                    return True
+            with self._progress:
+                return self._progress.wait_for(lambda: self._number_threads_stopped2 == self._units, timeout)
         return False
 
     def count_batch_results(self) -> Union[int, None]:
@@ -625,6 +1343,14 @@ class Parallelism:
 
     # CalculationPhases.FINALIZE
 
+    def release_backend(self):
+        """
+        Shut the execution backend down, e.g. when a run is abandoned before all batches have been executed.
+        Phase: Any
+        :return:
+        """
+        self._backend.shutdown()
+
 
 _calculation_phase_ids.advance_id(-_calculation_phase_ids.next_id())
 
@@ -641,6 +1367,7 @@ class RunParallelPhases(IntEnum):
     MONITORING_RELEASE_ISSUE: int = _calculation_phase_ids.next_id()
     BATCH_RESULT: int = _calculation_phase_ids.next_id()
     CONCLUSION: int = _calculation_phase_ids.next_id()
+    BACKEND_ERROR: int = _calculation_phase_ids.next_id()
 
 
 RPP = RunParallelPhases
@@ -652,43 +1379,120 @@ def run_parallel(
         batch_order: BatchExecutionOrder = None,
         yield_to_monitor: bool = True,
         auto_lock_unlock_monitoring: bool = True,
-        monitoring_wait: float = .02,
+        monitoring_wait: float = 0,
         spawn_wait: float = .02,
-        conclusion_wait: float = .02
+        conclusion_wait: float = .02,
+        persistent_workers: bool = False,
+        worker_pool: WorkerPool = None,
+        backend: Union[str, ExecutionBackend] = None,
+        consumer: RESULT_CONSUMER = None,
+        max_pending: int = 8,
+        spill_path: str = None,
+        profiler: PhaseProfiler = None,
+        chunk_size: int = None,
+        vectorized: bool = False,
+        checkpoint_path: str = None,
+        cancellable: bool = False,
+        slot_timeout: float = None,
+        batch_timeout: float = None,
+        stop_on_match: Callable[[Any], bool] = None,
+        autotune_slots: int = None
 ) -> [Tuple[Parallelism, RPP, int]]:
-    """"""
-    obj: Parallelism = Parallelism(True)
+    """
+    Run fxn on every slot of every batch, yielding progress events.
+    The backend chooses where the slots execute (see Parallelism.set_execution_backend()).
+    Phase transitions are driven by notifications from the slots:  spawn_wait and conclusion_wait only bound how long
+    each wait lasts before the state is checked again.  Every monitoring session starts once the first slot of the
+    batch has returned (see Parallelism.await_first_result()); monitoring_wait, if not 0, bounds that wait.
+    If persistent_workers, the slots are run on a WorkerPool kept alive for the whole run instead of a new thread each.
+    A worker_pool given by the caller implies persistent_workers and is left running afterwards.
+    If the backend can not run fxn (e.g. an unpicklable fxn in processes), RPP.BACKEND_ERROR is yielded.
+    A slot whose fxn (or fxn_end) raises has no result and its batch goes on; see Parallelism.get_failures().
+    Streaming:  with a consumer (a callable (batch, results) or a generator sent (batch, results)), each finished
+    batch's results are handed to it and dropped, at most max_pending batches waiting on a slow consumer.
+    With a spill_path, they are also appended to that file (see load_spilled()); with only a spill_path,
+    they are written there and dropped.
+    With a profiler, the timing of every phase and slot is recorded in it (see PhaseProfiler.summary()).
+    With a chunk_size, contiguous ranges of slots are run as one unit (0 sizes them automatically; see
+    Parallelism.set_chunking()).  If vectorized, fxn is called as fxn(batch, range_of_slots) and returns a sequence
+    of results (see ChunkRunner); chunks are then sized automatically unless chunk_size is given.
+    With a checkpoint_path, every finished batch is recorded there (see Checkpoint); run again with the same path
+    after an interruption, the batches already recorded are restored instead of run.  Restored batches yield no
+    RPP.BATCH_RESULT but their results count towards the conclusion (see Parallelism.get_restored_results()).
+    Cancellation:  if cancellable, fxn is called as fxn(batch, slot, token) with a CancellationToken it should
+    check (see CancellableRunner); if also vectorized, as fxn(batch, range_of_slots, token) (see
+    CancellableChunkRunner).  slot_timeout and batch_timeout (seconds) cancel those tokens at their deadline
+    and drop results arriving later.  With stop_on_match, the first result for which it is true cancels the run:
+    the remaining batches are skipped and the result is Parallelism.get_match().  A monitor may also call
+    Parallelism.cancel().
+    With autotune_slots (the most slots to try), the number of slots per batch starts at slots and is adjusted
+    between batches toward the highest throughput; Parallelism.get_slot_autotuner() reports the best setting.
+    """
+    if backend is None and (persistent_workers or worker_pool is not None):
+        backend = PooledThreadBackend(worker_pool)
+    obj: Parallelism = Parallelism(False)
+    obj.set_profiler(profiler)
+    obj.start()
     # Initialization
     obj.set_number_of_batches(batches)
     obj.set_number_of_slots(slots)
     if not obj.generate_batches_and_slots():
         yield obj, RPP.BATCH_SLOT_ERROR, 0
-    obj.set_executor(Runner(fxn, fxn_end))
+    if vectorized:
+        obj.set_executor(CancellableChunkRunner(fxn, fxn_end) if cancellable else ChunkRunner(fxn, fxn_end))
+    else:
+        obj.set_executor(CancellableRunner(fxn, fxn_end) if cancellable else Runner(fxn, fxn_end))
     obj.set_batch_execution_order(batch_order)
+    obj.set_execution_backend(backend)
+    if vectorized and chunk_size is None:
+        chunk_size = 0
+    if chunk_size is not None:
+        obj.set_chunking(chunk_size)
+    sink: Union[ResultStream, ResultSpill, None] = None
+    if consumer is not None:
+        sink = ResultStream(consumer, max_pending, None if spill_path is None else ResultSpill(spill_path))
+    elif spill_path is not None:
+        sink = ResultSpill(spill_path)
+    obj.set_result_sink(sink)
+    checkpoint: Union[Checkpoint, None] = None if checkpoint_path is None else Checkpoint(checkpoint_path)
+    obj.set_checkpoint(checkpoint)
+    obj.set_timeouts(slot_timeout, batch_timeout)
+    obj.set_stop_on_match(stop_on_match)
+    if autotune_slots is not None:
+        obj.set_slot_autotuning(autotune_slots)
     # Main Cycle:  Batch by Batch with Parallel Slots
-    obj.prepare_to_spawn_thread()
+    if not obj.prepare_to_spawn_thread():
+        yield obj, RPP.BACKEND_ERROR, 0
     total: int = 0
     a: int = 0
-    while obj.spawn_threads() == 1:
-        while obj.prepare_to_invoke_calls() == 1:
-            sleep(spawn_wait)
-        obj.begin_all_invocations()
-        if yield_to_monitor:
-            if auto_lock_unlock_monitoring:
-                sleep(monitoring_wait)
-                if obj.turn_monitoring_on(True):
-                    yield obj, RPP.MONITORING, a
+    try:
+        while obj.spawn_threads() == 1:
+            while obj.prepare_to_invoke_calls() == 1:
+                obj.await_spawn(spawn_wait)
+            obj.begin_all_invocations()
+            if yield_to_monitor:
+                if auto_lock_unlock_monitoring:
+                    obj.await_first_result(monitoring_wait or None)
+                    if obj.turn_monitoring_on(True):
+                        yield obj, RPP.MONITORING, a
+                    else:
+                        yield obj, RPP.MONITORING_ACQUISITION_ISSUE, a
+                    if not obj.turn_monitoring_on(False):
+                        yield obj, RPP.MONITORING_RELEASE_ISSUE, a
                 else:
-                    yield obj, RPP.MONITORING_ACQUISITION_ISSUE, a
-                if not obj.turn_monitoring_on(False):
-                    yield obj, RPP.MONITORING_RELEASE_ISSUE, a
-            else:
-                yield obj, RPP.MONITORING, a
-        while obj.conclude_threads() == 1:
-            sleep(conclusion_wait)
-        a = obj.count_batch_results()
-        if a > 0:
-            yield obj, RPP.BATCH_RESULT, a
-            total += a
-        obj.finalize_batch(True)
-    return obj, RPP.CONCLUSION, total
+                    yield obj, RPP.MONITORING, a
+            while obj.conclude_threads() == 1:
+                obj.await_conclusion(conclusion_wait)
+            a = obj.count_batch_results()
+            if a > 0:
+                yield obj, RPP.BATCH_RESULT, a
+                total += a
+            while not obj.finalize_batch(True):
+                obj.await_batch_end(conclusion_wait)
+    finally:
+        obj.release_backend()
+        if sink is not None:
+            sink.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    return obj, RPP.CONCLUSION, total + obj.get_restored_results()
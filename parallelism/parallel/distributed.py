@@ -0,0 +1,408 @@
+#!/usr/bin/python3
+from collections import deque
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client, Connection, Listener, wait
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, Tuple, Union
+
+from parallel.backends import is_picklable
+from parallel.core import BatchExecutionOrder, RPP, run_parallel
+
+ADDRESS = Union[Tuple[str, int], str]  # (host, port) for TCP or a path for a Unix socket
+DEFAULT_AUTHKEY: bytes = b'parallel'
+
+
+class _RemoteWorker:
+    """
+    The coordinator's view of one connected worker.
+    """
+    __slots__ = ('connection', 'name', 'last_seen', 'batch')
+    connection: Connection
+    name: str
+    last_seen: float
+    batch: Union[int, None]  # the batch assigned and not yet reported
+
+    def __init__(self, connection: Connection, name: str):
+        self.connection = connection
+        self.name = name
+        self.last_seen = monotonic()
+        self.batch = None
+
+
+class Coordinator:
+    """
+    Dispatch whole batches to worker processes over TCP or Unix sockets and collect their results into _results.
+    Workers (see worker_main()) may connect at any time; each is sent the job once, then one batch at a time.
+    A worker silent for longer than heartbeat_timeout, or whose connection breaks, is dropped and its batch is
+    handed to the next idle worker.  A batch is only counted once, whoever reports it first.
+    A batch whose worker reports an error or dies is retried up to max_retries times, then given up (see
+    get_errors()).  With no worker connected for longer than heartbeat_timeout, the run ends with an error.
+    """
+    _fxn: Callable[[int, int], Any]
+    _fxn_end: Callable[[int, int], Any]
+    _batches: int
+    _slots: int
+    _listener: Listener
+    _arrivals: SimpleQueue  # connections accepted but not yet greeted
+    _workers: Dict[Connection, _RemoteWorker]
+    _queued: Deque[int]  # batches not yet assigned, in BatchExecutionOrder
+    _done: set
+    _results: Dict[int, Dict[int, Any]]  # results[batch][slot] = <result of call>
+    _heartbeat_timeout: float
+    _reassigned: int
+    _closed: bool
+    _max_retries: int
+    _retries: Dict[int, int]  # batch -> times it failed
+    _errors: List[Tuple[Union[int, None], str]]  # batch (None for the whole run), what went wrong
+    _failures: List[Tuple[int, int, str]]  # batch, slot, what its function raised on the worker
+    _greeted: int  # workers ever greeted, numbering their names
+    _last_batch: Union[int, None]
+
+    def __init__(self, fxn: Callable[[int, int], Any], fxn_end: Callable[[int, int], Any],
+                 batches: int, slots: int, batch_order: BatchExecutionOrder = None,
+                 address: ADDRESS = ('127.0.0.1', 0), authkey: bytes = DEFAULT_AUTHKEY,
+                 heartbeat_timeout: float = 5., max_retries: int = 3):
+        """
+        Start listening for workers.
+        :param fxn: picklable Callable accepting two integers
+        :param fxn_end: picklable Callable accepting two integers, or None
+        :param batches: natural number
+        :param slots: natural number of slots per batch, run by the worker
+        :param batch_order: a BatchExecutionOrder instance or None
+        :param address: (host, port) or a Unix socket path; port 0 picks a free port
+        :param authkey: bytes shared with the workers
+        :param heartbeat_timeout: seconds of silence after which a worker is considered dead
+        :param max_retries: whole number of times a failing batch is handed out again before it is given up
+        """
+        self._fxn = fxn
+        self._fxn_end = fxn_end
+        self._batches = batches
+        self._slots = slots
+        if batch_order is None:
+            batch_order = BatchExecutionOrder(range(batches), batches)
+        self._queued = deque()
+        while not batch_order.is_quota_meet():
+            self._queued.append(batch_order.full_next())
+        self._done = set()
+        self._results = {}
+        self._workers = {}
+        self._arrivals = SimpleQueue()
+        self._heartbeat_timeout = heartbeat_timeout
+        self._reassigned = 0
+        self._closed = False
+        self._max_retries = max_retries
+        self._retries = {}
+        self._errors = []
+        self._failures = []
+        self._greeted = 0
+        self._last_batch = None
+        self._listener = Listener(address, authkey = authkey)
+        Thread(target = self._accept, name = 'parallel-coordinator-accept', daemon = True).start()
+
+    @property
+    def address(self) -> ADDRESS:
+        return self._listener.address
+
+    def _accept(self):
+        """ Accept connecting workers until the listener closes. """
+        while True:
+            try:
+                self._arrivals.put(self._listener.accept())
+            except (OSError, EOFError, AuthenticationError):
+                if self._closed:
+                    return
+                # a failed handshake (e.g. a wrong authkey) only loses that connection
+
+    def _greet(self):
+        """ Send the job to every newly accepted worker. """
+        while True:
+            try:
+                connection = self._arrivals.get_nowait()
+            except Empty:
+                return
+            try:
+                connection.send(('job', self._fxn, self._fxn_end, self._slots))
+            except OSError:
+                connection.close()
+                continue
+            self._workers[connection] = _RemoteWorker(connection, f'worker-{self._greeted}')
+            self._greeted += 1
+
+    def _drop(self, worker: _RemoteWorker):
+        """ Forget a dead worker and queue its batch again, first in line. """
+        del self._workers[worker.connection]
+        worker.connection.close()
+        if worker.batch is not None:
+            self._retry(worker.batch, f'{worker.name} died running batch {worker.batch}')
+
+    def _retry(self, batch: int, error: str) -> bool:
+        """ Queue a failed batch again, first in line, unless it failed too often.  Return whether it was given up. """
+        if batch in self._done:
+            return False
+        self._retries[batch] = retries = self._retries.get(batch, 0) + 1
+        if retries > self._max_retries:
+            self._done.add(batch)
+            self._errors.append((batch, error))
+            return True
+        self._queued.appendleft(batch)
+        self._reassigned += 1
+        return False
+
+    def _assign(self):
+        """ Give a queued batch to every idle worker. """
+        for worker in list(self._workers.values()):
+            while worker.batch is None and self._queued:
+                batch = self._queued.popleft()
+                if batch in self._done:
+                    continue
+                try:
+                    worker.connection.send(('batch', batch))
+                    worker.batch = batch
+                except OSError:
+                    self._queued.appendleft(batch)
+                    self._drop(worker)
+                    break
+
+    def _receive(self, worker: _RemoteWorker) -> Union[int, None]:
+        """ Handle one message of a worker.  Return the batch it completed, if any and if new. """
+        try:
+            message = worker.connection.recv()
+        except (EOFError, OSError):
+            self._drop(worker)
+            return None
+        worker.last_seen = monotonic()
+        if message[0] == 'result':
+            _, batch, results, failures = message
+            if worker.batch == batch:
+                worker.batch = None
+            if batch not in self._done:
+                self._done.add(batch)
+                if results:
+                    self._results[batch] = results
+                self._failures.extend((batch, slot, error) for slot, error in failures)
+                return batch
+        elif message[0] == 'error':
+            _, batch, error = message
+            if worker.batch == batch:
+                worker.batch = None
+            self._retry(batch, f'{worker.name}: {error}')
+        elif message[0] == 'name':
+            worker.name = message[1]
+        return None
+
+    def run(self, poll: float = .1) -> [Tuple['Coordinator', RPP, int]]:
+        """
+        Coordinate until every batch has been reported, yielding RPP.BATCH_RESULT per batch with results.
+        The batch last reported is get_last_batch().
+        RPP.BACKEND_ERROR is yielded for every batch given up, and once before ending early for want of workers.
+        :param poll: seconds between checks for new and silent workers
+        :return: generator, concluding with (self, RPP.CONCLUSION, total)
+        """
+        total: int = 0
+        reported: int = len(self._errors)
+        alone_since = monotonic()
+        try:
+            while len(self._done) < self._batches:
+                self._greet()
+                self._assign()
+                now = monotonic()
+                for worker in [w for w in self._workers.values() if now - w.last_seen > self._heartbeat_timeout]:
+                    self._drop(worker)
+                if self._workers or not self._arrivals.empty():
+                    alone_since = now
+                elif now - alone_since > self._heartbeat_timeout:
+                    self._errors.append((None, f'no worker for {self._heartbeat_timeout} seconds'))
+                    yield self, RPP.BACKEND_ERROR, 0
+                    break
+                for connection in wait(list(self._workers), poll):
+                    worker = self._workers.get(connection)
+                    if worker is None:
+                        continue
+                    batch = self._receive(worker)
+                    if batch is not None and batch in self._results:
+                        self._last_batch = batch
+                        a = len(self._results[batch])
+                        total += a
+                        yield self, RPP.BATCH_RESULT, a
+                while reported < len(self._errors):  # batches given up
+                    self._last_batch = self._errors[reported][0]
+                    reported += 1
+                    yield self, RPP.BACKEND_ERROR, 0
+        finally:
+            self.close()
+        return self, RPP.CONCLUSION, total
+
+    def close(self):
+        """
+        Tell every worker to stop and stop listening.  Calling this more than once is harmless.
+        :return:
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for connection in list(self._workers):
+            try:
+                connection.send(('stop',))
+            except OSError:
+                pass
+            connection.close()
+        self._workers.clear()
+        self._listener.close()
+
+    def get_last_batch(self) -> Union[int, None]:
+        """
+        Return the batch last reported during run().
+        :return: batch number or None
+        """
+        return self._last_batch
+
+    def get_results(self) -> Dict[int, Dict[int, Any]]:
+        """
+        Return the results collected so far:  results[batch][slot].
+        :return: dict
+        """
+        return self._results
+
+    def get_errors(self) -> List[Tuple[Union[int, None], str]]:
+        """
+        Return the batches given up, with what went wrong last, and why the run ended early (batch None), if so.
+        :return: list of (batch, error)
+        """
+        return list(self._errors)
+
+    def get_failures(self) -> List[Tuple[int, int, str]]:
+        """
+        Return what the function raised on the workers for single slots, as (batch, slot, error).
+        Those slots have no result; their batches were reported nonetheless (see Parallelism.get_failures()).
+        :return: list
+        """
+        return list(self._failures)
+
+    def get_reassigned(self) -> int:
+        """
+        Return how many batches were handed to another worker after theirs died.
+        :return: whole number
+        """
+        return self._reassigned
+
+    def get_worker_names(self) -> List[str]:
+        """
+        Return the names of the workers connected right now.
+        :return: list of str
+        """
+        return [worker.name for worker in self._workers.values()]
+
+
+def worker_main(address: ADDRESS, authkey: bytes = DEFAULT_AUTHKEY, heartbeat_interval: float = 1.,
+                backend: str = None, name: str = None):
+    """
+    Connect to a Coordinator and run the batches it sends until it says stop or goes away.
+    Each batch is run with run_parallel() on the given backend; a heartbeat is sent every heartbeat_interval seconds.
+    A batch that can not be run or reported (e.g. unpicklable results) is reported as an error instead.
+    :param address: (host, port) or a Unix socket path
+    :param authkey: bytes shared with the coordinator
+    :param heartbeat_interval: seconds
+    :param backend: run_parallel() backend name for the slots of each batch
+    :param name: how the coordinator calls this worker
+    :return:
+    """
+    connection = Client(address, authkey = authkey)
+    send_lock = Lock()
+    stopped = Event()
+
+    def send(message: tuple):
+        with send_lock:
+            connection.send(message)
+
+    def beat():
+        while not stopped.wait(heartbeat_interval):
+            try:
+                send(('heartbeat',))
+            except OSError:
+                return
+
+    heartbeat = Thread(target = beat, name = 'parallel-worker-heartbeat', daemon = True)
+    try:
+        _, fxn, fxn_end, slots = connection.recv()
+        if name is not None:
+            send(('name', name))
+        heartbeat.start()
+        while True:
+            message = connection.recv()
+            if message[0] != 'batch':
+                break
+            batch = message[1]
+            try:
+                generator = run_parallel(fxn, fxn_end, 1, slots, BatchExecutionOrder([batch], 1),
+                                         yield_to_monitor = False, backend = backend)
+                try:
+                    while True:
+                        next(generator)
+                except StopIteration as conclusion:
+                    obj = conclusion.value[0]
+                failures = [(slot, repr(error)) for _, slot, error in obj.get_failures()]
+                send(('result', batch, obj._results.get(batch, {}), failures))
+            except (EOFError, OSError):
+                raise
+            except Exception as error:
+                send(('error', batch, repr(error)))
+    except (EOFError, OSError):
+        pass
+    finally:
+        stopped.set()
+        connection.close()
+
+
+def launch_local_workers(address: ADDRESS, count: int, authkey: bytes = DEFAULT_AUTHKEY,
+                         heartbeat_interval: float = 1., backend: str = None) -> List[Process]:
+    """
+    Start count worker processes on this machine connecting to address.
+    :param address: (host, port) or a Unix socket path
+    :param count: natural number
+    :param authkey: bytes shared with the coordinator
+    :param heartbeat_interval: seconds
+    :param backend: run_parallel() backend name for the slots of each batch
+    :return: list of started processes
+    """
+    processes = [Process(target = worker_main, name = f'parallel-worker-{i}',
+                         args = (address, authkey, heartbeat_interval, backend, f'local-{i}'), daemon = True)
+                 for i in range(count)]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def run_distributed(
+        fxn: Callable[[int, int], Any], fxn_end: Callable[[int, int], Any],
+        batches: int = 1, slots: int = 1,
+        batch_order: BatchExecutionOrder = None,
+        address: ADDRESS = ('127.0.0.1', 0),
+        authkey: bytes = DEFAULT_AUTHKEY,
+        local_workers: int = 0,
+        heartbeat_timeout: float = 5.,
+        max_retries: int = 3
+) -> [Tuple[Coordinator, RPP, int]]:
+    """
+    The distributed counterpart of run_parallel():  batches are dispatched to worker processes over sockets.
+    Workers connect to the coordinator's address (see worker_main()); local_workers of them are started here.
+    fxn and fxn_end must be picklable, else RPP.BACKEND_ERROR is yielded.
+    RPP.BATCH_RESULT is yielded per batch with results, in reporting order; see Coordinator.get_last_batch().
+    A batch failing more than max_retries times is given up with RPP.BACKEND_ERROR; see Coordinator.get_errors().
+    """
+    if batches <= 0 or slots <= 0:
+        yield None, RPP.BATCH_SLOT_ERROR, 0
+        return None, RPP.CONCLUSION, 0
+    if not all(f is None or is_picklable(f) for f in (fxn, fxn_end)):
+        yield None, RPP.BACKEND_ERROR, 0
+        return None, RPP.CONCLUSION, 0
+    obj = Coordinator(fxn, fxn_end, batches, slots, batch_order, address, authkey, heartbeat_timeout, max_retries)
+    processes = launch_local_workers(obj.address, local_workers, authkey, min(1., heartbeat_timeout / 4))
+    try:
+        return (yield from obj.run())
+    finally:
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
@@ -1,5 +1,14 @@
 #!/usr/bin/python3
-from threading import *
+from multiprocessing import Lock as ProcessLock
+from multiprocessing.shared_memory import SharedMemory
+from os import register_at_fork
+from struct import Struct
+from threading import Lock, local
+from weakref import WeakSet
+
+__all__ = ['IdSmugglerBase', 'IDs', 'IDSource', 'SharedIDSource', 'LeasedIDs']
+
+_COUNTER: Struct = Struct('q')  # the next ID of a SharedIDSource
 
 
 class IdSmugglerBase:
@@ -43,6 +52,9 @@ class IdSmugglerBase:
 
 
 class IDs(IdSmugglerBase):
+    """
+    A thread-safe IdSmugglerBase:  every call takes one lock.  Under many threads, prefer LeasedIDs.
+    """
     _lock: Lock
 
     def __init__(self, starting_point: int = 0):
@@ -50,20 +62,164 @@ class IDs(IdSmugglerBase):
         self._lock = Lock()
 
     def get_id(self) -> int:
-        self._lock.acquire()
-        env = local()
-        env.x = IdSmugglerBase.get_id(self)
-        self._lock.release()
-        return env.x
+        with self._lock:
+            return IdSmugglerBase.get_id(self)
 
     def next_id(self) -> int:
-        self._lock.acquire()
-        env = local()
-        env.x = IdSmugglerBase.next_id(self)
-        self._lock.release()
-        return env.x
+        with self._lock:  # IdSmugglerBase.next_id() would call the locking advance_id() and deadlock
+            tmp: int = IdSmugglerBase.get_id(self)
+            IdSmugglerBase.advance_id(self)
+            return tmp
 
     def advance_id(self, number_of_times: int = 1):
-        self._lock.acquire()
-        IdSmugglerBase.advance_id(self, number_of_times)
-        self._lock.release()
+        with self._lock:
+            IdSmugglerBase.advance_id(self, number_of_times)
+
+
+class IDSource:
+    """
+    Lease contiguous blocks of IDs to the threads of this process.
+    """
+    _next: int
+    _lock: Lock
+
+    def __init__(self, starting_point: int = 0):
+        """
+        :param starting_point: whole number, the first ID leased
+        """
+        self._next = starting_point
+        self._lock = Lock()
+
+    def lease(self, count: int) -> int:
+        """
+        Reserve the next count IDs.
+        :param count: natural number
+        :return: the first ID of the block
+        """
+        with self._lock:
+            start = self._next
+            self._next = start + count
+            return start
+
+
+class SharedIDSource(IDSource):
+    """
+    Lease contiguous blocks of IDs to the threads of several processes.
+    The next ID lives in shared memory, guarded by a multiprocessing lock.  Hand the source to the other processes
+    as an argument of Process() (or through a Pool initializer):  it pickles to the name of the memory and the lock.
+    The process that created the source should unlink() it once every process is done.
+    """
+    _memory: SharedMemory
+    _owner: bool
+
+    def __init__(self, starting_point: int = 0):
+        """
+        :param starting_point: whole number, the first ID leased
+        """
+        self._memory = SharedMemory(create = True, size = _COUNTER.size)
+        self._owner = True
+        self._lock = ProcessLock()
+        _COUNTER.pack_into(self._memory.buf, 0, starting_point)
+
+    def __getstate__(self) -> tuple:
+        return self._memory.name, self._lock
+
+    def __setstate__(self, state: tuple):
+        name, self._lock = state
+        self._memory = SharedMemory(name)
+        self._owner = False
+
+    def lease(self, count: int) -> int:
+        buffer = self._memory.buf
+        with self._lock:
+            start = _COUNTER.unpack_from(buffer, 0)[0]
+            _COUNTER.pack_into(buffer, 0, start + count)
+            return start
+
+    def close(self):
+        """
+        Detach from the shared memory in this process.
+        :return:
+        """
+        self._memory.close()
+
+    def unlink(self):
+        """
+        Detach from and destroy the shared memory.  Only the creating process should call this.
+        :return:
+        """
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+class _Lease(local):
+    """ The block of IDs a thread is handing out:  next up to, not including, end. """
+
+    def __init__(self):
+        self.next = self.end = 0
+
+
+class LeasedIDs:
+    """
+    Hand out unique IDs without a shared lock per ID:  every thread leases a block of block_size IDs from an
+    IDSource (or a SharedIDSource, to share the IDs between processes) and hands them out by itself,
+    taking a lock only once per block.
+    IDs are unique but only increase within a thread; IDs left in a block when a thread ends are never handed out.
+    A forked child process starts with fresh blocks.
+    """
+    _source: IDSource
+    _block_size: int
+    _lease: _Lease
+
+    def __init__(self, starting_point: int = 0, block_size: int = 1024, source: IDSource = None):
+        """
+        :param starting_point: whole number, the first ID; ignored if source is given
+        :param block_size: natural number of IDs leased at once
+        :param source: an IDSource or SharedIDSource instance, or None for a new IDSource
+        """
+        self._source = IDSource(starting_point) if source is None else source
+        self._block_size = block_size
+        self._lease = _Lease()
+        _LEASED_IDS.add(self)
+
+    def __getstate__(self) -> tuple:
+        return self._source, self._block_size
+
+    def __setstate__(self, state: tuple):
+        self.__init__(block_size = state[1], source = state[0])
+
+    def _forget(self):
+        """ Drop the blocks inherited from the parent process. """
+        self._lease = _Lease()
+
+    def next_id(self) -> int:
+        """
+        Get-to-use the next ID of this thread.
+        :return: int ID
+        """
+        lease = self._lease
+        i = lease.next
+        if i == lease.end:
+            i = self._source.lease(self._block_size)
+            lease.end = i + self._block_size
+        lease.next = i + 1
+        return i
+
+    def get_block_size(self) -> int:
+        return self._block_size
+
+    def get_source(self) -> IDSource:
+        return self._source
+
+
+_LEASED_IDS: WeakSet = WeakSet()  # every LeasedIDs of this process
+
+
+def _forget_leases():
+    """ In a forked child, drop the blocks leased by the parent, which the parent keeps handing out. """
+    for ids in list(_LEASED_IDS):
+        ids._forget()
+
+
+register_at_fork(after_in_child = _forget_leases)
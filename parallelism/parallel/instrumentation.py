@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+from collections import namedtuple
+from csv import writer as csv_writer
+from json import dump as json_dump
+from statistics import mean
+from time import perf_counter_ns
+from typing import Any, Dict, IO, List, Tuple, Union
+
+phase_record = namedtuple('phase_record', ('batch', 'phase', 'at'))  # at: perf_counter_ns()
+slot_record = namedtuple('slot_record', ('batch', 'slot', 'launched', 'ready', 'run_start', 'run_end', 'end_start', 'end_end'))
+
+_SLOT_STAGES: Dict[str, int] = {'ready': 1, 'run_start': 2, 'run_end': 3, 'end_start': 4, 'end_end': 5}
+
+
+class PhaseProfiler:
+    """
+    Record high-resolution timestamps (perf_counter_ns) of every CalculationPhases transition of a Parallelism()
+    and of every stage of every slot:  launched, ready (picked up by a worker), run start/end and end start/end.
+    Queue wait is the time from launch to run start, compute is the run itself.
+    An executor without a profiler skips all of this after a single None check.
+    """
+    _origin: int
+    _phases: List[phase_record]
+    _stamps: Dict[Tuple[int, int], List[int]]  # (batch, slot) -> stamps in slot_record order, launched first
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Forget everything recorded so far and restart the clock.
+        :return:
+        """
+        self._origin = perf_counter_ns()
+        self._phases = []
+        self._stamps = {}
+
+    # Recording:  typically only invoked by the parallelism machinery
+
+    def phase(self, batch: int, phase: Any):
+        """
+        Record entering phase while batch is the current batch.
+        :param batch: positive int
+        :param phase: a CalculationPhases member
+        :return:
+        """
+        self._phases.append(phase_record(batch, phase, perf_counter_ns()))
+
+    def launched(self, batch: int, slots: int):
+        """
+        Record that every slot of batch has been handed to the execution backend.
+        :param batch: positive int
+        :param slots: natural number
+        :return:
+        """
+        at = perf_counter_ns()
+        stamps = self._stamps
+        for slot in range(slots):
+            stamps[batch, slot] = [at, 0, 0, 0, 0, 0]
+
+    def stamp(self, batch: int, slot: int, stage: str):
+        """
+        Record that a slot reached stage ('ready', 'run_start', 'run_end', 'end_start' or 'end_end').
+        Each slot only stamps its own record, so no lock is needed.
+        :param batch: positive int
+        :param slot: positive int
+        :param stage: str
+        :return:
+        """
+        at = perf_counter_ns()
+        self._stamps[batch, slot][_SLOT_STAGES[stage]] = at
+
+    # Reporting
+
+    def get_phases(self) -> List[phase_record]:
+        """
+        Return the phase transitions in the order they happened.
+        :return: list of phase_record
+        """
+        return list(self._phases)
+
+    def get_slots(self) -> List[slot_record]:
+        """
+        Return the stamps of every slot, in nanoseconds since the profiler was cleared (0 if never reached).
+        :return: list of slot_record
+        """
+        origin = self._origin
+        return [slot_record(batch, slot, *((x - origin) if x else 0 for x in stamps))
+                for (batch, slot), stamps in sorted(self._stamps.items())]
+
+    def phase_durations(self) -> Dict[str, List[int]]:
+        """
+        Return how long (ns) each visit of each phase lasted, keyed by phase name.
+        :return: dict name -> list of durations
+        """
+        durations: Dict[str, List[int]] = {}
+        phases = self._phases
+        for current, following in zip(phases, phases[1:]):
+            durations.setdefault(current.phase.name, []).append(following.at - current.at)
+        return durations
+
+    def slot_durations(self) -> List[Dict[str, int]]:
+        """
+        Return per slot (ns):  queue_wait (launch to run start), compute (run) and end (Runner.end).
+        :return: list of dict
+        """
+        return [{'batch': r.batch, 'slot': r.slot,
+                 'queue_wait': max(r.run_start - r.launched, 0),
+                 'compute': max(r.run_end - r.run_start, 0),
+                 'end': max(r.end_end - r.end_start, 0)}
+                for r in self.get_slots()]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Build a structured report of everything recorded.
+        :return: dict of phases, phase_totals and slots
+        """
+        origin = self._origin
+        return {
+            'unit': 'ns',
+            'phases': [{'batch': r.batch, 'phase': r.phase.name, 'at': r.at - origin} for r in self._phases],
+            'phase_totals': {name: sum(d) for name, d in self.phase_durations().items()},
+            'slots': self.slot_durations(),
+        }
+
+    def to_json(self, file: Union[str, IO[str]]):
+        """
+        Write report() as JSON to a file name or an open text file.
+        :param file: str or file handle
+        :return:
+        """
+        if isinstance(file, str):
+            with open(file, 'w', encoding = 'utf-8') as f:
+                json_dump(self.report(), f, indent = 1)
+        else:
+            json_dump(self.report(), file, indent = 1)
+
+    def to_csv(self, file: Union[str, IO[str]]):
+        """
+        Write one CSV row per slot (batch, slot, queue_wait, compute, end in ns) to a file name or an open text file.
+        :param file: str or file handle
+        :return:
+        """
+        def write(f: IO[str]):
+            out = csv_writer(f)
+            out.writerow(('batch', 'slot', 'queue_wait', 'compute', 'end'))
+            out.writerows((d['batch'], d['slot'], d['queue_wait'], d['compute'], d['end']) for d in self.slot_durations())
+
+        if isinstance(file, str):
+            with open(file, 'w', encoding = 'utf-8', newline = '') as handle:
+                write(handle)
+        else:
+            write(file)
+
+    def summary(self) -> str:
+        """
+        Tabulate the time spent per phase and the queue wait versus compute time of the slots, in milliseconds.
+        :return: str table
+        """
+        lines = [f'{"phase":<30}{"visits":>8}{"total ms":>12}{"mean ms":>12}']
+        for name, durations in self.phase_durations().items():
+            lines.append(f'{name:<30}{len(durations):>8}{sum(durations) / 1e6:>12.3f}{mean(durations) / 1e6:>12.3f}')
+        slots = self.slot_durations()
+        if slots:
+            lines.append('')
+            lines.append(f'{"slot time":<30}{"slots":>8}{"total ms":>12}{"mean ms":>12}{"max ms":>12}')
+            for key in 'queue_wait', 'compute', 'end':
+                values = [d[key] for d in slots]
+                lines.append(f'{key:<30}{len(values):>8}{sum(values) / 1e6:>12.3f}'
+                             f'{mean(values) / 1e6:>12.3f}{max(values) / 1e6:>12.3f}')
+        return '\n'.join(lines)
@@ -1,20 +1,233 @@
 #!/usr/bin/python3
-from threading import Lock as LockingPrimitive, local as env
+from collections import namedtuple
+from threading import Condition, Lock as LockingPrimitive, local as env
+from time import perf_counter_ns
+from typing import Union
+
+lock_stats = namedtuple('lock_stats', ('acquisitions', 'contended', 'wait_ns', 'max_wait_ns', 'hold_ns'))
+
+
+class ContentionLock:
+    """
+    A lock that counts how contended it is:  acquisitions, how many of them had to wait, the time spent waiting and
+    the time the lock was held (nanoseconds).  The counters are updated while the lock is held, so they need no lock
+    of their own, and an uncontended acquisition costs a single non-blocking attempt.
+    It is its own context manager ("with lock:"), so nothing is allocated per use.
+    """
+    __slots__ = ('_lock', '_acquisitions', '_contended', '_wait_ns', '_max_wait_ns', '_hold_ns', '_held_since')
+    _lock: LockingPrimitive
+    _acquisitions: int
+    _contended: int
+    _wait_ns: int
+    _max_wait_ns: int
+    _hold_ns: int
+    _held_since: int
+
+    def __init__(self):
+        self._lock = LockingPrimitive()
+        self.reset()
+
+    def reset(self):
+        """
+        Zero the counters.
+        :return:
+        """
+        self._acquisitions = self._contended = self._wait_ns = self._max_wait_ns = self._hold_ns = 0
+        self._held_since = 0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        """
+        Acquire the lock, as threading.Lock.acquire() does.
+        :param blocking: wait for the lock
+        :param timeout: seconds to wait at most, -1 for no limit
+        :return: bool acquired
+        """
+        lock = self._lock
+        if not lock.acquire(False):
+            if not blocking:
+                return False
+            began = perf_counter_ns()
+            if not lock.acquire(True, timeout):
+                return False
+            waited = perf_counter_ns() - began
+            self._contended += 1
+            self._wait_ns += waited
+            if waited > self._max_wait_ns:
+                self._max_wait_ns = waited
+        self._acquisitions += 1
+        self._held_since = perf_counter_ns()
+        return True
+
+    def release(self):
+        """
+        Release the lock.
+        :return:
+        """
+        self._hold_ns += perf_counter_ns() - self._held_since
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *_):
+        self.release()
+
+    def stats(self) -> lock_stats:
+        """
+        Return the counters.
+        :return: lock_stats
+        """
+        return lock_stats(self._acquisitions, self._contended, self._wait_ns, self._max_wait_ns, self._hold_ns)
+
+
+class _ReadSide:
+    """ The read side of an RWLock as a context manager. """
+    __slots__ = ('acquire', 'release')
+
+    def __init__(self, owner: 'RWLock'):
+        self.acquire = owner.acquire_read
+        self.release = owner.release_read
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class _WriteSide:
+    """ The write side of an RWLock as a context manager. """
+    __slots__ = ('acquire', 'release')
+
+    def __init__(self, owner: 'RWLock'):
+        self.acquire = owner.acquire_write
+        self.release = owner.release_write
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class RWLock:
+    """
+    A readers-writer lock:  any number of readers at once, or a single writer.
+    Writers are preferred:  once a writer waits, new readers wait for it, so writers can not starve.
+    It is not reentrant.  Use "with rw.reading:" and "with rw.writing:"; both are made once, with the lock.
+    """
+    __slots__ = ('_condition', '_readers', '_writer', '_writers_waiting', 'reading', 'writing')
+    _condition: Condition
+    _readers: int
+    _writer: bool
+    _writers_waiting: int
+    reading: _ReadSide
+    writing: _WriteSide
+
+    def __init__(self):
+        self._condition = Condition(LockingPrimitive())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self.reading = _ReadSide(self)
+        self.writing = _WriteSide(self)
+
+    def acquire_read(self, timeout: float = None) -> bool:
+        """
+        Wait until no writer holds or awaits the lock, then hold it for reading.
+        :param timeout: seconds or None to wait indefinitely
+        :return: bool acquired
+        """
+        with self._condition:
+            if self._writer or self._writers_waiting:
+                if not self._condition.wait_for(lambda: not (self._writer or self._writers_waiting), timeout):
+                    return False
+            self._readers += 1
+            return True
+
+    def release_read(self):
+        """
+        Stop holding the lock for reading.
+        :return:
+        """
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self, timeout: float = None) -> bool:
+        """
+        Wait until nobody holds the lock, then hold it for writing.
+        :param timeout: seconds or None to wait indefinitely
+        :return: bool acquired
+        """
+        with self._condition:
+            if self._writer or self._readers:
+                self._writers_waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: not (self._writer or self._readers), timeout):
+                        self._condition.notify_all()  # readers held back by this writer may go on
+                        return False
+                finally:
+                    self._writers_waiting -= 1
+            self._writer = True
+            return True
+
+    def release_write(self):
+        """
+        Stop holding the lock for writing.
+        :return:
+        """
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    def get_readers(self) -> int:
+        """
+        Return how many readers hold the lock now.
+        :return: whole number
+        """
+        return self._readers
+
+    def is_writing(self) -> bool:
+        """
+        Indicate whether a writer holds the lock now.
+        :return: bool
+        """
+        return self._writer
+
+
+def make_lock(counted: bool = False) -> Union[LockingPrimitive, ContentionLock]:
+    """
+    Make a lock for "with lock:" blocks:  a bare threading.Lock (no wrapper at all), or a ContentionLock if counted.
+    :param counted: count contention
+    :return: a lock
+    """
+    return ContentionLock() if counted else LockingPrimitive()
 
 
 class Locker:
+    """
+    A lock wrapper kept for compatibility; prefer make_lock(), ContentionLock or RWLock.
+    It only releases on deletion what it acquired itself and did not release.
+    """
     _lock1: LockingPrimitive
+    _held: bool
 
     def __init__(self, new_primitive: LockingPrimitive = None, auto_lock: bool = False):
         if new_primitive is None:
             self._lock1 = LockingPrimitive()
         else:
             self._lock1 = new_primitive
+        self._held = False
         if auto_lock:
             self.on()
 
     def __del__(self):
-        self.off()
+        if self._held:
+            self.off()
 
     def __enter__(self):
         self.on()
@@ -40,10 +253,14 @@ class Locker:
             else:
                 raise
 
-    def acquire(self, blocking: bool = True, timeout: float = 0):
-        return self._lock1.acquire(blocking, timeout)
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        got = self._lock1.acquire(blocking, timeout)
+        if got:
+            self._held = True  # a failed attempt leaves what this Locker already holds alone
+        return got
 
     def release(self):
+        self._held = False
         return self._lock1.release()
 
     def locked(self) -> bool:
@@ -51,53 +268,34 @@ class Locker:
 
 
 class Mutex(Locker):
+    """
+    A Locker sharing the lock of another Locker, kept for compatibility.
+    Every use creates an object:  on hot paths, hold a lock from make_lock() and use "with lock:" instead.
+    """
     _lock2: Locker
 
     def __init__(self, lock: Locker, auto_lock: bool = False):
-        Locker.__init__(self, lock._lock1, auto_lock = auto_lock)
+        Locker.__init__(self, lock._lock1)
         self._lock2 = lock
         if auto_lock:
             self.on()
 
-    def __del__(self):
-        self.off()
-
-    def __enter__(self):
-        self.on()
-
-    def __exit__(self, *_):
-        self.off()
-
-    def on(self, blocking: bool = True, timeout: float = -1, trial: bool = True):
-        return self._lock2.on(blocking, timeout, trial)
-
-    def off(self, trial: bool = True):
-        return self._lock2.off(trial)
-
-    def acquire(self, blocking: bool = True, timeout: float = 0):
-        return self._lock2.acquire(blocking, timeout)
-
-    def release(self):
-        return self._lock2.release()
-
-    def locked(self) -> bool:
-        return self._lock2.locked()
-
 
 class Fregu:
+    """
+    Hand out unique, increasing integers from 1 under one lock.  Under many threads, prefer LeasedIDs.
+    """
     _id_current: int
-    _lock: Locker
+    _lock: LockingPrimitive
 
     def __init__(self):
         self._id_current = 0
-        self._lock = Locker()
+        self._lock = LockingPrimitive()
 
     def free_event_guard_unique(self) -> int:
-        with Mutex(self._lock):
+        with self._lock:
             self._id_current += 1
-            e: env = env()
-            e.x = self._id_current
-            return e.x
+            return self._id_current
 
     def run(self) -> int:  # alias
         return self.free_event_guard_unique()
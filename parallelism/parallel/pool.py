@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+from queue import SimpleQueue
+from threading import Thread, Lock
+from typing import Any, Callable, List, Tuple, Union
+
+WORK_ITEM = Tuple[Callable[[int, int], Any], int, int]  # target, batch number, slot number
+
+
+class WorkerPool:
+    """
+    Keep a fixed set of long-lived worker threads fed with (batch, slot) work items.
+    Parallelism() uses one instead of creating and discarding a thread per slot per batch.
+    A work item that raises does not take its worker down:  the error is kept (see get_errors()) and the worker
+    draws the next item.
+    """
+    _workers: List[Thread]
+    _queue: SimpleQueue
+    _lock: Lock
+    _running: bool
+    _name: str
+    _spawned: int  # workers ever started, numbering their names
+    _errors: List[Tuple[int, int, Exception]]  # batch number, slot number, what the target raised
+
+    def __init__(self, size: int = 0, name: str = 'parallel-worker'):
+        """
+        Create a pool and start size workers.
+        More workers are added later by ensure_workers() when a batch needs them.
+        :param size: whole number of workers to start now
+        :param name: prefix of the worker thread names
+        """
+        self._workers = []
+        self._queue = SimpleQueue()
+        self._lock = Lock()
+        self._running = True
+        self._name = name
+        self._spawned = 0
+        self._errors = []
+        self.ensure_workers(size)
+
+    def __enter__(self) -> 'WorkerPool':
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+
+    def _work(self):
+        """ Draw work items until the shutdown sentinel arrives. """
+        get = self._queue.get
+        while True:
+            item: Union[WORK_ITEM, None] = get()
+            if item is None:
+                return
+            target, batch, slot = item
+            try:
+                target(batch, slot)
+            except Exception as error:
+                self._errors.append((batch, slot, error))
+
+    def ensure_workers(self, size: int) -> int:
+        """
+        Grow the pool to at least size live workers, replacing any that died.
+        Every slot of a batch waits for the same go signal, so a pool must hold at least as many workers as slots.
+        :param size: whole number
+        :return: number of workers now in the pool
+        """
+        with self._lock:
+            if not self._running:
+                return 0
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < size:
+                worker = Thread(target = self._work, name = f'{self._name}-{self._spawned}', daemon = True)
+                self._spawned += 1
+                self._workers.append(worker)
+                worker.start()
+            return len(self._workers)
+
+    def get_size(self) -> int:
+        """
+        Return the number of workers in the pool.
+        :return: whole number
+        """
+        return len(self._workers)
+
+    def get_errors(self) -> List[Tuple[int, int, Exception]]:
+        """
+        Return what work items raised, as (batch, slot, exception), oldest first.
+        :return: list
+        """
+        return list(self._errors)
+
+    def is_running(self) -> bool:
+        """
+        Indicate whether the pool still accepts work.
+        :return: bool running
+        """
+        return self._running
+
+    def submit(self, target: Callable[[int, int], Any], batch: int, slot: int) -> bool:
+        """
+        Queue target(batch, slot) for the next free worker.
+        :param target: Callable accepting two integers
+        :param batch: positive int
+        :param slot: positive int
+        :return: successfully queued or not
+        """
+        if self._running:
+            self._queue.put((target, batch, slot))
+            return True
+        return False
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop every worker once the queued work items are drained.
+        :param wait: join the workers before returning
+        :return:
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            for _ in self._workers:
+                self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        return
@@ -0,0 +1,420 @@
+#!/usr/bin/python3
+from collections import namedtuple
+from collections.abc import Mapping
+from multiprocessing.shared_memory import SharedMemory
+from os import fsync, truncate
+from os.path import exists
+from pickle import dump, load, HIGHEST_PROTOCOL, UnpicklingError
+from queue import Queue
+from threading import Thread
+from time import monotonic
+from types import GeneratorType
+from typing import Any, BinaryIO, Callable, Dict, Generator, Iterator, List, Tuple, Union
+
+_EMPTY: object = object()  # marks a cell whose slot has not (yet) given a result
+
+
+class SlotResults(Mapping):
+    """
+    Hold the results of one batch in a preallocated cell per slot.
+    Each slot only ever writes its own cell, so writers need no shared lock.
+    It reads like Dict[int, Any]:  slots without a result are absent.
+    """
+    __slots__ = ('_cells',)
+    _cells: List[Any]
+
+    def __init__(self, slots: int):
+        """
+        Preallocate a cell for each of slots slots.
+        :param slots: whole number
+        """
+        self._cells = [_EMPTY] * slots
+
+    def put(self, slot: int, value: Any):
+        """
+        Store the result of a slot.  Only that slot should call this.
+        :param slot: positive int
+        :param value: result
+        :return:
+        """
+        self._cells[slot] = value
+
+    def __getitem__(self, slot: int) -> Any:
+        try:
+            value = self._cells[slot]
+        except IndexError:
+            raise KeyError(slot) from None
+        if value is _EMPTY:
+            raise KeyError(slot)
+        return value
+
+    def __contains__(self, slot: Any) -> bool:
+        try:
+            return self._cells[slot] is not _EMPTY
+        except (IndexError, TypeError):
+            return False
+
+    def __iter__(self) -> Iterator[int]:
+        return (slot for slot, value in enumerate(self._cells[:]) if value is not _EMPTY)
+
+    def __len__(self) -> int:
+        return len(self._cells) - self._cells.count(_EMPTY)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.snapshot()!r})'
+
+    def capacity(self) -> int:
+        """
+        Return the number of cells (slots) preallocated.
+        :return: whole number
+        """
+        return len(self._cells)
+
+    def snapshot(self) -> Dict[int, Any]:
+        """
+        Copy the results present right now.
+        The cells are copied in one step, so the copy is consistent even while slots keep writing.
+        :return: dict slot -> result
+        """
+        return {slot: value for slot, value in enumerate(self._cells[:]) if value is not _EMPTY}
+
+
+class ResultSpill:
+    """
+    Append the results of finished batches to a file for later aggregation (see load_spilled()).
+    Each batch is one pickled (batch, results) record, so nothing already written is serialized again.
+    """
+    _path: str
+    _file: Union[BinaryIO, None]
+
+    def __init__(self, path: str, append: bool = False):
+        """
+        Open path for writing records.
+        :param path: file name
+        :param append: keep the records already in path
+        """
+        self._path = path
+        self._file = open(path, 'ab' if append else 'wb')
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def put(self, batch: int, results: Dict[int, Any]):
+        """
+        Write the results of a batch.
+        :param batch: positive int
+        :param results: dict slot -> result
+        :return:
+        """
+        dump((batch, results), self._file, HIGHEST_PROTOCOL)
+
+    def flush(self):
+        """ Push the records written so far to the file. """
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        """ Close the file.  Calling this more than once is harmless. """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_spilled(path: str) -> Iterator[Tuple[int, Dict[int, Any]]]:
+    """
+    Yield the (batch, results) records written by a ResultSpill, in the order they were written.
+    A record cut short (e.g. by a crash while writing) ends the iteration.
+    :param path: file name
+    :return: generator of (batch, dict slot -> result)
+    """
+    with open(path, 'rb') as file:
+        while True:
+            try:
+                yield load(file)
+            except (EOFError, UnpicklingError):
+                return
+
+
+class Checkpoint(ResultSpill):
+    """
+    Keep the results of finished batches on disk so an interrupted run can resume where it stopped.
+    Every finished batch (even one without results) is appended as one ResultSpill record and flushed, so the cost
+    of a checkpoint does not grow with the results already written.  The file is synced to disk at most every
+    sync_interval seconds.
+    Opening an existing checkpoint reads its records back and cuts off a record left incomplete by a crash.
+    """
+    _completed: Dict[int, Dict[int, Any]]  # batches found in the file when opened
+    _sync_interval: float
+    _last_sync: float
+
+    def __init__(self, path: str, sync_interval: float = 1.):
+        """
+        Open or create the checkpoint at path.
+        :param path: file name
+        :param sync_interval: seconds between syncs to disk; 0 syncs every batch
+        """
+        completed: Dict[int, Dict[int, Any]] = {}
+        if exists(path):
+            intact: int = 0
+            with open(path, 'rb') as file:
+                while True:
+                    try:
+                        batch, results = load(file)
+                    except (EOFError, UnpicklingError):
+                        break
+                    completed[batch] = results
+                    intact = file.tell()
+            truncate(path, intact)
+        ResultSpill.__init__(self, path, True)
+        self._completed = completed
+        self._sync_interval = sync_interval
+        self._last_sync = monotonic()
+
+    def is_completed(self, batch: int) -> bool:
+        """
+        Indicate whether batch had finished when this checkpoint was opened.
+        :param batch: positive int
+        :return: bool finished
+        """
+        return batch in self._completed
+
+    def get_completed(self) -> Dict[int, Dict[int, Any]]:
+        """
+        Return the results of the batches that had finished when this checkpoint was opened.
+        :return: dict batch -> dict slot -> result (empty for batches without results)
+        """
+        return self._completed
+
+    def put(self, batch: int, results: Dict[int, Any]):
+        ResultSpill.put(self, batch, results)
+        self._file.flush()
+        if monotonic() - self._last_sync >= self._sync_interval:
+            fsync(self._file.fileno())
+            self._last_sync = monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            fsync(self._file.fileno())
+        ResultSpill.close(self)
+
+
+class _Segment(SharedMemory):
+    """
+    Shared memory whose close() does not fail while memoryviews of it are in use:  the mapping then lives on
+    until the last of them is gone.
+    """
+
+    def close(self):
+        try:
+            SharedMemory.close(self)
+        except BufferError:
+            self._mmap = None  # the views hold the mapping now
+            SharedMemory.close(self)
+
+
+shared_ref = namedtuple('shared_ref', ('format', 'shape', 'nbytes'))  # a result written to shared memory
+_CASTABLE: frozenset = frozenset('bBhHiIlLqQnNfd?c')  # formats memoryview.cast() can read back
+_attached: Dict[str, SharedMemory] = {}  # the segment a process last wrote to
+
+
+def write_shared(fxn: Callable[[int, int], Any], name: str, offset: int, size: int, batch: int, slot: int) -> Any:
+    """
+    Call fxn(batch, slot) and, if the result is a contiguous buffer (array.array, bytes, a numpy array...) of at
+    most size bytes, copy it to shared memory at offset instead of returning it.
+    It runs in the worker process, for SharedResultChannel; any other result is returned as is.
+    :param fxn: Callable accepting two integers
+    :param name: name of the shared memory
+    :param offset: where the region of the slot begins
+    :param size: bytes in the region
+    :param batch: positive int
+    :param slot: positive int
+    :return: shared_ref or the result
+    """
+    result = fxn(batch, slot)
+    try:
+        view = memoryview(result)
+    except TypeError:
+        return result
+    if not view.c_contiguous or view.nbytes > size or view.format not in _CASTABLE or not view.ndim:
+        return result
+    segment = _attached.get(name)
+    if segment is None:  # a new batch:  the previous one has been read already
+        for previous in _attached.values():
+            previous.close()
+        _attached.clear()
+        segment = _attached[name] = SharedMemory(name)
+    segment.buf[offset:offset + view.nbytes] = view.cast('B')
+    return shared_ref(view.format, view.shape, view.nbytes)
+
+
+class SharedResultChannel:
+    """
+    Preallocate shared memory for the results of the slots of one batch at a time, slot_bytes per slot.
+    Worker processes write buffer-like results into the region of their slot (see write_shared()) and the
+    coordinator reads them back without pickling.
+    By default, one segment serves every batch (it only grows) and a result is read as a bytes copy of its region,
+    so it can be kept, pickled, spilled or checkpointed.  With views, a result is read as a zero-copy memoryview;
+    each batch then gets a segment of its own, unlinked when the next batch opens but mapped while viewed.
+    Views can not be pickled:  do not combine them with a checkpoint, a spill or distributed workers.
+    """
+    _slot_bytes: int
+    _views: bool
+    _segment: Union[_Segment, None]
+
+    def __init__(self, slot_bytes: int = 1 << 20, views: bool = False):
+        """
+        :param slot_bytes: natural number of bytes reserved per slot; larger results are pickled as usual
+        :param views: read results as memoryviews of the shared memory instead of bytes
+        """
+        self._slot_bytes = slot_bytes
+        self._views = views
+        self._segment = None
+
+    def get_slot_bytes(self) -> int:
+        return self._slot_bytes
+
+    def has_views(self) -> bool:
+        return self._views
+
+    def open_batch(self, slots: int):
+        """
+        Make room for the regions of the next batch:  the current segment is kept if it is large enough and no
+        views of it were handed out.
+        :param slots: natural number
+        :return:
+        """
+        size = slots * self._slot_bytes
+        if not self._views and self._segment is not None and self._segment.size >= size:
+            return
+        self.close_batch()
+        self._segment = _Segment(create = True, size = size)
+
+    def region(self, slot: int) -> Tuple[str, int, int]:
+        """
+        Locate the region of a slot in the current batch.
+        :param slot: positive int
+        :return: name of the shared memory, offset and size
+        """
+        return self._segment.name, slot * self._slot_bytes, self._slot_bytes
+
+    def read(self, slot: int, reference: shared_ref) -> Union[bytes, memoryview]:
+        """
+        Read a result written to the region of a slot.
+        :param slot: positive int
+        :param reference: what write_shared() returned
+        :return: the bytes of the result or, with views, a memoryview shaped and typed as the result was
+        """
+        offset = slot * self._slot_bytes
+        if not self._views:
+            return self._segment.buf[offset:offset + reference.nbytes].tobytes()
+        return self._segment.buf[offset:offset + reference.nbytes].cast(reference.format, reference.shape)
+
+    def close_batch(self):
+        """
+        Release the shared memory.  Views already read stay valid.
+        :return:
+        """
+        if self._segment is not None:
+            self._segment.close()
+            self._segment.unlink()
+            self._segment = None
+
+
+RESULT_CONSUMER = Union[Callable[[int, Dict[int, Any]], Any], Generator[Any, Tuple[int, Dict[int, Any]], Any]]
+
+
+class ResultStream:
+    """
+    Hand the results of every finished batch to a consumer instead of keeping them for the whole run.
+    Batches wait in a bounded queue:  when max_pending batches are pending, the producer blocks until the consumer
+    catches up, so a slow consumer can not make memory run away.
+    The consumer is either a callable (batch, results) or a generator that is sent (batch, results) tuples;
+    it runs on its own thread.  Without a consumer, iterate over the stream from another thread instead.
+    Should the consumer raise, the rest of the batches are drained unconsumed and close() raises the error.
+    """
+    _queue: Queue
+    _consumer: Union[Callable[[int, Dict[int, Any]], Any], None]
+    _thread: Union[Thread, None]
+    _spill: Union[ResultSpill, None]
+    _closed: bool
+    _error: Union[BaseException, None]
+
+    def __init__(self, consumer: RESULT_CONSUMER = None, max_pending: int = 8, spill: ResultSpill = None):
+        """
+        :param consumer: callable, generator or None
+        :param max_pending: natural number of batches allowed to wait for the consumer
+        :param spill: a ResultSpill every batch is also written to, or None
+        """
+        self._queue = Queue(max_pending)
+        self._spill = spill
+        self._closed = False
+        self._error = None
+        if isinstance(consumer, GeneratorType):
+            next(consumer)  # pre-initialization
+            send = consumer.send
+            consumer = lambda batch, results: send((batch, results))
+        self._consumer = consumer
+        self._thread = None
+        if consumer is not None:
+            self._thread = Thread(target = self._consume, name = 'parallel-result-consumer', daemon = True)
+            self._thread.start()
+
+    def _consume(self):
+        """
+        Feed the consumer until the stream closes.  Once a generator consumer finishes or the consumer raises,
+        the rest is dropped, so put() never blocks on a consumer that is gone.
+        """
+        for batch, results in self:
+            try:
+                self._consumer(batch, results)
+            except StopIteration:
+                self._consumer = lambda *_: None
+            except BaseException as error:
+                self._error = error
+                self._consumer = lambda *_: None
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[int, Any]]]:
+        get = self._queue.get
+        while True:
+            record = get()
+            if record is None:
+                return
+            yield record
+
+    def put(self, batch: int, results: Dict[int, Any]):
+        """
+        Hand over the results of a batch, blocking while max_pending batches are pending.
+        :param batch: positive int
+        :param results: dict slot -> result
+        :return:
+        """
+        if self._spill is not None:
+            self._spill.put(batch, results)
+        self._queue.put((batch, results))
+
+    def pending(self) -> int:
+        """
+        Return the number of batches waiting for the consumer.
+        :return: whole number
+        """
+        return self._queue.qsize()
+
+    def close(self, wait: bool = True):
+        """
+        End the stream once the pending batches are consumed.  Calling this more than once is harmless.
+        :param wait: wait for the consumer thread to finish
+        :return:
+        :raises BaseException: what the consumer raised, once
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            if self._spill is not None:
+                self._spill.close()
+        if wait and self._thread is not None:
+            self._thread.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
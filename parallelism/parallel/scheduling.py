@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+from collections import deque
+from os import cpu_count
+from queue import SimpleQueue
+from threading import Lock, Thread
+from typing import Any, Callable, Deque, Dict, List, Tuple, Union
+
+from parallel.core import BatchExecutionOrder, Runner, RPP
+from parallel.results import SlotResults
+
+UNIT = Tuple[int, int]  # batch number, slot number
+
+
+class WorkStealingScheduler:
+    """
+    Run (batch, slot) units on a fixed set of workers as soon as any worker frees up, instead of batch by batch.
+    The units are dealt round-robin onto one deque per worker in the order of a BatchExecutionOrder, which thereby
+    serves as a priority hint:  a worker takes the front (earliest) unit of its own deque and, once that is empty,
+    steals the front unit of the longest other deque.  Batches may therefore overlap and finish out of order.
+    When every slot of a batch has run, Runner.end is called for each of them and the batch is announced as done.
+    A slot whose function raises has no result and its batch goes on (see get_failures()).
+    """
+    _runner: Runner
+    _batches: int
+    _slots: int
+    _deques: List[Deque[UNIT]]
+    _workers: List[Thread]
+    _pending: Dict[int, int]  # batch -> slots not yet run
+    _current: Dict[int, SlotResults]
+    _results: Dict[int, Dict[int, Any]]  # results[batch][slot] = <result of call>
+    _finished: SimpleQueue  # batch numbers as they finish, then None
+    _lock: Lock
+    _remaining: int  # batches not yet finished
+    _steals: List[int]  # per worker, so no lock is needed to count
+    _failures: List[Tuple[int, int, Exception]]  # batch, slot, what its function raised
+    _last_finished: Union[int, None]
+
+    def __init__(self, runner: Runner, batches: int, slots: int,
+                 order: BatchExecutionOrder = None, workers: int = None):
+        """
+        Deal every unit onto the deques of workers workers.
+        :param runner: a Runner instance
+        :param batches: natural number
+        :param slots: natural number
+        :param order: a BatchExecutionOrder instance or None for batches in increasing order
+        :param workers: natural number or None for one per CPU
+        """
+        self._runner = runner
+        self._batches = batches
+        self._slots = slots
+        if order is None:
+            order = BatchExecutionOrder(range(batches), batches)
+        workers = workers or cpu_count() or 1
+        self._deques = [deque() for _ in range(workers)]
+        self._pending = {}
+        self._current = {}
+        self._results = {}
+        self._finished = SimpleQueue()
+        self._lock = Lock()
+        self._steals = [0] * workers
+        self._failures = []
+        self._last_finished = None
+        dealt = 0
+        while not order.is_quota_meet():
+            batch = order.full_next()
+            self._pending[batch] = slots
+            self._current[batch] = SlotResults(slots)
+            for slot in range(slots):
+                self._deques[dealt % workers].append((batch, slot))
+                dealt += 1
+        self._remaining = len(self._pending)
+        self._workers = [Thread(target = self._work, args = (i,), name = f'parallel-stealer-{i}', daemon = True)
+                         for i in range(workers)]
+
+    def start(self):
+        """
+        Start the workers.
+        :return:
+        """
+        if not self._remaining:
+            self._finished.put(None)
+        for worker in self._workers:
+            worker.start()
+
+    def _take(self, index: int) -> Union[UNIT, None]:
+        """ Take the next unit of a worker, stealing if its deque is empty.  None means no work is left. """
+        try:
+            return self._deques[index].popleft()
+        except IndexError:
+            pass
+        while True:
+            victim = max(self._deques, key = len)
+            if not victim:
+                return None
+            try:
+                unit = victim.popleft()
+            except IndexError:  # another worker emptied it first
+                continue
+            self._steals[index] += 1
+            return unit
+
+    def _work(self, index: int):
+        """ Run units until none is left anywhere. """
+        run = self._runner.run
+        while True:
+            unit = self._take(index)
+            if unit is None:
+                return
+            batch, slot = unit
+            try:
+                result = run(batch, slot)
+            except Exception as error:  # the slot still counts as run, or its batch would never finish
+                result = None
+                with self._lock:
+                    self._failures.append((batch, slot, error))
+            if result is not None:
+                self._current[batch].put(slot, result)
+            with self._lock:
+                self._pending[batch] -= 1
+                last = self._pending[batch] == 0
+            if last:
+                self._finish(batch)
+
+    def _finish(self, batch: int):
+        """ End every slot of a finished batch, keep its results and announce it. """
+        end = self._runner.end
+        for slot in range(self._slots):
+            try:
+                end(batch, slot)
+            except Exception as error:
+                with self._lock:
+                    self._failures.append((batch, slot, error))
+        results = self._current.pop(batch).snapshot()
+        if results:
+            self._results[batch] = results
+        with self._lock:
+            del self._pending[batch]
+            self._remaining -= 1
+            done = self._remaining == 0
+        self._finished.put(batch)
+        if done:
+            self._finished.put(None)
+
+    def next_finished(self) -> Union[int, None]:
+        """
+        Block until another batch finishes and return its number, or None once all have.
+        :return: batch number or None
+        """
+        self._last_finished = batch = self._finished.get()
+        return batch
+
+    def get_last_finished(self) -> Union[int, None]:
+        """
+        Return the batch last returned by next_finished().
+        :return: batch number or None
+        """
+        return self._last_finished
+
+    def join(self):
+        """
+        Wait for the workers to run out of work.
+        :return:
+        """
+        for worker in self._workers:
+            worker.join()
+
+    def get_results(self) -> Dict[int, Dict[int, Any]]:
+        """
+        Return the results of the finished batches:  results[batch][slot].
+        :return: dict
+        """
+        return self._results
+
+    def get_steals(self) -> int:
+        """
+        Return how many units were stolen from another worker's deque.
+        :return: whole number
+        """
+        return sum(self._steals)
+
+    def get_failures(self) -> List[Tuple[int, int, Exception]]:
+        """
+        Return what the function (or its end function) raised, as (batch, slot, exception).
+        :return: list
+        """
+        with self._lock:
+            return list(self._failures)
+
+    def get_workers(self) -> int:
+        """
+        Return the number of workers.
+        :return: natural number
+        """
+        return len(self._workers)
+
+
+def run_work_stealing(
+        fxn: Callable[[int, int], Any], fxn_end: Callable[[int, int], Any],
+        batches: int = 1, slots: int = 1,
+        batch_order: BatchExecutionOrder = None,
+        workers: int = None
+) -> [Tuple[WorkStealingScheduler, RPP, int]]:
+    """
+    The work-stealing counterpart of run_parallel():  units start whenever a worker frees up.
+    RPP.BATCH_RESULT is yielded as each batch with results finishes (in finishing order, not batch_order);
+    the batch is WorkStealingScheduler.get_last_finished() and its results are get_results()[batch].
+    """
+    if batches <= 0 or slots <= 0:
+        yield None, RPP.BATCH_SLOT_ERROR, 0
+        return None, RPP.CONCLUSION, 0
+    obj = WorkStealingScheduler(Runner(fxn, fxn_end), batches, slots, batch_order, workers)
+    obj.start()
+    total: int = 0
+    while (batch := obj.next_finished()) is not None:
+        a = len(obj.get_results().get(batch, ()))
+        if a > 0:
+            yield obj, RPP.BATCH_RESULT, a
+            total += a
+    obj.join()
+    return obj, RPP.CONCLUSION, total
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+from collections import namedtuple
+from typing import List
+
+tuning_record = namedtuple('tuning_record', ('slots', 'throughput'))  # throughput in slots per second
+
+
+class SlotAutotuner:
+    """
+    Hill-climb the number of slots per batch toward the highest throughput (slots completed per second).
+    Every setting is measured over samples batches.  The climb starts by doubling; whenever a step does not improve
+    on the best setting by more than tolerance, the next step goes the other way from the best setting and is
+    smaller (the square root of the factor), until it no longer changes the setting.
+    The tolerance only steers the climb:  the tuner then stays on the setting measured fastest (see get_best()),
+    even if it beat the one the climb turned around at by less than tolerance.
+    """
+    _minimum: int
+    _maximum: int
+    _samples: int
+    _tolerance: float
+    _current: int
+    _best: int  # the setting the climb steps from
+    _best_throughput: float
+    _factor: float
+    _direction: int  # 1 toward more slots, -1 toward fewer
+    _pending: List[float]  # throughputs measured on the current setting
+    _history: List[tuning_record]
+    _settled: bool
+
+    def __init__(self, start: int, maximum: int, minimum: int = 1, samples: int = 2, tolerance: float = .05):
+        """
+        :param start: natural number of slots to begin with
+        :param maximum: natural number, the most slots ever tried
+        :param minimum: natural number, the fewest slots ever tried
+        :param samples: natural number of batches measured per setting
+        :param tolerance: relative improvement needed to keep climbing
+        """
+        self._minimum = max(1, minimum)
+        self._maximum = max(self._minimum, maximum)
+        self._samples = max(1, samples)
+        self._tolerance = tolerance
+        self._current = self._best = min(max(start, self._minimum), self._maximum)
+        self._best_throughput = 0.
+        self._factor = 2.
+        self._direction = 1
+        self._pending = []
+        self._history = []
+        self._settled = False
+
+    def _clamp(self, slots: float) -> int:
+        return min(max(round(slots), self._minimum), self._maximum)
+
+    def _step(self) -> int:
+        """ The next setting from the best one, in the current direction. """
+        return self._clamp(self._best * self._factor ** self._direction)
+
+    def record(self, slots: int, seconds: float) -> int:
+        """
+        Account for a batch of slots slots that took seconds, and tell how many slots the next batch should have.
+        :param slots: natural number
+        :param seconds: positive number
+        :return: natural number of slots
+        """
+        if self._settled or slots != self._current or seconds <= 0:
+            return self._current
+        self._pending.append(slots / seconds)
+        if len(self._pending) < self._samples:
+            return self._current
+        throughput = sum(self._pending) / len(self._pending)
+        self._pending.clear()
+        self._history.append(tuning_record(slots, throughput))
+        if not self._best_throughput or throughput > self._best_throughput * (1 + self._tolerance):
+            self._best = slots
+            self._best_throughput = throughput
+        else:  # no better:  turn around with a smaller step
+            self._direction = -self._direction
+            self._factor **= .5
+        following = self._step()
+        if following == self._best:  # against a bound
+            self._direction = -self._direction
+            following = self._step()
+        if following == self._best or self._factor < 1.05:
+            self._settled = True
+            following = self.get_best()
+        self._current = following
+        return following
+
+    def get_best(self) -> int:
+        """
+        Return the setting with the highest throughput so far:  the one to pin in later runs.
+        :return: natural number of slots
+        """
+        if not self._history:
+            return self._best
+        return max(self._history, key = lambda record: record.throughput).slots
+
+    def get_current(self) -> int:
+        return self._current
+
+    def is_settled(self) -> bool:
+        """
+        Indicate whether the climb is over.
+        :return: bool
+        """
+        return self._settled
+
+    def get_history(self) -> List[tuning_record]:
+        """
+        Return the settings measured, in order, with their mean throughput.
+        :return: list of tuning_record
+        """
+        return list(self._history)
+
+    def report(self) -> str:
+        """
+        Tabulate the settings measured and name the best one.
+        :return: str table
+        """
+        best = self.get_best()
+        lines = [f'{"slots":>8}{"slots/s":>14}']
+        for record in self._history:
+            lines.append(f'{record.slots:>8}{record.throughput:>14.1f}' + ('  *' if record.slots == best else ''))
+        lines.append(f'best: {best} slots' + ('' if self._settled else ' (still tuning)'))
+        return '\n'.join(lines)